@@ -1,4 +1,3 @@
-import array
 import itertools
 import logging
 import operator
@@ -9,12 +8,12 @@ from datetime import datetime, timedelta
 
 from django.conf import settings
 from django.db import connections, transaction
-from django.db.models import Q, F, Avg
+from django.db.models import Q, F, Avg, Max
 
 import cronjobs
 import multidb
 import path
-from lib import recommend
+from lib.recommend import matrix, neighbors
 from celery.task.sets import TaskSet
 from celeryutils import task
 import waffle
@@ -22,7 +21,9 @@ import waffle
 import amo
 from amo.utils import chunked
 from addons import search
-from addons.models import Addon, AppSupport, FrozenAddon, Persona
+from addons.models import (Addon, AddonRecommendation,
+                           AddonRecommendationChange, AppSupport, FrozenAddon,
+                           Persona)
 from files.models import File
 from lib.es.utils import raise_if_reindex_in_progress
 from stats.models import ThemeUserCount, UpdateCount
@@ -361,8 +362,8 @@ def deliver_hotness():
         time.sleep(10)
 
 
-@cronjobs.register
-def recs():
+def _recs_addons():
+    """The {addon: [collection]} to calculate the recommendations with."""
     start = time.time()
     cursor = connections[multidb.get_slave()].cursor()
     cursor.execute("""
@@ -378,7 +379,14 @@ def recs():
     addons = _group_addons(qs)
     recs_log.info('%.2fs (groupby) : %s addons' %
                   ((time.time() - start), len(addons)))
+    return addons
+
 
+@cronjobs.register
+def recs():
+    # The changes made before we start are all taken into account.
+    last = AddonRecommendationChange.objects.aggregate(last=Max('id'))['last']
+    addons = _recs_addons()
     if not len(addons):
         return
 
@@ -390,55 +398,108 @@ def recs():
     except Exception:
         log.error('Could not call ps', exc_info=True)
 
-    sim = recommend.similarity  # Locals are faster.
-    sims, start, timers = {}, [time.time()], {'calc': [], 'sql': []}
-
-    def write_recs():
-        calc = time.time()
-        timers['calc'].append(calc - start[0])
+    timers = {'calc': 0, 'sql': 0}
+    calc = time.time()
+    for sims in matrix.similar(addons, top=10,
+                               processes=settings.RECS_PROCESSES):
+        sql = time.time()
+        timers['calc'] += sql - calc
         try:
             _dump_recs(sims)
         except Exception:
             recs_log.error('Error dumping recommendations. SQL issue.',
                            exc_info=True)
-        sims.clear()
-        timers['sql'].append(time.time() - calc)
-        start[0] = time.time()
-
-    for idx, (addon, collections) in enumerate(addons.iteritems(), 1):
-        xs = [(other, sim(collections, cs))
-              for other, cs in addons.iteritems()]
-        # Sort by similarity and keep the top N.
-        others = sorted(xs, key=operator.itemgetter(1), reverse=True)
-        sims[addon] = [(k, v) for k, v in others[:11] if k != addon]
-
-        if idx % 50 == 0:
-            write_recs()
-    else:
-        write_recs()
+        calc = time.time()
+        timers['sql'] += calc - sql
 
     avg_len = sum(len(v) for v in addons.itervalues()) / float(len(addons))
     recs_log.info('%s addons: average length: %.2f' % (len(addons), avg_len))
-    recs_log.info('Processing time: %.2fs' % sum(timers['calc']))
-    recs_log.info('SQL time: %.2fs' % sum(timers['sql']))
+    recs_log.info('Processing time: %.2fs' % timers['calc'])
+    recs_log.info('SQL time: %.2fs' % timers['sql'])
+    if last is not None:
+        AddonRecommendationChange.objects.filter(id__lte=last).delete()
+    _dump_recs_neighbors()
+
+
+@cronjobs.register
+def recs_changes():
+    """
+    Calculate the recommendations again for the add-ons that were added to
+    synced collections since the last run, and patch those of the add-ons
+    which are similar to them. The neighbors file is written again either
+    way, for what `update_addon_appsupport` changed.
+    """
+    last = AddonRecommendationChange.objects.aggregate(last=Max('id'))['last']
+    if last is None:
+        _dump_recs_neighbors()
+        return
+    changes = AddonRecommendationChange.objects.filter(id__lte=last)
+    changed = set(changes.values_list('addon_id', flat=True))
+    addons = _recs_addons()
+
+    current = {}
+    for addon, other, score in (AddonRecommendation.objects.using('default')
+                                .values_list('addon', 'other_addon', 'score')):
+        current.setdefault(addon, []).append((other, score))
+
+    start = time.time()
+    sims = matrix.update(addons, changed, current, top=10)
+    recs_log.info('%s changed addons: %s updated in %.2fs'
+                  % (len(changed), len(sims), time.time() - start))
+    for chunk in chunked(sims.items(), 100):
+        try:
+            _dump_recs(dict(chunk))
+        except Exception:
+            recs_log.error('Error dumping recommendations. SQL issue.',
+                           exc_info=True)
+            return
+    changes.delete()
+    _dump_recs_neighbors()
 
 
 def _dump_recs(sims):
-    # Dump a dictionary of {addon: (other_addon, score)} into the
-    # addon_recommendations table.
+    # Write a dictionary of {addon: [(other_addon, score)]} to the
+    # addon_recommendations table, updating the rows that are there and
+    # dropping the other add-ons that aren't recommended anymore.
     cursor = connections['default'].cursor()
     addons = sims.keys()
     vals = [(addon, other, score) for addon, others in sims.items()
                                   for other, score in others]
     cursor.execute('BEGIN')
-    cursor.execute('DELETE FROM addon_recommendations WHERE addon_id IN %s',
-                   [addons])
-    cursor.executemany("""
-        INSERT INTO addon_recommendations (addon_id, other_addon_id, score)
-        VALUES (%s, %s, %s)""", vals)
+    if vals:
+        cursor.executemany("""
+            INSERT INTO addon_recommendations (addon_id, other_addon_id, score)
+            VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE score=VALUES(score)""", vals)
+        cursor.execute("""
+            DELETE FROM addon_recommendations
+            WHERE addon_id IN %%s AND (addon_id, other_addon_id) NOT IN (%s)
+            """ % ','.join(['(%s,%s)'] * len(vals)),
+            [addons] + [x for addon, other, score in vals
+                        for x in (addon, other)])
+    else:
+        cursor.execute('DELETE FROM addon_recommendations '
+                       'WHERE addon_id IN %s', [addons])
     cursor.execute('COMMIT')
 
 
+def _dump_recs_neighbors():
+    # Write all of addon_recommendations, and the app versions the public
+    # add-ons support, for the discovery pane to load.
+    recs = {}
+    for addon, other, score in (AddonRecommendation.objects.using('default')
+                                .values_list('addon', 'other_addon', 'score')):
+        recs.setdefault(addon, []).append((other, score))
+    support = {}
+    for addon, app, min_, max_ in (
+            AppSupport.objects.filter(addon__in=Addon.objects.public())
+            .values_list('addon', 'app', 'min', 'max')):
+        support.setdefault(app, []).append((addon, min_, max_))
+    neighbors.write(settings.RECS_NEIGHBORS_PATH, recs, support)
+    recs_log.info('Wrote %s addons to %s.'
+                  % (len(recs), settings.RECS_NEIGHBORS_PATH))
+
+
 def _group_addons(qs):
     # qs is a list of (addon_id, collection_id) order by addon_id.
     # Return a dict of {addon_id: [collection_id]}.
@@ -448,8 +509,7 @@ def _group_addons(qs):
         # recommendations to exactly what's in those collections.
         cs = [c[1] for c in collections]
         if len(cs) > 3:
-            # array.array() lets us calculate similarities much faster.
-            addons[addon] = array.array('l', cs)
+            addons[addon] = cs
     # Don't generate recs for frozen add-ons.
     for addon in FrozenAddon.objects.values_list('addon', flat=True):
         if addon in addons:
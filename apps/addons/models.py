@@ -36,6 +36,7 @@ from amo.utils import (attach_trans_dict, cache_ns_key, chunked, find_language,
                        to_language, urlparams)
 from amo.urlresolvers import get_outgoing_url, reverse
 from files.models import File
+from lib.es.models import IndexChange
 from market.models import AddonPremium, Price
 from reviews.models import Review
 import sharing.utils as sharing
@@ -1620,6 +1621,7 @@ class AddonDeviceType(amo.models.ModelBase):
 @receiver(signals.version_changed, dispatch_uid='version_changed')
 def version_changed(sender, **kw):
     from . import tasks
+    cache_ns_key(amo.UPDATE_RDF_NAMESPACE, increment=True)
     tasks.version_changed.delay(sender.id)
 
 
@@ -1628,7 +1630,10 @@ def version_changed(sender, **kw):
 def update_search_index(sender, instance, **kw):
     from . import tasks
     if not kw.get('raw'):
-        tasks.index_addons.delay([instance.id])
+        if waffle.switch_is_active('index-changes'):
+            IndexChange.record(Addon._meta.db_table, [instance.id])
+        else:
+            tasks.index_addons.delay([instance.id])
 
 
 @Addon.on_change
@@ -1657,6 +1662,16 @@ def watch_status(old_attr={}, new_attr={}, instance=None,
             pass
 
 
+@Addon.on_change
+def watch_update_rdf(old_attr={}, new_attr={}, instance=None, sender=None,
+                     **kw):
+    """Flush the update service's rendered RDF when the add-on goes away."""
+    for field in ('status', 'disabled_by_user'):
+        if field in new_attr and old_attr.get(field) != new_attr[field]:
+            cache_ns_key(amo.UPDATE_RDF_NAMESPACE, increment=True)
+            return
+
+
 @Addon.on_change
 def watch_disabled(old_attr={}, new_attr={}, instance=None, sender=None, **kw):
     attrs = dict((k, v) for k, v in old_attr.items()
@@ -1958,6 +1973,23 @@ class AddonRecommendation(models.Model):
         return d
 
 
+class AddonRecommendationChange(models.Model):
+    """
+    An add-on that was added to or removed from a synced collection since its
+    recommendations were calculated, for the `recs_changes` cron to calculate
+    them again.
+    """
+    addon_id = models.PositiveIntegerField()
+    created = models.DateTimeField(default=datetime.now)
+
+    class Meta:
+        db_table = 'addon_recommendation_changes'
+
+    @classmethod
+    def record(cls, ids):
+        cls.objects.bulk_create([cls(addon_id=id_) for id_ in ids])
+
+
 class AddonType(amo.models.ModelBase):
     name = TranslatedField()
     name_plural = TranslatedField()
@@ -1,6 +1,7 @@
 import hashlib
 import logging
 import os
+from datetime import datetime
 
 from django.conf import settings
 from django.core.files.storage import default_storage as storage
@@ -191,7 +192,13 @@ def update_incompatible_appversions(data, **kw):
 
     for version_id in data:
         # This is here to handle both post_save and post_delete hooks.
-        IncompatibleVersions.objects.filter(version=version_id).delete()
+        incompatible = IncompatibleVersions.objects.filter(version=version_id)
+        if incompatible.exists():
+            incompatible.delete()
+            # The update service index only sees that they are gone from the
+            # modified date of their version.
+            Version.objects.filter(pk=version_id).update(
+                modified=datetime.now())
 
         try:
             version = Version.objects.get(pk=version_id)
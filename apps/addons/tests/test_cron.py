@@ -7,10 +7,13 @@ import mock
 import amo
 import amo.tests
 from addons import cron
-from addons.models import Addon, AppSupport
+from addons.models import (Addon, AddonRecommendation,
+                           AddonRecommendationChange, AppSupport)
+from django.conf import settings
 from django.core.management.base import CommandError
 from files.models import File, Platform
 from lib.es.management.commands.reindex import flag_database, unflag_database
+from lib.recommend import neighbors
 from stats.models import UpdateCount
 from versions.models import Version
 
@@ -247,6 +250,41 @@ class AvgDailyUserCountTestCase(amo.tests.TestCase):
         eq_(addon.average_daily_users, 1234)
 
 
+class TestRecsChanges(amo.tests.TestCase):
+    fixtures = ['base/addon-recs']
+
+    @mock.patch('addons.cron._recs_addons')
+    def test_recs_changes(self, recs_addons):
+        recs_addons.return_value = {1843: [1, 2, 3, 4], 2464: [1, 2, 3, 5],
+                                    5299: [6, 7, 8, 9]}
+        AddonRecommendationChange.record([2464])
+        cron.recs_changes()
+        self.addCleanup(os.remove, settings.RECS_NEIGHBORS_PATH)
+
+        eq_(AddonRecommendationChange.objects.count(), 0)
+        # The add-ons that aren't in synced collections anymore are dropped.
+        eq_(AddonRecommendation.objects.count(), 6)
+        scores = AddonRecommendation.scores([1843, 2464, 5299])
+        for addon, others in [(1843, {2464: 1 / 3., 5299: 1 / 9.}),
+                              (2464, {1843: 1 / 3., 5299: 1 / 9.}),
+                              (5299, {1843: 1 / 9., 2464: 1 / 9.})]:
+            eq_(sorted(scores[addon]), sorted(others))
+            for other, score in others.items():
+                self.assertAlmostEqual(scores[addon][other], score, places=5)
+
+        model = neighbors.Neighbors(settings.RECS_NEIGHBORS_PATH)
+        eq_(list(model.addons), [1843, 2464, 5299])
+
+    @mock.patch('addons.cron._recs_addons')
+    def test_no_changes(self, recs_addons):
+        cron.recs_changes()
+        self.addCleanup(os.remove, settings.RECS_NEIGHBORS_PATH)
+        assert not recs_addons.called
+        eq_(AddonRecommendation.objects.count(), 25)
+        # The compatibility of the add-ons may have changed still.
+        assert os.path.exists(settings.RECS_NEIGHBORS_PATH)
+
+
 class TestReindex(amo.tests.ESTestCase):
 
     @mock.patch('addons.models.update_search_index', new=mock.Mock)
@@ -23,6 +23,7 @@ class TestWSGIApplication(amo.tests.TestCase):
 
     @mock.patch('services.theme_update.ThemeUpdate')
     def test_wsgi_application_200(self, ThemeUpdate_mock):
+        ThemeUpdate_mock.return_value.is_not_modified.return_value = False
         urls = {
             '/themes/update-check/5': ['en-US', 5, None],
             '/en-US/themes/update-check/5': ['en-US', 5, None],
@@ -45,6 +46,17 @@ class TestWSGIApplication(amo.tests.TestCase):
             ThemeUpdate_mock.assert_called_with(*call_args)
             self.start_response.assert_called_with('200 OK', mock.ANY)
 
+    @mock.patch('services.theme_update.ThemeUpdate')
+    def test_wsgi_application_304(self, ThemeUpdate_mock):
+        ThemeUpdate_mock.return_value.get_json.return_value = '{}'
+        ThemeUpdate_mock.return_value.is_not_modified.return_value = True
+        ThemeUpdate_mock.return_value.get_headers.return_value = [
+            ('Content-Length', '0'), ('ETag', '"x"')]
+        environ = dict(self.environ, PATH_INFO='/themes/update-check/5')
+        eq_(theme_update.application(environ, self.start_response), [''])
+        self.start_response.assert_called_with('304 Not Modified',
+                                               [('ETag', '"x"')])
+
     @mock.patch('services.theme_update.ThemeUpdate')
     def test_wsgi_application_404(self, ThemeUpdate_mock):
         urls = [
@@ -137,3 +149,68 @@ class TestThemeUpdate(amo.tests.TestCase):
 
         self.check_good(
             json.loads(self.get_update('en-US', 813, 'src=gp').get_json()))
+
+
+class TestThemeUpdateCaching(amo.tests.TestCase):
+
+    def setUp(self):
+        self.update = theme_update.ThemeUpdate('en-US', 15663)
+        self.update.data['row'] = {
+            'persona_id': 0, 'addon_id': 15663, 'slug': 'a15663',
+            'current_version': '0', 'name': 'My Persona',
+            'description': 'yolo', 'username': 'persona_author',
+            'header': 'header.png', 'footer': 'footer.png',
+            'accentcolor': None, 'textcolor': None, 'modified': 1380000000}
+        self.update.get_update = mock.Mock(return_value=True)
+        theme_update.json_cache.clear()
+        theme_update.icon_cache.clear()
+
+    def tearDown(self):
+        theme_update.json_cache.clear()
+        theme_update.icon_cache.clear()
+
+    def test_cached(self):
+        with mock.patch.object(self.update, 'render_json') as render:
+            render.return_value = '{}'
+            eq_(self.update.get_json(), '{}')
+            eq_(self.update.get_json(), '{}')
+        eq_(render.call_count, 1)
+
+    def test_modified_not_cached(self):
+        with mock.patch.object(self.update, 'render_json') as render:
+            render.return_value = '{}'
+            self.update.get_json()
+            self.update.data['row']['modified'] += 1
+            self.update.get_json()
+        eq_(render.call_count, 2)
+
+    def test_etag(self):
+        self.update.get_json()
+        assert self.update.etag
+        assert ('ETag', self.update.etag) in self.update.get_headers(1)
+        assert self.update.is_not_modified(
+            {'HTTP_IF_NONE_MATCH': self.update.etag})
+        assert not self.update.is_not_modified(
+            {'HTTP_IF_NONE_MATCH': '"nope"'})
+
+    def test_if_modified_since(self):
+        self.update.get_json()
+        assert self.update.is_not_modified(
+            {'HTTP_IF_MODIFIED_SINCE': 'Tue, 24 Sep 2013 05:20:00 GMT'})
+        assert not self.update.is_not_modified(
+            {'HTTP_IF_MODIFIED_SINCE': 'Tue, 24 Sep 2013 05:19:59 GMT'})
+        assert not self.update.is_not_modified({})
+
+    def test_last_modified(self):
+        assert (('Last-Modified', 'Tue, 24 Sep 2013 05:20:00 GMT') in
+                self.update.get_headers(1))
+
+    def test_icon_cached(self):
+        with mock.patch('services.theme_update.os.stat') as stat:
+            stat.return_value.st_mtime = 1
+            with mock.patch('__builtin__.open') as open_:
+                open_.return_value.__enter__.return_value.read.return_value = (
+                    'icon')
+                eq_(self.update.base64_icon(15663), 'aWNvbg==')
+                eq_(self.update.base64_icon(15663), 'aWNvbg==')
+        eq_(open_.call_count, 1)
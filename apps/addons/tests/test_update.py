@@ -4,15 +4,20 @@ from email import utils
 
 from django.db import connection
 
+import mock
 from nose.tools import eq_
 
 import amo
 import amo.tests
+import amo.utils
 from addons.models import (Addon, CompatOverride, CompatOverrideRange,
                            IncompatibleVersions)
+from addons.tasks import update_incompatible_appversions
 from applications.models import Application, AppVersion
 from files.models import File
 from services import update
+from services import utils
+from services.utils import LRUCache, Statement
 import settings_local
 from versions.models import ApplicationsVersions, Version
 
@@ -563,6 +568,145 @@ class TestDefaultToCompat(amo.tests.TestCase):
         self.check(self.expected)
 
 
+class TestDefaultToCompatIndex(TestDefaultToCompat):
+    """
+    The same as TestDefaultToCompat, but answered from the update index.
+    """
+
+    def setUp(self):
+        super(TestDefaultToCompatIndex, self).setUp()
+        self.old_index = settings_local.SERVICES_UPDATE_INDEX
+        self.old_rebuild = settings_local.SERVICES_UPDATE_INDEX_REBUILD
+        settings_local.SERVICES_UPDATE_INDEX = True
+        # Rebuild on every request so we always see the fixture changes.
+        settings_local.SERVICES_UPDATE_INDEX_REBUILD = -1
+
+    def tearDown(self):
+        settings_local.SERVICES_UPDATE_INDEX = self.old_index
+        settings_local.SERVICES_UPDATE_INDEX_REBUILD = self.old_rebuild
+        update.update_index = update.UpdateIndex()
+        super(TestDefaultToCompatIndex, self).tearDown()
+
+    def test_indexed(self):
+        up = update.Update({
+            'reqVersion': 1,
+            'id': self.addon.guid,
+            'version': '1.0',
+            'appID': self.app.guid,
+            'appVersion': '5.0',
+        })
+        up.cursor = connection.cursor()
+        assert up.is_valid()
+        assert up.indexed
+
+    def test_building_elsewhere(self):
+        up = update.Update({
+            'reqVersion': 1,
+            'id': self.addon.guid,
+            'version': '1.0',
+            'appID': self.app.guid,
+            'appVersion': '5.0',
+        })
+        up.cursor = connection.cursor()
+        # Another request is building the index, so SQL answers this one.
+        with update.update_index_lock:
+            assert up.is_valid()
+        assert not up.indexed
+        assert not update.update_index.ready
+
+
+class TestDefaultToCompatPrepared(TestDefaultToCompat):
+    """
+    The same as TestDefaultToCompat, but with prepared statements.
+    """
+
+    def setUp(self):
+        super(TestDefaultToCompatPrepared, self).setUp()
+        self.patch = mock.patch.object(utils.settings,
+                                       'SERVICES_DATABASE_PREPARE', True)
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+        super(TestDefaultToCompatPrepared, self).tearDown()
+
+
+class TestUpdateIndex(amo.tests.TestCase):
+    fixtures = ['base/platforms', 'addons/default-to-compat']
+
+    def setUp(self):
+        self.addon = Addon.objects.get(id=337203)
+        self.index = update.UpdateIndex()
+        self.index.rebuild(connection.cursor())
+        self.data = {'id': self.addon.id, 'app_id': amo.FIREFOX.id,
+                     'version_int': 5000000200100, 'appOS': None}
+
+    def get(self):
+        row = self.index.get_update(self.data, [amo.STATUS_PUBLIC], 'strict')
+        return row['version_id'] if row else None
+
+    def test_get_addon(self):
+        eq_(self.index.get_addon(self.addon.guid)[0], self.addon.id)
+        eq_(self.index.get_addon('garbage'), None)
+
+    def test_get_update(self):
+        eq_(self.get(), 1268883)
+
+    def test_returns_copy(self):
+        row = self.index.get_update(self.data, [amo.STATUS_PUBLIC], 'strict')
+        row['hash'] = 'changed'
+        assert self.index.get_update(
+            self.data, [amo.STATUS_PUBLIC], 'strict')['hash'] != 'changed'
+
+    def test_refresh(self):
+        File.objects.filter(version=1268883).update(
+            status=amo.STATUS_DISABLED, modified=datetime.now())
+        eq_(self.get(), 1268883)
+        eq_(self.index.refresh(connection.cursor()), 1)
+        eq_(self.get(), 1268882)
+
+    def test_refresh_same_second(self):
+        # A change made in the second the index was built is not missed.
+        File.objects.filter(version=1268883).update(
+            status=amo.STATUS_DISABLED, modified=self.index.since)
+        eq_(self.index.refresh(connection.cursor()), 1)
+        eq_(self.get(), 1268882)
+
+    def test_refresh_copy(self):
+        File.objects.filter(version=1268883).update(
+            status=amo.STATUS_DISABLED, modified=datetime.now())
+        index = self.index.copy()
+        eq_(index.refresh(connection.cursor()), 1)
+        # The index being used doesn't change.
+        eq_(self.get(), 1268883)
+        self.index = index
+        eq_(self.get(), 1268882)
+
+    def test_refresh_compat(self):
+        # Compat ranges have no modified date, their version's is bumped.
+        ApplicationsVersions.objects.get(version=1268883).delete()
+        eq_(self.index.refresh(connection.cursor()), 1)
+        eq_(self.get(), 1268882)
+
+    def test_refresh_overrides_cleared(self):
+        IncompatibleVersions.objects.create(version_id=1268883,
+                                            app_id=amo.FIREFOX.id)
+        IncompatibleVersions.objects.update(modified=datetime(2013, 1, 1))
+        self.index = update.UpdateIndex()
+        self.index.rebuild(connection.cursor())
+        assert self.index.overrides[1268883]
+        # Without a compat override for the add-on, they are only cleared.
+        update_incompatible_appversions([1268883])
+        eq_(self.index.refresh(connection.cursor()), 1)
+        assert 1268883 not in self.index.overrides
+
+    def test_refresh_deleted_addon(self):
+        self.addon.update(status=amo.STATUS_DELETED, modified=datetime.now())
+        self.index.refresh(connection.cursor())
+        eq_(self.index.get_addon(self.addon.guid), None)
+        eq_(self.get(), None)
+
+
 class TestResponse(amo.tests.TestCase):
     fixtures = ['base/addon_3615',
                 'base/platforms',
@@ -793,3 +937,255 @@ class TestResponse(amo.tests.TestCase):
         data['appVersion'] = '5.0.1'
         upd = self.get(data)
         eq_(upd.get_rdf(), upd.get_no_updates_rdf())
+
+
+class TestRDFCache(amo.tests.TestCase):
+    fixtures = ['base/addon_3615']
+
+    def setUp(self):
+        self.start_response = mock.Mock()
+        self.query = ('reqVersion=1&id=foo@bar&version=1.0&appVersion=4.0&'
+                      'appID={ec8030f7-c20a-464f-9b0e-13a3a9e97384}')
+        update.rdf_cache.clear()
+
+    def tearDown(self):
+        update.rdf_cache.clear()
+
+    def get(self, query=None):
+        return update.application({'QUERY_STRING': query or self.query},
+                                  self.start_response)
+
+    @mock.patch('services.update.get_headers')
+    @mock.patch('services.update.Update')
+    def test_cached(self, Update_mock, get_headers):
+        Update_mock.return_value.get_rdf.return_value = '<rdf/>'
+        get_headers.return_value = [('a', 'b')]
+        eq_(self.get(), ['<rdf/>'])
+        eq_(self.get(), ['<rdf/>'])
+        eq_(Update_mock.call_count, 1)
+        # The headers, with their dates, are made for every response.
+        eq_(get_headers.call_args_list, [((6,), {}), ((6,), {})])
+        self.start_response.assert_called_with('200 OK', [('a', 'b')])
+
+    @mock.patch('services.update.Update')
+    def test_normalized_app_os(self, Update_mock):
+        Update_mock.return_value.get_rdf.return_value = '<rdf/>'
+        self.get(self.query + '&appOS=WINNT_x86-msvc')
+        self.get(self.query + '&appOS=WINNT_x86_64-msvc')
+        eq_(Update_mock.call_count, 1)
+        self.get(self.query + '&appOS=Darwin')
+        eq_(Update_mock.call_count, 2)
+
+    @mock.patch('services.update.Update')
+    def test_compat_mode(self, Update_mock):
+        Update_mock.return_value.get_rdf.return_value = '<rdf/>'
+        self.get()
+        self.get(self.query + '&compatMode=normal')
+        eq_(Update_mock.call_count, 2)
+
+    @mock.patch('services.update.Update')
+    def test_generation(self, Update_mock):
+        Update_mock.return_value.get_rdf.return_value = '<rdf/>'
+        self.get()
+        amo.utils.cache_ns_key(amo.UPDATE_RDF_NAMESPACE, increment=True)
+        self.get()
+        eq_(Update_mock.call_count, 2)
+
+    def test_file_status_invalidates(self):
+        before = amo.utils.cache_ns_key(amo.UPDATE_RDF_NAMESPACE)
+        File.objects.get(pk=67442).update(status=amo.STATUS_UNREVIEWED)
+        assert amo.utils.cache_ns_key(amo.UPDATE_RDF_NAMESPACE) != before
+
+
+class TestBatchUpdate(amo.tests.TestCase):
+    fixtures = ['base/addon_3615',
+                'base/platforms',
+                'base/seamonkey']
+
+    def setUp(self):
+        self.data = {
+            'reqVersion': 1,
+            'appID': '{ec8030f7-c20a-464f-9b0e-13a3a9e97384}',
+            'appVersion': '3.7a1pre',
+        }
+        self.guid = '{2fa4ed95-0317-4c6a-a74c-5f3e3912c1f9}'
+        update.rdf_cache.clear()
+
+    def tearDown(self):
+        update.rdf_cache.clear()
+
+    def get(self, items):
+        up = update.BatchUpdate(self.data, items)
+        up.cursor = connection.cursor()
+        return up
+
+    def test_rdf(self):
+        rdf = self.get([(self.guid, '2.0.58'), ('garbage', '1.0')]).get_rdf()
+        eq_(rdf.count('<RDF:RDF'), 1)
+        eq_(rdf.count('<?xml'), 1)
+        assert 'urn:mozilla:extension:%s:2.1.072' % self.guid in rdf
+        assert 'garbage' not in rdf
+
+    def test_same_as_single(self):
+        up = update.Update(dict(self.data, id=self.guid, version='2.0.58'))
+        up.cursor = connection.cursor()
+        single = up.get_rdf()
+        batch = self.get([(self.guid, '2.0.58')]).get_rdf()
+        eq_(update.get_rdf_body(batch), update.get_rdf_body(single))
+
+    def test_case_insensitive_guid(self):
+        rdf = self.get([(self.guid.upper(), '2.0.58')]).get_rdf()
+        assert '<em:updateLink>' in rdf
+
+    def test_one_query_for_addons(self):
+        up = self.get([(self.guid, '2.0.58'), ('garbage', '1.0')])
+        with mock.patch.object(up, 'get_addons',
+                               wraps=up.get_addons) as get_addons:
+            up.get_rdf()
+        get_addons.assert_called_once_with([self.guid, 'garbage'])
+
+    @mock.patch.object(settings_local, 'SERVICES_UPDATE_INDEX', True)
+    def test_index_skips_query(self):
+        self.addCleanup(setattr, update, 'update_index',
+                        update.UpdateIndex())
+        up = self.get([(self.guid, '2.0.58'), ('garbage', '1.0')])
+        with mock.patch.object(up, 'get_addons',
+                               wraps=up.get_addons) as get_addons:
+            rdf = up.get_rdf()
+        # Only what the index doesn't have is looked up.
+        get_addons.assert_called_once_with(['garbage'])
+        assert '<em:updateLink>' in rdf
+
+    @mock.patch.dict(update.update_statements, clear=True)
+    def test_one_query_for_updates(self):
+        rdf = self.get([(self.guid, '2.0.58'), ('garbage', '1.0')]).get_rdf()
+        assert '<em:updateLink>' in rdf
+        # The files of the add-ons were loaded at once, rather than looked
+        # up by the update statement of each.
+        eq_(update.update_statements, {})
+
+    def test_limit(self):
+        up = self.get([(str(i), '1.0') for i in range(update.BATCH_LIMIT + 1)])
+        eq_(len(up.items), update.BATCH_LIMIT)
+
+    @mock.patch('services.update.BatchUpdate')
+    def test_application(self, BatchUpdate_mock):
+        BatchUpdate_mock.return_value.get_rdf.return_value = '<rdf/>'
+        update.batch_application(
+            {'QUERY_STRING': 'reqVersion=1&appID=a&appVersion=3.0&'
+                             'id=foo&version=1.0&id=bar&version='},
+            mock.Mock())
+        BatchUpdate_mock.assert_called_with(
+            {'reqVersion': '1', 'appID': 'a', 'appVersion': '3.0'},
+            [('foo', '1.0'), ('bar', '')], 'strict')
+
+    @mock.patch('services.update.BatchUpdate')
+    def test_application_missing_version(self, BatchUpdate_mock):
+        start_response = mock.Mock()
+        update.batch_application(
+            {'QUERY_STRING': 'reqVersion=1&appID=a&appVersion=3.0&'
+                             'id=foo&version=1.0&id=bar'},
+            start_response)
+        eq_(start_response.call_args[0][0], '400 Bad Request')
+        assert not BatchUpdate_mock.called
+
+
+class TestLRUCache(amo.tests.TestCase):
+
+    def test_eviction(self):
+        cache = LRUCache('test', 2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        eq_(cache.get('a'), 1)
+        cache.set('c', 3)
+        eq_(cache.get('b'), None)
+        eq_(cache.get('a'), 1)
+        eq_(cache.get('c'), 3)
+
+    def test_timeout(self):
+        cache = LRUCache('test', 2, timeout=60)
+        cache.set('a', 1)
+        with mock.patch('services.utils.time.time') as time_mock:
+            time_mock.return_value = cache.data['a'][0] + 61
+            eq_(cache.get('a'), None)
+
+    def test_generation(self):
+        cache = LRUCache('test', 2)
+        cache.set_generation(1)
+        cache.set('a', 1)
+        cache.set_generation(1)
+        eq_(cache.get('a'), 1)
+        cache.set_generation(2)
+        eq_(cache.get('a'), None)
+
+    def test_disabled(self):
+        cache = LRUCache('test', 0)
+        cache.set('a', 1)
+        eq_(cache.get('a'), None)
+
+
+class TestStatement(amo.tests.TestCase):
+
+    def setUp(self):
+        self.statement = Statement(
+            'test', 'SELECT id FROM addons WHERE id = %(id)s AND '
+                    'status != %(status)s AND id = %(id)s')
+        self.cursor = mock.Mock()
+        self.cursor.connection = mock.Mock(spec=[])
+
+    def test_not_prepared(self):
+        self.statement.execute(self.cursor, {'id': 1, 'status': 2})
+        self.cursor.execute.assert_called_with(self.statement.sql,
+                                               {'id': 1, 'status': 2})
+
+    @mock.patch.object(utils.settings, 'SERVICES_DATABASE_PREPARE', True)
+    def test_prepared(self):
+        self.statement.execute(self.cursor, {'id': 1, 'status': 2})
+        self.statement.execute(self.cursor, {'id': 3, 'status': 4})
+        calls = [c[0] for c in self.cursor.execute.call_args_list]
+        eq_(calls, [
+            ('PREPARE services_test FROM %s',
+             ['SELECT id FROM addons WHERE id = ? AND status != ? AND '
+              'id = ?']),
+            ('SET @services_id = %s, @services_status = %s', [1, 2]),
+            ('EXECUTE services_test USING @services_id, @services_status, '
+             '@services_id',),
+            ('SET @services_id = %s, @services_status = %s', [3, 4]),
+            ('EXECUTE services_test USING @services_id, @services_status, '
+             '@services_id',),
+        ])
+
+    @mock.patch.object(utils.settings, 'SERVICES_DATABASE_PREPARE', True)
+    def test_reprepare(self):
+        utils.get_prepared(self.cursor).add('services_test')
+        error = utils.mysql.OperationalError(utils.UNKNOWN_STMT_HANDLER, '')
+        self.cursor.execute.side_effect = [error, None, None, None]
+        self.statement.execute(self.cursor, {'id': 1, 'status': 2})
+        eq_(self.cursor.execute.call_args_list[1][0][0],
+            'PREPARE services_test FROM %s')
+
+
+class TestPool(amo.tests.TestCase):
+
+    def tearDown(self):
+        utils.pools.pop('test', None)
+
+    @mock.patch.object(utils.settings, 'SERVICES_DATABASE_POOLS',
+                       {'test': {'pool_size': 2}})
+    def test_settings(self):
+        eq_(utils.get_pool('test').size(), 2)
+        assert utils.get_pool('test') is utils.get_pool('test')
+        eq_(utils.get_pool('test')._max_overflow,
+            utils.settings.SERVICES_DATABASE_POOL['max_overflow'])
+
+    def test_driver(self):
+        eq_(utils.get_driver(), utils.mysql)
+
+    @mock.patch('services.utils.statsd')
+    def test_connect(self, statsd):
+        with mock.patch.object(utils, 'get_pool') as get_pool:
+            get_pool.return_value.checkedout.return_value = 1
+            eq_(utils.connect('test'), get_pool.return_value.connect())
+        statsd.incr.assert_called_with('services.test.pool.checkout')
+        statsd.gauge.assert_called_with('services.test.pool.checkedout', 1)
+        eq_(statsd.timing.call_args[0][0], 'services.test.pool.wait')
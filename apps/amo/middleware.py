@@ -21,6 +21,7 @@ import jingo
 
 import amo
 from . import urlresolvers
+from .search import set_search_view
 from .helpers import urlparams
 
 
@@ -188,6 +189,20 @@ class ViewMiddleware(object):
         return '%s.%s' % (view_func.__module__, name)
 
 
+class SearchViewMiddleware(ViewMiddleware):
+    """
+    Notes the view being run, for the slow search log, see
+    `amo.search.record_search`.
+    """
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        set_search_view('%s %s' % (self.get_name(view_func), request.path))
+
+    def process_response(self, request, response):
+        set_search_view(None)
+        return response
+
+
 class NoAddonsMiddleware(ViewMiddleware):
     """
     If enabled will try and stop any requests to addons by 404'ing them.
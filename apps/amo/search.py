@@ -1,4 +1,8 @@
+import hashlib
+import json
 import logging
+import random
+import threading
 from operator import itemgetter
 
 from django.conf import settings as dj_settings
@@ -11,6 +15,10 @@ from pyes import VERSION as PYES_VERSION
 
 
 log = logging.getLogger('z.es')
+slow_log = logging.getLogger('z.es.slow')
+
+# The view being run by this thread, for `record_search`.
+_local = threading.local()
 
 
 DEFAULT_HOSTS = ['localhost:9200']
@@ -75,6 +83,53 @@ def get_es(hosts=None, default_indexes=None, timeout=None, dump_curl=None,
     return es
 
 
+def set_search_view(name):
+    """Sets the view that the searches in this thread are made for."""
+    _local.view = name
+
+
+def query_shape(query):
+    """
+    Returns what is left of an ES query body once the values searched and
+    filtered for are taken out, so that the searches which only differ in
+    those are counted together.
+    """
+    if isinstance(query, dict):
+        return dict((k, query_shape(v)) for k, v in query.items())
+    if isinstance(query, (list, tuple)):
+        shapes = []
+        for value in map(query_shape, query):
+            if value not in shapes:
+                shapes.append(value)
+        return shapes
+    return '?'
+
+
+def record_search(query, index, hits):
+    """
+    Records a search made with the ES query body `query`, once ES returned
+    `hits` for it.
+
+    ES' time is sent to statsd by query shape, as
+    `search.shape.<hash of the shape>`. For ES_SLOW_QUERY_SAMPLE of the
+    searches that took more than ES_SLOW_QUERY_MS, the query, the shape hash
+    and the view it was made for are logged to `z.es.slow`.
+    """
+    shape = hashlib.md5(json.dumps(query_shape(query),
+                                   sort_keys=True)).hexdigest()[:12]
+    statsd.timing('search.shape.%s' % shape, hits['took'])
+    if (hits['took'] >= dj_settings.ES_SLOW_QUERY_MS and
+        random.random() < dj_settings.ES_SLOW_QUERY_SAMPLE):
+        slow_log.info(json.dumps({
+            'took': hits['took'],
+            'hits': hits['hits']['total'],
+            'index': index,
+            'shape': shape,
+            'view': getattr(_local, 'view', None),
+            'query': query,
+        }, default=unicode))
+
+
 class ES(object):
 
     def __init__(self, type_, index):
@@ -110,6 +165,10 @@ class ES(object):
     def filter(self, **kw):
         return self._clone(next_step=('filter', kw.items()))
 
+    def filter_raw(self, *filters):
+        """Filters with ES filters that `filter` can't build."""
+        return self._clone(next_step=('filter_raw', filters))
+
     def facet(self, **kw):
         return self._clone(next_step=('facet', kw.items()))
 
@@ -170,6 +229,8 @@ class ES(object):
                 queries.extend(self._process_queries(value))
             elif action == 'filter':
                 filters.extend(self._process_filters(value))
+            elif action == 'filter_raw':
+                filters.extend(value)
             elif action == 'facet':
                 facets.update(value)
             else:
@@ -268,6 +329,7 @@ class ES(object):
             raise
         statsd.timing('search.es.took', hits['took'])
         log.debug('[%s] [%s] %s' % (hits['took'], timer.ms, qs))
+        record_search(qs, self.index, hits)
         return hits
 
     def __iter__(self):
@@ -1,5 +1,8 @@
+from nose.tools import eq_
+
 import amo
 import amo.tests
+from services import pfs
 from services.pfs import get_output
 
 from  pyquery import PyQuery as pq
@@ -14,3 +17,50 @@ class TestPfs(amo.tests.TestCase):
                   'licenseURL', 'needsRestart']:
             res = get_output({k: 'fooo<script>alert("foo")</script>;'})
             assert not pq(res)('script')
+
+    def get(self, **kw):
+        data = {'mimetype': 'application/x-shockwave-flash',
+                'appID': '{ec8030f7-c20a-464f-9b0e-13a3a9e97384}',
+                'appVersion': '26.0', 'clientOS': 'Windows NT 6.1',
+                'chromeLocale': 'en-US'}
+        data.update(kw)
+        return get_output(data)
+
+    def test_flash_windows(self):
+        res = self.get()
+        assert '{4cfaef8a-a6c9-41a0-8e6f-967eb8f49143}' in res
+        assert 'fp_pl_pfs_installer.exe' in res
+
+    def test_flash_linux(self):
+        res = self.get(clientOS='Linux x86_64')
+        assert 'Adobe Flash Player' in res
+        assert 'fp_pl_pfs_installer.exe' not in res
+
+    def test_director_locale(self):
+        res = self.get(mimetype='application/x-director')
+        assert 'eula_shockwaveplayer<' in res
+        res = self.get(mimetype='application/x-director',
+                       chromeLocale='ja-JP')
+        assert 'eula_shockwaveplayer_jp' in res
+
+    def test_wmp_mac(self):
+        res = self.get(mimetype='video/x-ms-wmv',
+                       clientOS='Intel Mac OS X 10.8')
+        assert 'Flip4Mac' in res
+
+    def test_no_match(self):
+        res = self.get(mimetype='application/x-unknown-plugin')
+        assert '<pfs:name>-1</pfs:name>' in res
+        # Shockwave has no rule for Solaris.
+        res = self.get(mimetype='application/x-director', clientOS='SunOS')
+        assert '<pfs:name>-1</pfs:name>' in res
+
+    def test_cached(self):
+        pfs.output_cache.clear()
+        res = self.get()
+        eq_(len(pfs.output_cache), 1)
+        # The same OS family gets the same cached response.
+        eq_(self.get(clientOS='Windows NT 5.1'), res)
+        eq_(len(pfs.output_cache), 1)
+        self.get(clientOS='Linux x86_64')
+        eq_(len(pfs.output_cache), 2)
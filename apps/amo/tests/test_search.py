@@ -1,3 +1,5 @@
+import json
+
 from django.core import paginator
 
 import mock
@@ -397,3 +399,49 @@ class TestPaginator(amo.tests.ESTestCase):
         eq_(p._count, None)
         p.page(1)
         eq_(p.count, Addon.search().count())
+
+
+class TestRecordSearch(amo.tests.TestCase):
+
+    def setUp(self):
+        self.query = {'query': {'term': {'name': 'foo'}},
+                      'filter': {'and': [{'term': {'status': 4}},
+                                         {'term': {'status': 0}},
+                                         {'in': {'device': [1, 2]}}]}}
+        self.hits = {'took': 10, 'hits': {'total': 3, 'hits': []}}
+
+    def test_shape(self):
+        eq_(amo.search.query_shape(self.query),
+            {'query': {'term': {'name': '?'}},
+             'filter': {'and': [{'term': {'status': '?'}},
+                                {'in': {'device': ['?']}}]}})
+
+    @mock.patch('amo.search.statsd')
+    def test_timing_by_shape(self, statsd):
+        amo.search.record_search(self.query, 'addons', self.hits)
+        other = dict(self.query, query={'term': {'name': 'bar'}})
+        amo.search.record_search(other, 'addons', self.hits)
+        eq_(statsd.timing.call_count, 2)
+        eq_(statsd.timing.call_args_list[0], statsd.timing.call_args_list[1])
+        assert statsd.timing.call_args[0][0].startswith('search.shape.')
+
+    @mock.patch('amo.search.slow_log')
+    def test_slow_log(self, slow_log):
+        amo.search.set_search_view('addons.views.home /en-US/firefox/')
+        with self.settings(ES_SLOW_QUERY_MS=10, ES_SLOW_QUERY_SAMPLE=1):
+            amo.search.record_search(self.query, 'addons', self.hits)
+            self.hits['took'] = 9
+            amo.search.record_search(self.query, 'addons', self.hits)
+        eq_(slow_log.info.call_count, 1)
+        logged = json.loads(slow_log.info.call_args[0][0])
+        eq_(logged['took'], 10)
+        eq_(logged['hits'], 3)
+        eq_(logged['query'], self.query)
+        eq_(logged['view'], 'addons.views.home /en-US/firefox/')
+        amo.search.set_search_view(None)
+
+    @mock.patch('amo.search.slow_log')
+    def test_slow_log_sample(self, slow_log):
+        with self.settings(ES_SLOW_QUERY_MS=10, ES_SLOW_QUERY_SAMPLE=0):
+            amo.search.record_search(self.query, 'addons', self.hits)
+        assert not slow_log.info.called
@@ -16,11 +16,12 @@ import amo
 import amo.models
 import sharing.utils as sharing
 from access import acl
-from addons.models import Addon, AddonRecommendation
+from addons.models import Addon, AddonRecommendation, AddonRecommendationChange
 from amo.helpers import absolutify
 from amo.urlresolvers import reverse
 from amo.utils import sorted_groupby
 from applications.models import Application
+from lib.recommend.neighbors import NeighborsFile
 from stats.models import CollectionShareCountTotal
 from translations.fields import LinkifiedField, save_signal, TranslatedField
 from users.models import UserProfile
@@ -28,6 +29,10 @@ from versions import compare
 
 SPECIAL_SLUGS = amo.COLLECTION_SPECIAL_SLUGS
 
+# The recommendations written by the recs crons, when there are any.
+recs_neighbors = NeighborsFile(settings.RECS_NEIGHBORS_PATH,
+                               settings.RECS_NEIGHBORS_CHECK)
+
 
 class TopTags(object):
     """Descriptor to manage a collection's top tags in cache."""
@@ -85,6 +90,12 @@ class CollectionBase:
     @classmethod
     def get_recs_from_ids(cls, addons, app, version, compat_mode='strict'):
         vint = compare.version_int(version)
+        model = recs_neighbors.get()
+        if model:
+            recs = model.recommend(addons, app.id, vint,
+                                   strict=compat_mode == 'strict')
+            return recs, Addon.objects.public().filter(id__in=recs)
+
         recs = RecommendedCollection.build_recs(addons)
         qs = (Addon.objects.public()
               .filter(id__in=recs, appsupport__app=app.id,
@@ -543,6 +554,8 @@ class SyncedCollection(CollectionBase, amo.models.ModelBase):
         cursor.execute("""
             INSERT INTO synced_addons_collections (addon_id, collection_id)
             VALUES %s""" % ','.join(values))
+        # The rows are inserted by hand, so there are no signals for them.
+        AddonRecommendationChange.record(addon_ids)
         if not self.addon_index:
             self.addon_index = self.make_index(addon_ids)
             self.save()
@@ -557,6 +570,16 @@ class SyncedCollectionAddon(models.Model):
         db_table = 'synced_addons_collections'
         unique_together = (('addon', 'collection'),)
 
+    @staticmethod
+    def post_save_or_delete(sender, instance, **kw):
+        AddonRecommendationChange.record([instance.addon_id])
+
+
+models.signals.post_save.connect(SyncedCollectionAddon.post_save_or_delete,
+                                 sender=SyncedCollectionAddon)
+models.signals.post_delete.connect(SyncedCollectionAddon.post_save_or_delete,
+                                   sender=SyncedCollectionAddon)
+
 
 class RecommendedCollection(Collection):
 
@@ -8,12 +8,14 @@ from nose.tools import eq_
 import amo
 import amo.tests
 from access.models import Group
-from addons.models import Addon, AddonRecommendation
+from addons.models import (Addon, AddonRecommendation,
+                           AddonRecommendationChange)
 from bandwagon.models import (Collection, CollectionUser, CollectionWatcher,
-                              RecommendedCollection)
+                              RecommendedCollection, SyncedCollection)
 from devhub.models import ActivityLog
 from bandwagon import tasks
 from users.models import UserProfile
+from versions.compare import version_int
 
 
 def get_addons(c):
@@ -211,3 +213,24 @@ class TestRecommendations(amo.tests.TestCase):
         recs = RecommendedCollection.build_recs([7, 3, 8])
         # 3 should not be in the list since we already have it.
         eq_(recs, [1, 2])
+
+    @mock.patch('bandwagon.models.recs_neighbors')
+    def test_recs_from_neighbors(self, recs_neighbors):
+        model = recs_neighbors.get.return_value
+        model.recommend.return_value = [1843, 5299]
+        ids, qs = Collection.get_recs_from_ids([7661], amo.FIREFOX, '4.0',
+                                               'ignore')
+        eq_(ids, [1843, 5299])
+        model.recommend.assert_called_with([7661], amo.FIREFOX.id,
+                                           version_int('4.0'), strict=False)
+        eq_(str(qs.query), str(Addon.objects.public()
+                                 .filter(id__in=[1843, 5299]).query))
+
+    def test_synced_collection_changes(self):
+        changes = AddonRecommendationChange.objects.values_list('addon_id',
+                                                                flat=True)
+        c = SyncedCollection.objects.create()
+        c.set_addons([5299, 1843])
+        eq_(sorted(changes.all()), [1843, 5299])
+        c.delete()
+        eq_(sorted(changes.all()), [1843, 1843, 5299, 5299])
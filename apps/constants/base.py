@@ -250,6 +250,10 @@ ADDON_SLUGS_UPDATE = {
     ADDON_WEBAPP: 'app',
 }
 
+# The cache_ns_key namespace the update service checks to know when to flush
+# the update RDF it has rendered.
+UPDATE_RDF_NAMESPACE = 'update-rdf'
+
 # A slug to ID map for the search API. Included are all ADDON_TYPES that are
 # found in ADDON_SEARCH_TYPES.
 ADDON_SEARCH_SLUGS = {
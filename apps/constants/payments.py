@@ -87,6 +87,10 @@ MKT_TRANSACTION_CONTRIB_TYPES = {
 
 CONTRIB_TYPE_DEFAULT = CONTRIB_VOLUNTARY
 
+# The cache_ns_key namespace of the receipt verification service's cache for
+# an app, bumped whenever a purchase of the app changes.
+RECEIPT_VERIFY_NAMESPACE = 'receipt-verify:%s'
+
 PAYPAL_PERSONAL = {
     'first_name': 'http://axschema.org/namePerson/first',
     'last_name': 'http://axschema.org/namePerson/last',
@@ -494,6 +494,12 @@ def clear_d2c_version(old_attr, new_attr, instance, sender, **kw):
         instance.version.addon.invalidate_d2c_versions()
 
 
+@File.on_change
+def clear_update_rdf(old_attr, new_attr, instance, sender, **kw):
+    if old_attr.get('status') != new_attr.get('status'):
+        amo.utils.cache_ns_key(amo.UPDATE_RDF_NAMESPACE, increment=True)
+
+
 # TODO(davedash): Get rid of this table once /editors is on zamboni
 class Approval(amo.models.ModelBase):
 
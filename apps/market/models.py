@@ -15,7 +15,7 @@ from tower import ugettext_lazy as _
 import amo
 import amo.models
 from amo.decorators import write
-from amo.utils import get_locale_from_lang, memoize_key
+from amo.utils import cache_ns_key, get_locale_from_lang, memoize_key
 from constants.payments import (CARRIER_CHOICES, PAYMENT_METHOD_ALL,
                                 PAYMENT_METHOD_CHOICES, PROVIDER_BANGO,
                                 PROVIDER_CHOICES)
@@ -283,6 +283,20 @@ def create_addon_purchase(sender, instance, **kw):
     cache.delete(memoize_key('users:purchase-ids', instance.user.pk))
 
 
+@receiver(models.signals.post_save, sender=AddonPurchase,
+          dispatch_uid='addon_purchase_verify_cache')
+@receiver(models.signals.post_delete, sender=AddonPurchase,
+          dispatch_uid='addon_purchase_verify_cache_delete')
+def clear_receipt_verify_cache(sender, instance, **kw):
+    """
+    Drop the receipt verification results cached for the app, so that
+    refunds and chargebacks are seen by services/verify.py straight away.
+    """
+    if not kw.get('raw'):
+        cache_ns_key(amo.RECEIPT_VERIFY_NAMESPACE % instance.addon_id,
+                     increment=True)
+
+
 class AddonPremium(amo.models.ModelBase):
     """Additions to the Addon model that only apply to Premium add-ons."""
     addon = models.OneToOneField('addons.Addon')
@@ -0,0 +1,40 @@
+import datetime
+import logging
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+import amo.search
+from stats.models import DownloadCount, ThemeUserCount, UpdateCount
+
+log = logging.getLogger('z.stats')
+
+
+class Command(BaseCommand):
+    help = ('Merge the segments of the monthly stats partitions that are no '
+            'longer written to, with ES_STATS_PARTITIONED.')
+    option_list = BaseCommand.option_list + (
+        make_option('--months', action='store', type='int', default=2,
+                    help=('Leave the partitions of this many months alone, '
+                          'counting the current one. Default: 2')),
+    )
+
+    def handle(self, *args, **kw):
+        if not settings.ES_STATS_PARTITIONED:
+            raise CommandError('The stats are not partitioned.')
+
+        # The first day of the oldest month to leave alone.
+        month = datetime.date.today().replace(day=1)
+        for i in range(kw['months'] - 1):
+            month = (month - datetime.timedelta(days=1)).replace(day=1)
+
+        es = amo.search.get_es(timeout=settings.ES_TIMEOUT)
+        for model in DownloadCount, ThemeUserCount, UpdateCount:
+            last = model.get_partition(month)
+            for partition in model.get_partitions():
+                if partition >= last:
+                    continue
+                log.info('Compacting %s.' % partition)
+                es.optimize([partition], wait_for_merge=True,
+                            max_num_segments=1)
@@ -1,11 +1,13 @@
 import datetime
 
 from django.conf import settings
+from django.core.cache import cache
 from django.db import models
 from django.utils import translation
 
 import bleach
 import caching.base
+import pyes.exceptions
 import tower
 from babel import Locale, numbers
 from jingo import env
@@ -13,6 +15,7 @@ from jinja2.filters import do_dictsort
 from tower import ugettext as _
 
 import amo
+import amo.search
 from amo.helpers import absolutify, urlparams
 from amo.models import SearchMixin
 from amo.fields import DecimalCharField
@@ -22,6 +25,120 @@ from zadmin.models import DownloadSource
 from .db import StatsDictField
 
 
+class PartitionedSearchMixin(SearchMixin):
+    """
+    With ES_STATS_PARTITIONED, the documents are indexed in an index per
+    month instead, `<index>-<type>-<yyyymm>`, and all of them are behind the
+    `<index>-<type>` alias. The searches for a range of dates then only
+    need to look at the months in the range.
+
+    The documents from before the oldest one in the partitions are searched
+    for in the index they were all in before, until they are copied into the
+    partitions with index_stats.
+    """
+    # The partitions we know exist, so we don't have to look them up.
+    _partitions = set()
+
+    @classmethod
+    def get_partition_alias(cls):
+        return '%s-%s' % (cls._get_index(), cls._meta.db_table)
+
+    @classmethod
+    def get_partition(cls, date):
+        """The name of the partition with the documents for `date`."""
+        return '%s-%s' % (cls.get_partition_alias(), date.strftime('%Y%m'))
+
+    @classmethod
+    def get_partitions(cls, start=None, end=None):
+        """
+        The names of the partitions there are, oldest first, only with the
+        documents between the dates `start` and `end` if they are given.
+        """
+        alias = cls.get_partition_alias()
+        key = 'stats:partitions:%s' % alias
+        partitions = cache.get(key)
+        if partitions is None:
+            try:
+                partitions = sorted(amo.search.get_es().get_alias(alias))
+            except pyes.exceptions.IndexMissingException:
+                partitions = []
+            cache.set(key, partitions, 60 * 60)
+        if start:
+            partitions = [p for p in partitions
+                          if p >= cls.get_partition(start)]
+        if end:
+            partitions = [p for p in partitions
+                          if p <= cls.get_partition(end)]
+        return partitions
+
+    @classmethod
+    def create_partition(cls, date):
+        """Returns the partition for `date`, which is created if needed."""
+        # Circular import.
+        from stats.search import get_mapping
+
+        name = cls.get_partition(date)
+        if name in cls._partitions or name in cls.get_partitions():
+            cls._partitions.add(name)
+            return name
+
+        es = amo.search.get_es()
+        try:
+            es.create_index(name, settings={
+                'number_of_shards': settings.ES_STATS_PARTITION_SHARDS,
+                'number_of_replicas': settings.ES_DEFAULT_NUM_REPLICAS})
+        except pyes.exceptions.IndexAlreadyExistsException:
+            pass
+        es.put_mapping(cls._meta.db_table, get_mapping(), [name])
+        es.add_alias(cls.get_partition_alias(), [name])
+        cache.delete_many(['stats:partitions:%s' % cls.get_partition_alias(),
+                           'stats:partitioned:%s' % cls.get_partition_alias()])
+        cls._partitions.add(name)
+        return name
+
+    @classmethod
+    def get_partitioned_since(cls):
+        """
+        The date of the oldest document in the partitions, as YYYY-MM-DD, or
+        None if there isn't any.
+        """
+        key = 'stats:partitioned:%s' % cls.get_partition_alias()
+        since = cache.get(key)
+        if since is None:
+            dates = list(amo.search.ES(cls, cls.get_partitions()[:1])
+                         .order_by('date').values_dict('date')[:1])
+            since = dates[0]['date'].strftime('%Y-%m-%d') if dates else ''
+            cache.set(key, since, 60 * 60)
+        return since or None
+
+    @classmethod
+    def search(cls, index=None, start=None, end=None):
+        """
+        Searches `index`, or the partitions with the documents between
+        `start` and `end` when the documents are partitioned, and the old
+        index for the documents from before them.
+        """
+        if index or not settings.ES_STATS_PARTITIONED:
+            return super(PartitionedSearchMixin, cls).search(index)
+        partitions = cls.get_partitions()
+        since = partitions and cls.get_partitioned_since()
+        if not since:
+            # Nothing was partitioned yet.
+            return super(PartitionedSearchMixin, cls).search()
+        # The search is filtered by date, so if there aren't any partitions
+        # for the range any of them finds the same nothing.
+        indices = cls.get_partitions(start, end) or partitions[-1:]
+        if start and start.strftime('%Y-%m-%d') >= since:
+            return amo.search.ES(cls, indices)
+        # Only the documents that aren't in the partitions yet are found in
+        # the old index.
+        old = cls._get_index()
+        return amo.search.ES(cls, indices + [old]).filter_raw(
+            {'indices': {'indices': [old],
+                         'filter': {'range': {'date': {'lt': since}}},
+                         'no_match_filter': 'all'}})
+
+
 class AddonCollectionCount(models.Model):
     addon = models.ForeignKey('addons.Addon')
     collection = models.ForeignKey('bandwagon.Collection')
@@ -52,7 +169,7 @@ class CollectionStats(models.Model):
         db_table = 'stats_collections'
 
 
-class DownloadCount(SearchMixin, models.Model):
+class DownloadCount(PartitionedSearchMixin, models.Model):
     addon = models.ForeignKey('addons.Addon')
     count = models.PositiveIntegerField()
     date = models.DateField()
@@ -62,7 +179,7 @@ class DownloadCount(SearchMixin, models.Model):
         db_table = 'download_counts'
 
 
-class UpdateCount(SearchMixin, models.Model):
+class UpdateCount(PartitionedSearchMixin, models.Model):
     addon = models.ForeignKey('addons.Addon')
     count = models.PositiveIntegerField()
     date = models.DateField()
@@ -446,7 +563,7 @@ class ClientData(models.Model):
                            'is_chromeless', 'language', 'region')
 
 
-class ThemeUserCount(SearchMixin, models.Model):
+class ThemeUserCount(PartitionedSearchMixin, models.Model):
     """Theme active daily users."""
     addon = models.ForeignKey('addons.Addon')
     count = models.PositiveIntegerField()
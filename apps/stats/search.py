@@ -123,24 +123,26 @@ def get_all_app_versions():
     return dict(rv)
 
 
+def get_mapping():
+    return {
+        'properties': {
+            'id': {'type': 'long'},
+            'count': {'type': 'long'},
+            'data': {'dynamic': 'true',
+                     'properties': {
+                        'v': {'type': 'long'},
+                        'k': {'type': 'string'}
+                    }
+            },
+            'date': {'format': 'dateOptionalTime',
+                     'type': 'date'}
+        }
+    }
+
+
 def setup_indexes(index=None, aliased=True):
     es = amo.search.get_es()
     for model in CollectionCount, DownloadCount, UpdateCount:
         index = index or model._get_index()
         index = create_es_index_if_missing(index, aliased=aliased)
-
-        mapping = {
-            'properties': {
-                'id': {'type': 'long'},
-                'count': {'type': 'long'},
-                'data': {'dynamic': 'true',
-                         'properties': {
-                            'v': {'type': 'long'},
-                            'k': {'type': 'string'}
-                        }
-                },
-                'date': {'format': 'dateOptionalTime',
-                         'type': 'date'}
-            }
-        }
-        es.put_mapping(model._meta.db_table, mapping, index)
+        es.put_mapping(model._meta.db_table, get_mapping(), index)
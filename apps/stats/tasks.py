@@ -310,6 +310,16 @@ def _get_metrics_jobs(date=None):
     return stats
 
 
+def get_date_indices(model, date, indices):
+    """
+    The indices to index the `model` document for `date` in: its monthly
+    partition with ES_STATS_PARTITIONED, unless we were given an index.
+    """
+    if settings.ES_STATS_PARTITIONED and indices == [None]:
+        return [model.create_partition(date)]
+    return indices
+
+
 @task
 def index_update_counts(ids, **kw):
     index = kw.pop('index', None)
@@ -323,7 +333,7 @@ def index_update_counts(ids, **kw):
         for update in qs:
             key = '%s-%s' % (update.addon_id, update.date)
             data = search.extract_update_count(update)
-            for index in indices:
+            for index in get_date_indices(UpdateCount, update.date, indices):
                 UpdateCount.index(data, bulk=True, id=key, index=index)
         es.flush_bulk(forced=True)
     except Exception, exc:
@@ -344,7 +354,7 @@ def index_download_counts(ids, **kw):
         for dl in qs:
             key = '%s-%s' % (dl.addon_id, dl.date)
             data = search.extract_download_count(dl)
-            for index in indices:
+            for index in get_date_indices(DownloadCount, dl.date, indices):
                 DownloadCount.index(data, bulk=True, id=key, index=index)
 
         es.flush_bulk(forced=True)
@@ -396,7 +406,8 @@ def index_theme_user_counts(ids, **kw):
         for user_count in qs:
             key = '%s-%s' % (user_count.addon_id, user_count.date)
             data = search.extract_theme_user_count(user_count)
-            for index in indices:
+            for index in get_date_indices(ThemeUserCount, user_count.date,
+                                          indices):
                 ThemeUserCount.index(data, bulk=True, id=key, index=index)
             es.flush_bulk(forced=True)
     except Exception, exc:
@@ -8,13 +8,14 @@ from django.db import models
 from django.test.client import RequestFactory
 from django.utils import translation
 
+import mock
 import phpserialize as php
 from nose.tools import eq_
 
 import amo
 import amo.tests
 from addons.models import Addon
-from stats.models import ClientData, Contribution
+from stats.models import ClientData, Contribution, UpdateCount
 from stats.db import StatsDictField
 from users.models import UserProfile
 from market.models import Refund
@@ -211,3 +212,84 @@ class TestClientData(amo.tests.TestCase):
         eq_(cli.is_chromeless, False)
         eq_(cli.language, 'en-us')
         eq_(cli.region, None)
+
+
+@mock.patch('amo.search.get_es')
+class TestPartitionedSearch(amo.tests.TestCase):
+
+    def setUp(self):
+        self.alias = '%s-update_counts' % settings.ES_INDEXES['update_counts']
+        self.partitions = ['%s-%s' % (self.alias, month)
+                           for month in ('201301', '201302', '201304')]
+        UpdateCount._partitions.clear()
+
+    def test_get_partition(self, get_es):
+        eq_(UpdateCount.get_partition(datetime(2013, 2, 14)),
+            self.partitions[1])
+
+    def test_get_partitions(self, get_es):
+        get_es.return_value.get_alias.return_value = self.partitions[::-1]
+        eq_(UpdateCount.get_partitions(), self.partitions)
+        eq_(UpdateCount.get_partitions(datetime(2013, 2, 28),
+                                       datetime(2013, 4, 1)),
+            self.partitions[1:])
+        eq_(UpdateCount.get_partitions(end=datetime(2013, 1, 31)),
+            self.partitions[:1])
+        # They are cached.
+        eq_(get_es.return_value.get_alias.call_count, 1)
+
+    def test_create_partition(self, get_es):
+        es = get_es.return_value
+        es.get_alias.return_value = self.partitions
+        eq_(UpdateCount.create_partition(datetime(2013, 4, 2)),
+            self.partitions[2])
+        assert not es.create_index.called
+
+        name = UpdateCount.create_partition(datetime(2013, 3, 2))
+        eq_(name, '%s-201303' % self.alias)
+        es.create_index.assert_called_with(name, settings=mock.ANY)
+        es.add_alias.assert_called_with(self.alias, [name])
+
+    def hits(self, *dates):
+        return {'took': 1, 'hits': {'total': len(dates), 'hits': [
+            {'fields': {'id': 1, 'date': date}} for date in dates]}}
+
+    def test_search(self, get_es):
+        get_es.return_value.get_alias.return_value = self.partitions
+        get_es.return_value.search.return_value = self.hits(
+            datetime(2013, 1, 5))
+        with self.settings(ES_STATS_PARTITIONED=True):
+            eq_(UpdateCount.search(start=datetime(2013, 2, 1),
+                                   end=datetime(2013, 3, 1)).index,
+                self.partitions[1:2])
+            eq_(UpdateCount.search(start=datetime(2013, 5, 1)).index,
+                self.partitions[2:])
+            eq_(UpdateCount.search('foo').index, 'foo')
+        eq_(UpdateCount.search().index, UpdateCount._get_index())
+
+    def test_search_before_partitions(self, get_es):
+        get_es.return_value.get_alias.return_value = self.partitions
+        get_es.return_value.search.return_value = self.hits(
+            datetime(2013, 1, 5))
+        index = UpdateCount._get_index()
+        with self.settings(ES_STATS_PARTITIONED=True):
+            qs = UpdateCount.search(start=datetime(2012, 12, 1),
+                                    end=datetime(2013, 1, 31))
+            eq_(qs.index, self.partitions[:1] + [index])
+            # The old index only has the documents before the partitions.
+            eq_(qs._build_query()['filter'],
+                {'indices': {'indices': [index],
+                             'filter': {'range': {'date': {
+                                 'lt': '2013-01-05'}}},
+                             'no_match_filter': 'all'}})
+            eq_(UpdateCount.search().index, self.partitions + [index])
+            # The oldest document is cached.
+            UpdateCount.search()
+            eq_(get_es.return_value.search.call_count, 1)
+
+    def test_search_empty_partitions(self, get_es):
+        get_es.return_value.get_alias.return_value = self.partitions
+        get_es.return_value.search.return_value = self.hits()
+        with self.settings(ES_STATS_PARTITIONED=True):
+            eq_(UpdateCount.search(start=datetime(2013, 2, 1)).index,
+                UpdateCount._get_index())
@@ -35,7 +35,7 @@ from amo.urlresolvers import reverse
 from amo.utils import memoize
 
 from .models import (CollectionCount, Contribution, DownloadCount,
-                     ThemeUserCount, UpdateCount)
+                     PartitionedSearchMixin, ThemeUserCount, UpdateCount)
 
 
 logger = logging.getLogger('z.apps.stats.views')
@@ -71,8 +71,14 @@ def get_series(model, extra_field=None, **filters):
     the query result.
     """
     extra = () if extra_field is None else (extra_field,)
+    if issubclass(model, PartitionedSearchMixin) and 'date__range' in filters:
+        # Only look at the months in the range.
+        qs = model.search(start=filters['date__range'][0],
+                          end=filters['date__range'][1])
+    else:
+        qs = model.search()
     # Put a slice on it so we get more than 10 (the default), but limit to 365.
-    qs = (model.search().order_by('-date').filter(**filters)
+    qs = (qs.order_by('-date').filter(**filters)
           .values_dict('date', 'count', *extra))[:365]
     for val in qs:
         # Convert the datetimes to a date.
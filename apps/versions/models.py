@@ -682,3 +682,22 @@ class ApplicationsVersions(caching.base.CachingMixin, models.Model):
             return _(u'{app} {min} and later').format(app=self.application,
                                                       min=self.min)
         return u'%s %s - %s' % (self.application, self.min, self.max)
+
+
+def update_version_modified(sender, instance, **kw):
+    """
+    Bumps the modified date of the version when its compatibility changes, so
+    that the update service index reloads it.
+    """
+    if kw.get('raw'):
+        return
+    Version.objects.filter(pk=instance.version_id).update(
+        modified=datetime.datetime.now())
+
+
+models.signals.post_save.connect(
+    update_version_modified, sender=ApplicationsVersions,
+    dispatch_uid='version_update_modified')
+models.signals.post_delete.connect(
+    update_version_modified, sender=ApplicationsVersions,
+    dispatch_uid='version_update_modified')
@@ -0,0 +1,102 @@
+"""
+Indexes the objects that were saved since the last run, when the
+`index-changes` switch is on.
+
+Rather than queuing a task to index every object as it is saved, the
+post_save receivers then record an `IndexChange`. This picks them all up,
+indexes each object once however many times it was saved, in bulk, and
+sends the time from the first save to the indexing as
+`es.index_changes.lag`. The documents are searchable after the next refresh
+of the index on top of that.
+
+Run it from cron, or keep it running with --follow, in which case the saves
+of every --window seconds are coalesced.
+"""
+import datetime
+import logging
+import time
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+
+from django_statsd.clients import statsd
+
+from amo.utils import chunked
+from lib.es.models import IndexChange
+
+
+log = logging.getLogger('z.elasticsearch')
+
+
+def get_indexers():
+    """The task that indexes each mapping type, by mapping type."""
+    from addons.models import Addon
+    from addons.tasks import index_addons
+    from mkt.webapps.models import WebappIndexer
+    from mkt.webapps.tasks import index_webapps
+
+    return {Addon._meta.db_table: index_addons,
+            WebappIndexer.get_mapping_type_name(): index_webapps}
+
+
+def index_changes(chunk_size=100):
+    """Indexes the objects with an `IndexChange` and returns how many."""
+    last = IndexChange.objects.aggregate(last=Max('id'))['last']
+    if last is None:
+        return 0
+    changes = IndexChange.objects.filter(id__lte=last)
+
+    # When each object was first saved, by mapping type.
+    saved = {}
+    for mapping_type, id_, created in changes.values_list(
+            'mapping_type', 'object_id', 'created'):
+        ids = saved.setdefault(mapping_type, {})
+        ids[id_] = min(created, ids.get(id_, created))
+    statsd.gauge('es.index_changes.pending', sum(map(len, saved.values())))
+
+    indexers = get_indexers()
+    indexed = 0
+    for mapping_type, ids in saved.items():
+        indexer = indexers.get(mapping_type)
+        if not indexer:
+            log.error('No indexer for %s changes.' % mapping_type)
+            changes.filter(mapping_type=mapping_type).delete()
+            continue
+        for chunk in chunked(sorted(ids), chunk_size):
+            indexer(chunk)
+            lag = datetime.datetime.now() - min(ids[id_] for id_ in chunk)
+            statsd.timing('es.index_changes.lag',
+                          int(lag.days * 86400000 + lag.seconds * 1000 +
+                              lag.microseconds / 1000))
+            changes.filter(mapping_type=mapping_type,
+                           object_id__in=chunk).delete()
+            indexed += len(chunk)
+    return indexed
+
+
+class Command(BaseCommand):
+    help = 'Index the objects saved since the last run'
+    option_list = BaseCommand.option_list + (
+        make_option('--follow', action='store_true', default=False,
+                    help='Keep indexing changes as they come in'),
+        make_option('--window', action='store', type='float',
+                    default=settings.ES_INDEX_CHANGES_WINDOW,
+                    help=('Seconds of changes to coalesce when following. '
+                          'Default: settings.ES_INDEX_CHANGES_WINDOW')),
+    )
+
+    def handle(self, *args, **kwargs):
+        if not kwargs['follow']:
+            log.info('Indexed %s changed objects.' % index_changes())
+            return
+
+        while True:
+            start = time.time()
+            try:
+                index_changes()
+            except Exception:
+                # The changes are kept and will be tried again.
+                log.exception('Indexing changes failed.')
+            time.sleep(max(0, kwargs['window'] - (time.time() - start)))
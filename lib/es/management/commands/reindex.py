@@ -280,6 +280,9 @@ class Command(BaseCommand):
         log('Starting the reindexation')
 
         if kwargs.get('with_stats', False):
+            if django_settings.ES_STATS_PARTITIONED:
+                raise CommandError('The stats are partitioned by month, '
+                                   'use index_stats to reindex them.')
             # Add the stats indexes back.
             _ALIASES.update(_STATS_ALIASES)
 
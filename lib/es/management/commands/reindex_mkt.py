@@ -7,7 +7,9 @@ reindex command that has args for AMO and MKT.
 """
 
 import datetime
+import itertools
 import logging
+import multiprocessing
 import os
 import sys
 import time
@@ -18,11 +20,12 @@ from celery import task
 
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
 
-from amo.utils import chunked, timestamp_index
+from amo.utils import cache_ns_key, chunked, timestamp_index
 from addons.models import Webapp  # To avoid circular import.
 from lib.es.models import Reindexing
-from lib.es.utils import database_flagged
+from lib.es.utils import BulkSizeTuner, database_flagged, Progress
 
 from mkt.webapps.models import WebappIndexer
 
@@ -86,41 +89,96 @@ def create_index(new_index, alias, settings):
     ES.health(new_index, wait_for_status='green', wait_for_relocating_shards=0)
 
 
-def index_webapp(ids, **kw):
-    index = kw.pop('index', None) or ALIAS
-    sys.stdout.write('Indexing %s apps' % len(ids))
-
+def extract_webapps(ids):
+    """Returns the documents of the apps in `ids`, highest id first."""
     qs = Webapp.indexing_transformer(Webapp.with_deleted.no_cache()
                                      .filter(id__in=ids))
+    objs = list(qs)
+    # Fetch the related objects of the whole chunk at once.
+    related = WebappIndexer.get_related(objs)
 
     docs = []
-    for obj in qs:
+    for obj in objs:
         try:
-            docs.append(WebappIndexer.extract_document(obj.id, obj=obj))
+            docs.append(WebappIndexer.extract_document(obj.id, obj=obj,
+                                                       related=related))
         except:
             sys.stdout.write('Failed to index obj: {0}'.format(obj.id))
+    # The ids are indexed from the highest down, so that the lowest id sent
+    # is the checkpoint to carry on from.
+    docs.sort(key=lambda doc: doc['id'], reverse=True)
+    return docs
 
-    WebappIndexer.bulk_index(docs, es=ES, index=index)
+
+def index_webapp(ids, **kw):
+    index = kw.pop('index', None) or ALIAS
+    sys.stdout.write('Indexing %s apps' % len(ids))
+    WebappIndexer.bulk_index(extract_webapps(ids), es=ES, index=index)
 
 
 @task(time_limit=time_limits['hard'], soft_time_limit=time_limits['soft'])
-def run_indexing(index):
+def run_indexing(index, processes=None):
     """Index the objects.
 
     - index: name of the index
+    - processes: how many processes extract the documents, defaults to
+      settings.ES_REINDEX_PROCESSES
 
-    Note: Our ES doc sizes are about 5k in size. Chunking by 100 sends ~500kb
-    of data to ES at a time.
-
-    TODO: Use celery chords here to parallelize these indexing chunks. This
-          requires celery 3 (bug 825938).
+    The documents of chunks of 100 apps are extracted in a pool of
+    processes, while this one sends them to ES in bulk requests sized by a
+    `BulkSizeTuner`. After every bulk request the lowest id sent is stored
+    in the `Reindexing` row, so that if this stops half way it can carry on
+    from there with `reindex_mkt --resume`.
 
     """
-    sys.stdout.write('Indexing apps into index: %s' % index)
+    sys.stdout.write('Indexing apps into index: %s\n' % index)
+    if processes is None:
+        processes = settings.ES_REINDEX_PROCESSES
 
+    reindexing = Reindexing.objects.get(new_index=index)
     qs = WebappIndexer.get_indexable()
-    for chunk in chunked(list(qs), 100):
-        index_webapp(chunk, index=index)
+    last_id = reindexing.get_checkpoint('webapp')
+    if last_id is not None:
+        sys.stdout.write('Resuming below id %s\n' % last_id)
+        qs = qs.filter(id__lt=last_id)
+    ids = list(qs)
+
+    chunks = chunked(ids, 100)
+    pool = None
+    if processes > 1:
+        # The workers must not share this process' database connection, they
+        # each open their own.
+        connection.close()
+        pool = multiprocessing.Pool(processes)
+        extracted = pool.imap(extract_webapps, chunks)
+    else:
+        extracted = itertools.imap(extract_webapps, chunks)
+
+    tuner = BulkSizeTuner(target=settings.ES_REINDEX_BULK_SECONDS)
+    progress = Progress(len(ids), stream=sys.stdout)
+
+    def flush(docs):
+        start = time.time()
+        WebappIndexer.bulk_index(docs, es=ES, index=index)
+        tuner.update(time.time() - start)
+        reindexing.checkpoint('webapp', docs[-1]['id'])
+        progress.update(len(docs))
+
+    try:
+        pending = []
+        for docs in extracted:
+            pending.extend(docs)
+            while len(pending) >= tuner.size:
+                # Flushing updates the size, so it's read once per batch.
+                size = tuner.size
+                batch, pending = pending[:size], pending[size:]
+                flush(batch)
+        if pending:
+            flush(pending)
+    finally:
+        if pool:
+            pool.terminate()
+    sys.stdout.write('\n')
 
 
 @task
@@ -169,6 +227,9 @@ def update_alias(new_index, old_index, alias, settings):
         )
     ES.update_aliases(dict(actions=actions))
 
+    # The cached search results may be for apps that weren't reindexed.
+    cache_ns_key('mkt-search', increment=True)
+
 
 @task
 def output_summary():
@@ -187,13 +248,23 @@ class Command(BaseCommand):
                     help=('Bypass the database flag that says '
                           'another indexation is ongoing'),
                     default=False),
+        make_option('--resume', action='store_true',
+                    help=('Carry on with the indexation that was stopped, '
+                          'from the last app it indexed'),
+                    default=False),
+        make_option('--processes', action='store', type='int',
+                    help=('How many processes extract the documents. '
+                          'Default: settings.ES_REINDEX_PROCESSES'),
+                    default=None),
     )
 
     def handle(self, *args, **kwargs):
-        """Set up reindexing tasks.
+        """Reindex all the apps.
 
-        Creates a Tasktree that creates a new indexes and indexes all objects,
-        then points the alias to this new index when finished.
+        Creates a new index and indexes all objects, then points the alias
+        to this new index when finished. This runs in this process, so that
+        the progress can be followed and so that an indexation which was
+        stopped can be carried on with --resume.
         """
         if not settings.MARKETPLACE:
             raise CommandError('This command affects only marketplace and '
@@ -201,21 +272,32 @@ class Command(BaseCommand):
 
         force = kwargs.get('force', False)
         prefix = kwargs.get('prefix', '')
+        resume = kwargs.get('resume', False)
+        processes = kwargs.get('processes')
 
-        if database_flagged() and not force:
-            raise CommandError('Indexation already occuring - use --force to '
-                               'bypass')
-        elif force:
-            unflag_database()
-
-        # The list of indexes that is currently aliased by `ALIAS`.
-        try:
-            aliases = ES.aliases(ALIAS).keys()
-        except pyelasticsearch.exceptions.ElasticHttpNotFoundError:
-            aliases = []
-        old_index = aliases[0] if aliases else None
-        # Create a new index, using the index name with a timestamp.
-        new_index = timestamp_index(prefix + ALIAS)
+        if resume:
+            try:
+                reindexing = Reindexing.objects.get(alias=ALIAS)
+            except Reindexing.DoesNotExist:
+                raise CommandError('There is no indexation to resume.')
+            new_index = reindexing.new_index
+            old_index = reindexing.old_index
+        else:
+            if database_flagged() and not force:
+                raise CommandError('Indexation already occuring - use '
+                                   '--force to bypass or --resume to carry '
+                                   'on with it')
+            elif force:
+                unflag_database()
+
+            # The list of indexes that is currently aliased by `ALIAS`.
+            try:
+                aliases = ES.aliases(ALIAS).keys()
+            except pyelasticsearch.exceptions.ElasticHttpNotFoundError:
+                aliases = []
+            old_index = aliases[0] if aliases else None
+            # Create a new index, using the index name with a timestamp.
+            new_index = timestamp_index(prefix + ALIAS)
 
         # See how the index is currently configured.
         if old_index:
@@ -231,41 +313,39 @@ class Command(BaseCommand):
                              settings.ES_DEFAULT_NUM_REPLICAS)
         num_shards = s.get('number_of_shards', settings.ES_DEFAULT_NUM_SHARDS)
 
-        # Flag the database.
-        chain = flag_database.si(new_index, old_index, ALIAS)
-
-        # Create the index and mapping.
-        #
-        # Note: We set num_replicas=0 here to decrease load while re-indexing.
-        # In a later step we increase it which results in a more efficient bulk
-        # copy in Elasticsearch.
-        # For ES < 0.90 we manually enable compression.
-        chain |= create_index.si(new_index, ALIAS, {
-            'analysis': WebappIndexer.get_analysis(),
-            'number_of_replicas': 0, 'number_of_shards': num_shards,
-            'store.compress.tv': True, 'store.compress.stored': True,
-            'refresh_interval': '-1'})
-
-        # Index all the things!
-        chain |= run_indexing.si(new_index)
-
-        # After indexing we optimize the index, adjust settings, and point the
-        # alias to the new index.
-        chain |= update_alias.si(new_index, old_index, ALIAS, {
-            'number_of_replicas': num_replicas, 'refresh_interval': '5s'})
-
-        # Unflag the database.
-        chain |= unflag_database.si()
-
-        # Delete the old index, if any.
-        if old_index:
-            chain |= delete_index.si(old_index)
-
-        chain |= output_summary.si()
-
-        self.stdout.write('\nNew index and indexing tasks all queued up.\n')
         os.environ['FORCE_INDEXING'] = '1'
         try:
-            chain.apply_async()
+            if not resume:
+                # Flag the database.
+                flag_database(new_index, old_index, ALIAS)
+
+                # Create the index and mapping.
+                #
+                # Note: We set num_replicas=0 here to decrease load while
+                # re-indexing. In a later step we increase it which results
+                # in a more efficient bulk copy in Elasticsearch.
+                # For ES < 0.90 we manually enable compression.
+                create_index(new_index, ALIAS, {
+                    'analysis': WebappIndexer.get_analysis(),
+                    'number_of_replicas': 0, 'number_of_shards': num_shards,
+                    'store.compress.tv': True, 'store.compress.stored': True,
+                    'refresh_interval': '-1'})
+
+            # Index all the things!
+            run_indexing(new_index, processes)
+
+            # After indexing we optimize the index, adjust settings, and
+            # point the alias to the new index.
+            update_alias(new_index, old_index, ALIAS, {
+                'number_of_replicas': num_replicas, 'refresh_interval': '5s'})
+
+            # Unflag the database.
+            unflag_database()
+
+            # Delete the old index, if any.
+            if old_index:
+                delete_index(old_index)
+
+            output_summary()
         finally:
             del os.environ['FORCE_INDEXING']
@@ -1,11 +1,45 @@
+import datetime
+
 from django.db import models
 
+import json_field
+
 
 class Reindexing(models.Model):
     start_date = models.DateTimeField()
     old_index = models.CharField(max_length=255, null=True)
     new_index = models.CharField(max_length=255)
     alias = models.CharField(max_length=255)
+    # The last id indexed for each mapping type, so that a reindexing which
+    # stopped half way can be resumed from there.
+    progress = json_field.JSONField(default={})
 
     class Meta:
         db_table = 'zadmin_reindexing'
+
+    def get_checkpoint(self, name):
+        """Returns the last id indexed for `name`, or None."""
+        return (self.progress or {}).get(name)
+
+    def checkpoint(self, name, last_id):
+        """Records that everything up to `last_id` is indexed for `name`."""
+        self.progress = dict(self.progress or {}, **{name: last_id})
+        self.save()
+
+
+class IndexChange(models.Model):
+    """
+    An object that was saved and has yet to be indexed, for
+    `manage.py index_changes` to index in bulk.
+    """
+    mapping_type = models.CharField(max_length=64)
+    object_id = models.PositiveIntegerField()
+    created = models.DateTimeField(default=datetime.datetime.now)
+
+    class Meta:
+        db_table = 'zadmin_index_changes'
+
+    @classmethod
+    def record(cls, mapping_type, ids):
+        cls.objects.bulk_create([cls(mapping_type=mapping_type, object_id=id_)
+                                 for id_ in ids])
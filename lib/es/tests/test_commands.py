@@ -2,9 +2,10 @@ import os
 import subprocess
 import sys
 import time
+from datetime import datetime, timedelta
 
 import mock
-from nose.tools import eq_
+from nose.tools import eq_, ok_
 from pyelasticsearch.exceptions import ElasticHttpNotFoundError
 
 from django.conf import settings
@@ -18,6 +19,9 @@ from amo.utils import urlparams
 from es.management.commands.reindex import (call_es, database_flagged,
                                             unflag_database)
 from es.management.commands.fixup_mkt_index import Command as FixupCommand
+from es.management.commands.index_changes import index_changes
+from es.management.commands.reindex_mkt import run_indexing
+from lib.es.models import IndexChange, Reindexing
 
 from mkt.site.fixtures import fixture
 from mkt.webapps.models import Webapp, WebappIndexer
@@ -243,3 +247,114 @@ class TestFixupCommand(amo.tests.ESTestCase):
 
         with self.assertRaises(ElasticHttpNotFoundError):
             self.es.get(self.index, self.doctype, self.app.id, fields='id')
+
+
+@mock.patch.object(WebappIndexer, 'bulk_index')
+class TestRunIndexing(amo.tests.TestCase):
+    fixtures = fixture('webapp_337141')
+
+    def setUp(self):
+        self.ids = sorted([337141] + [amo.tests.app_factory().id
+                                      for i in range(3)], reverse=True)
+        self.reindexing = Reindexing.objects.create(
+            alias='apps', new_index='apps-new', start_date=datetime.now())
+
+    def indexed(self, bulk_index):
+        return [doc['id'] for args, kw in bulk_index.call_args_list
+                for doc in args[0]]
+
+    def test_checkpoint(self, bulk_index):
+        run_indexing('apps-new', processes=1)
+        eq_(self.indexed(bulk_index), self.ids)
+        eq_(Reindexing.objects.get().get_checkpoint('webapp'), self.ids[-1])
+
+    def test_resume(self, bulk_index):
+        self.reindexing.checkpoint('webapp', self.ids[1])
+        run_indexing('apps-new', processes=1)
+        eq_(self.indexed(bulk_index), self.ids[2:])
+
+    def test_size_changes(self, bulk_index):
+        # It grows, then shrinks.
+        sizes = iter([2, 1, 5])
+
+        class Tuner(object):
+            size = 1
+
+            def __init__(self, target):
+                pass
+
+            def update(self, took):
+                self.size = next(sizes)
+
+        with mock.patch('es.management.commands.reindex_mkt.BulkSizeTuner',
+                        Tuner):
+            run_indexing('apps-new', processes=1)
+        # Every app is indexed once, in batches of the size at the time.
+        eq_(self.indexed(bulk_index), self.ids)
+        eq_([len(args[0]) for args, kw in bulk_index.call_args_list],
+            [1, 2, 1])
+
+    def test_failure(self, bulk_index):
+        bulk_index.side_effect = [None, Exception]
+        with mock.patch('es.management.commands.reindex_mkt.'
+                        'BulkSizeTuner') as tuner:
+            tuner.return_value.size = 1
+            with self.assertRaises(Exception):
+                run_indexing('apps-new', processes=1)
+        # Only the first app made it to the index.
+        eq_(Reindexing.objects.get().get_checkpoint('webapp'), self.ids[0])
+
+
+class TestIndexChanges(amo.tests.TestCase):
+
+    def setUp(self):
+        self.indexers = {'webapp': mock.Mock(), 'addons': mock.Mock()}
+        patcher = mock.patch('es.management.commands.index_changes.'
+                             'get_indexers', lambda: self.indexers)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_nothing(self):
+        eq_(index_changes(), 0)
+        ok_(not self.indexers['webapp'].called)
+
+    def test_coalesce(self):
+        IndexChange.record('webapp', [3, 1, 3])
+        IndexChange.record('webapp', [1, 2])
+        IndexChange.record('addons', [1])
+        eq_(index_changes(), 4)
+        self.indexers['webapp'].assert_called_once_with([1, 2, 3])
+        self.indexers['addons'].assert_called_once_with([1])
+        eq_(IndexChange.objects.count(), 0)
+
+    def test_chunks(self):
+        IndexChange.record('webapp', range(5))
+        index_changes(chunk_size=2)
+        eq_([args[0] for args, kw
+             in self.indexers['webapp'].call_args_list],
+            [[0, 1], [2, 3], [4]])
+
+    def test_failure(self):
+        IndexChange.record('webapp', [1, 2])
+        self.indexers['webapp'].side_effect = [None, Exception]
+        with self.assertRaises(Exception):
+            index_changes(chunk_size=1)
+        # The one that wasn't indexed is kept for the next run.
+        eq_(list(IndexChange.objects.values_list('object_id', flat=True)),
+            [2])
+
+    def test_unknown(self):
+        IndexChange.record('nope', [1])
+        eq_(index_changes(), 0)
+        eq_(IndexChange.objects.count(), 0)
+
+    @mock.patch('es.management.commands.index_changes.statsd')
+    def test_lag(self, statsd):
+        IndexChange.objects.create(
+            mapping_type='webapp', object_id=1,
+            created=datetime.now() - timedelta(seconds=30))
+        IndexChange.record('webapp', [1])
+        index_changes()
+        name, lag = statsd.timing.call_args[0]
+        eq_(name, 'es.index_changes.lag')
+        ok_(30000 <= lag < 60000, lag)
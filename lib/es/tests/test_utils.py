@@ -0,0 +1,123 @@
+import json
+from StringIO import StringIO
+
+import mock
+import pyelasticsearch
+from nose.tools import eq_, ok_
+
+import amo.tests
+from lib.es.utils import BulkIndexer, BulkRejected, BulkSizeTuner, Progress
+
+
+class TestBulkSizeTuner(amo.tests.TestCase):
+
+    def setUp(self):
+        self.tuner = BulkSizeTuner(size=100, target=2, minimum=10,
+                                   maximum=200)
+
+    def test_grow(self):
+        eq_(self.tuner.update(0.5), 150)
+        eq_(self.tuner.update(0.5), 200)
+        eq_(self.tuner.update(0.5), 200)
+
+    def test_keep(self):
+        eq_(self.tuner.update(1.5), 100)
+
+    def test_shrink(self):
+        eq_(self.tuner.update(3), 50)
+        eq_(self.tuner.update(3), 25)
+        eq_(self.tuner.update(3), 12)
+        eq_(self.tuner.update(3), 10)
+
+
+class TestProgress(amo.tests.TestCase):
+
+    @mock.patch('lib.es.utils.time.time')
+    def test_update(self, time):
+        time.return_value = 100
+        stream = StringIO()
+        progress = Progress(1000, stream=stream)
+        time.return_value = 110
+        progress.update(250)
+        eq_(progress.rate, 25)
+        eq_(progress.eta.seconds, 30)
+        ok_('250/1000 documents, 25.0 docs/s, ETA 0:00:30'
+            in stream.getvalue())
+
+
+def ok(index='a', id=1):
+    return {'index': {'_index': index, '_id': id, 'ok': True}}
+
+
+def rejected(index='a', id=1):
+    return {'index': {'_index': index, '_id': id,
+                      'error': 'EsRejectedExecutionException[rejected '
+                               'execution (queue capacity 50)]'}}
+
+
+@mock.patch('lib.es.utils.time.sleep')
+class TestBulkIndexer(amo.tests.TestCase):
+
+    def setUp(self):
+        self.es = mock.Mock()
+        self.es._send_request.return_value = {'items': []}
+
+    def sent(self):
+        """The (action, source) pairs of each request sent."""
+        requests = []
+        for args, kw in self.es._send_request.call_args_list:
+            lines = [json.loads(l) for l in args[2].splitlines()]
+            requests.append(zip(lines[::2], lines[1::2]))
+        return requests
+
+    def test_indices(self, sleep):
+        bulk = BulkIndexer(self.es, 'webapp', ['new', 'old'])
+        bulk.index({'id': 1, 'regions': set([2])}, 1)
+        bulk.flush()
+        eq_(self.sent(), [[
+            ({'index': {'_index': 'new', '_type': 'webapp', '_id': 1}},
+             {'id': 1, 'regions': [2]}),
+            ({'index': {'_index': 'old', '_type': 'webapp', '_id': 1}},
+             {'id': 1, 'regions': [2]})]])
+
+    def test_max_bytes(self, sleep):
+        bulk = BulkIndexer(self.es, 'webapp', ['new'], max_bytes=250)
+        for i in range(5):
+            bulk.index({'id': i, 'name': 'x' * 20}, i)
+        bulk.flush()
+        eq_([len(request) for request in self.sent()], [2, 2, 1])
+
+    def test_nothing(self, sleep):
+        BulkIndexer(self.es, 'webapp', ['new']).flush()
+        ok_(not self.es._send_request.called)
+
+    def test_retry_rejected(self, sleep):
+        self.es._send_request.side_effect = [
+            {'items': [ok(id=1), rejected(id=2)]},
+            {'items': [ok(id=2)]}]
+        bulk = BulkIndexer(self.es, 'webapp', ['a'])
+        bulk.index({'id': 1}, 1)
+        bulk.index({'id': 2}, 2)
+        bulk.flush()
+        eq_([[source['id'] for action, source in request]
+             for request in self.sent()], [[1, 2], [2]])
+        sleep.assert_called_with(0.5)
+
+    def test_give_up(self, sleep):
+        self.es._send_request.return_value = {'items': [rejected()]}
+        bulk = BulkIndexer(self.es, 'webapp', ['a'], retries=2)
+        bulk.index({'id': 1}, 1)
+        with self.assertRaises(BulkRejected):
+            bulk.flush()
+        eq_(self.es._send_request.call_count, 3)
+        eq_([args[0] for args, kw in sleep.call_args_list], [0.5, 1])
+
+    def test_queue_full(self, sleep):
+        es = mock.Mock(spec=pyelasticsearch.ElasticSearch)
+        es.send_request.side_effect = [
+            pyelasticsearch.exceptions.ElasticHttpError(429, 'Too many'),
+            {'items': [ok()]}]
+        bulk = BulkIndexer(es, 'webapp', ['a'])
+        bulk.index({'id': 1}, 1)
+        bulk.flush()
+        eq_(es.send_request.call_count, 2)
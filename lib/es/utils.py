@@ -1,8 +1,23 @@
+import datetime
+import decimal
+import json
+import logging
 import os
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import CommandError
+
+import pyelasticsearch
+import pyes.exceptions
 
 import amo.search
+from amo.utils import JSONEncoder
 from .models import Reindexing
-from django.core.management.base import CommandError
+
+
+log = logging.getLogger('z.elasticsearch')
 
 
 def get_indices(index):
@@ -29,13 +44,108 @@ def index_objects(ids, model, search, index=None, transforms=None):
     for t in transforms:
         qs = qs.transform(t)
 
+    bulk = BulkIndexer(amo.search.get_es(), model._meta.db_table, indices)
     for ob in qs:
-        data = search.extract(ob)
+        bulk.index(search.extract(ob), ob.id)
+    bulk.flush()
 
-        for index in indices:
-            model.index(data, bulk=True, id=ob.id, index=index)
 
-    amo.search.get_es().flush_bulk(forced=True)
+class BulkRejected(Exception):
+    """ES kept rejecting documents because its bulk queue was full."""
+
+
+class BulkEncoder(JSONEncoder):
+    """Encodes what pyes' encoder did that ours doesn't."""
+
+    def default(self, obj):
+        if isinstance(obj, (set, frozenset)):
+            return list(obj)
+        if isinstance(obj, decimal.Decimal):
+            return float(obj)
+        return super(BulkEncoder, self).default(obj)
+
+
+class BulkIndexer(object):
+    """
+    Streams documents to ES in bulk requests.
+
+    Each document is serialized once and written to every index in
+    `indices`, and the request is sent as soon as it would grow past
+    `max_bytes` rather than after a number of documents. When ES rejects
+    documents because its bulk queue is full, they are sent again after a
+    pause which doubles every time, and `BulkRejected` is raised if they
+    are still rejected after `retries` tries. Sending blocks, so indexing
+    can't run ahead of what ES takes.
+
+    `es` is either a pyes or a pyelasticsearch connection.
+    """
+
+    def __init__(self, es, doc_type, indices, max_bytes=None, retries=None,
+                 backoff=0.5):
+        self.es = es
+        self.doc_type = doc_type
+        self.indices = indices
+        self.max_bytes = max_bytes or settings.ES_BULK_MAX_BYTES
+        self.retries = (retries if retries is not None
+                        else settings.ES_BULK_RETRIES)
+        self.backoff = backoff
+        self.pending = []
+        self.size = 0
+
+    def index(self, doc, id):
+        source = json.dumps(doc, cls=BulkEncoder)
+        for index in self.indices:
+            action = json.dumps({'index': {'_index': index,
+                                           '_type': self.doc_type,
+                                           '_id': id}})
+            size = len(action) + len(source) + 2
+            if self.pending and self.size + size > self.max_bytes:
+                self.flush()
+            self.pending.append((action, source))
+            self.size += size
+
+    def flush(self):
+        pending, self.pending, self.size = self.pending, [], 0
+        backoff = self.backoff
+        for attempt in range(self.retries + 1):
+            if not pending:
+                return
+            if attempt:
+                log.warning('ES rejected %s documents, trying again in %ss.'
+                            % (len(pending), backoff))
+                time.sleep(backoff)
+                backoff *= 2
+            pending = self.send(pending)
+        raise BulkRejected('ES rejected %s documents %s times.'
+                           % (len(pending), self.retries + 1))
+
+    def send(self, pending):
+        """Sends `pending` and returns the (action, source) it rejected."""
+        body = ''.join('%s\n%s\n' % pair for pair in pending)
+        try:
+            if isinstance(self.es, pyelasticsearch.ElasticSearch):
+                res = self.es.send_request('POST', ['_bulk'], body,
+                                           encode_body=False)
+            else:
+                res = self.es._send_request('POST', '/_bulk', body)
+        except (pyelasticsearch.exceptions.ElasticHttpError,
+                pyes.exceptions.ElasticSearchException), e:
+            status = getattr(e, 'status_code', getattr(e, 'status', None))
+            if status in (429, 503):
+                # The whole request was turned away.
+                return pending
+            raise
+
+        rejected = []
+        for pair, item in zip(pending, res.get('items', [])):
+            result = item.values()[0]
+            error = result.get('error')
+            if (result.get('status') == 429 or
+                (error and 'EsRejectedExecutionException' in error)):
+                rejected.append(pair)
+            elif error:
+                log.error('Indexing %s failed: %s' % (pair[0], error))
+        return rejected
 
 
 def database_flagged():
@@ -52,3 +162,53 @@ def raise_if_reindex_in_progress():
     if database_flagged() and 'FORCE_INDEXING' not in os.environ:
         raise CommandError("Indexation already occuring. Add a FORCE_INDEXING "
                            "variable in the environ to force it")
+
+
+class BulkSizeTuner(object):
+    """
+    Picks how many documents to send in each bulk request from how long ES
+    took to answer the previous one: halve the size when a request takes
+    longer than `target` seconds, grow it by half when it takes less than
+    half of that.
+    """
+
+    def __init__(self, size=100, target=2, minimum=10, maximum=5000):
+        self.size = size
+        self.target = target
+        self.minimum = minimum
+        self.maximum = maximum
+
+    def update(self, seconds):
+        if seconds > self.target:
+            self.size = max(self.minimum, self.size // 2)
+        elif seconds < self.target / 2.0:
+            self.size = min(self.maximum, self.size + self.size // 2)
+        return self.size
+
+
+class Progress(object):
+    """Prints how many documents are indexed, how fast, and the ETA."""
+
+    def __init__(self, total, stream=sys.stdout):
+        self.total = total
+        self.done = 0
+        self.stream = stream
+        self.start = time.time()
+
+    @property
+    def rate(self):
+        elapsed = time.time() - self.start
+        return self.done / elapsed if elapsed else 0
+
+    @property
+    def eta(self):
+        rate = self.rate
+        if not rate:
+            return None
+        return datetime.timedelta(seconds=int((self.total - self.done) / rate))
+
+    def update(self, count):
+        self.done += count
+        self.stream.write('\rIndexed %d/%d documents, %.1f docs/s, ETA %s '
+                          % (self.done, self.total, self.rate, self.eta))
+        self.stream.flush()
@@ -0,0 +1,104 @@
+"""
+Times the recommendations for generated add-ons with the pairwise loop of
+`similarity` that the `recs` cron used to run, and with `matrix.similar`::
+
+    python lib/recommend/bench.py 10000 50000 100000
+
+There are about as many collections as add-ons, the popular ones holding
+most of the add-ons, and every add-on is in four collections or more like
+the ones `recs` reads. The loop takes hours for the larger numbers, so only
+its first --sample add-ons are timed and the total is extrapolated from
+them. The recommendations of those add-ons are checked against the matrix ones.
+"""
+import optparse
+import os
+import random
+import site
+import time
+
+site.addsitedir(os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                             '..')))
+
+import recommend
+from recommend import matrix
+
+
+def generate(number):
+    """Returns a dict of {addon: [collection]} of `number` add-ons."""
+    collections = range(1, number + 1)
+    # Collection i is picked about 1/i as often as the first one.
+    weights = [1. / i for i in collections]
+    total = sum(weights)
+    cumulative, running = [], 0
+    for weight in weights:
+        running += weight / total
+        cumulative.append(running)
+
+    def pick():
+        x = random.random()
+        lo, hi = 0, len(cumulative) - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if cumulative[mid] < x:
+                lo = mid + 1
+            else:
+                hi = mid
+        return collections[lo]
+
+    addons = {}
+    for addon in range(1, number + 1):
+        size = 4 + int(random.expovariate(1 / 6.))
+        addons[addon] = sorted(set(pick() for i in range(size)))
+    return addons
+
+
+def loop(addons, sample):
+    """The `similarity` loop, for the first `sample` add-ons."""
+    sim = recommend.similarity  # Locals are faster.
+    sims = {}
+    for addon in sorted(addons)[:sample]:
+        collections = addons[addon]
+        xs = [(-sim(collections, cs), other)
+              for other, cs in addons.iteritems() if other != addon]
+        sims[addon] = [(other, -score) for score, other in sorted(xs)[:10]]
+    return sims
+
+
+def main():
+    parser = optparse.OptionParser(usage=__doc__.strip())
+    parser.add_option('--sample', type='int', default=200,
+                      help='add-ons to time the loop with [%default]')
+    parser.add_option('--processes', type='int', default=1,
+                      help='processes to calculate the matrix with '
+                           '[%default]')
+    parser.add_option('--random-seed', type='int', default=0,
+                      help='generate the same add-ons as another run')
+    options, numbers = parser.parse_args()
+    numbers = map(int, numbers or [10000, 50000, 100000])
+
+    print 'similarity from %s' % recommend.similarity.__module__
+    for number in numbers:
+        random.seed(options.random_seed)
+        addons = generate(number)
+
+        start = time.time()
+        sims = {}
+        for block in matrix.similar(addons, processes=options.processes):
+            sims.update(block)
+        took = time.time() - start
+
+        sample = min(options.sample, number)
+        start = time.time()
+        expected = loop(addons, sample)
+        loop_took = (time.time() - start) * number / sample
+
+        mismatches = sum(1 for addon, others in expected.items()
+                         if sims[addon] != others)
+        print ('%s add-ons: loop %.1fs (extrapolated from %s), matrix %.1fs '
+               '(%s processes), %.0fx faster, %s mismatches'
+               % (number, loop_took, sample, took, options.processes,
+                  loop_took / took, mismatches))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+"""
+Calculates the same similarities as `similarity`, for all the add-ons at once
+instead of one pair at a time.
+
+The collections of the add-ons make a sparse incidence matrix `X`, with a row
+for each add-on and a 1 in the column of every collection it is in. The
+symmetric difference of two add-ons is ``len(a) + len(b) - 2 * len(a & b)``,
+and the intersections of a block of add-ons with all of the add-ons are the
+one sparse product ``X[block] * X.T``. `numpy.argpartition` then picks the
+smallest differences of every row without sorting the rows, with ties broken
+by add-on id like `similarity` does.
+
+The blocks are independent, so they can be spread over a process pool.
+"""
+import itertools
+import multiprocessing
+
+import numpy
+from scipy import sparse
+
+
+# The rows of a block are chosen so that its dense differences have about this
+# many cells, 16MB of them.
+BLOCK_CELLS = 1 << 22
+
+# The (X, X.T, row lengths) of the add-ons being compared, in every process.
+_matrix = None
+
+# The symmetric difference of an add-on with itself, so it's never picked.
+_MAX = numpy.iinfo(numpy.int32).max
+
+
+def incidence_matrix(addons):
+    """
+    Returns the sorted add-on ids of `addons`, a dict of {addon: [collection]},
+    and the CSR matrix of their collections, a row for each of the ids.
+    """
+    ids = numpy.array(sorted(addons), dtype=numpy.int64)
+    lengths = numpy.array([len(addons[i]) for i in ids], dtype=numpy.int64)
+    collections = numpy.fromiter(
+        itertools.chain.from_iterable(addons[i] for i in ids),
+        dtype=numpy.int64, count=lengths.sum())
+    # Number the collections from 0 to use them as columns.
+    columns, indices = numpy.unique(collections, return_inverse=True)
+    indptr = numpy.concatenate([[0], numpy.cumsum(lengths)])
+    X = sparse.csr_matrix(
+        (numpy.ones(len(indices), dtype=numpy.int32), indices, indptr),
+        shape=(len(ids), len(columns)))
+    # An add-on listed twice in a collection is only in it once.
+    X.sum_duplicates()
+    X.data[:] = 1
+    return ids, X
+
+
+def _init(matrix):
+    global _matrix
+    _matrix = matrix
+
+
+def _diffs(rows):
+    """
+    Returns the symmetric differences of the add-ons of `rows` with all of the
+    add-ons, with the most there can be for an add-on with itself.
+    """
+    X, XT, lengths = _matrix
+    diffs = (lengths[rows, None] + lengths[None, :] -
+             2 * (X[rows] * XT).toarray())
+    # An add-on is not a recommendation for itself.
+    diffs[numpy.arange(len(rows)), rows] = _MAX
+    return diffs
+
+
+def _keys(diffs, columns):
+    """
+    Returns the `diffs` and `columns` of each row as one int64 to order them
+    by, by difference and then by column. The columns are rows of the sorted
+    add-on ids, so ties go to the smallest add-on id.
+    """
+    return (diffs.astype(numpy.int64) * (columns.max() + 1) +
+            columns.astype(numpy.int64))
+
+
+def _pick(keys, top):
+    """Returns the columns of the `top` smallest `keys` of each row, sorted."""
+    rows = numpy.arange(len(keys))[:, None]
+    best = numpy.argpartition(keys, top - 1, axis=1)[:, :top]
+    return best[rows, numpy.argsort(keys[rows, best], axis=1)]
+
+
+def _top(diffs, top):
+    """
+    Returns the columns of the `top` smallest `diffs` of each row, and those
+    diffs, by difference and then by add-on id.
+    """
+    rows = numpy.arange(len(diffs))[:, None]
+    columns = numpy.arange(diffs.shape[1])[None, :]
+    best = _pick(_keys(diffs, columns), top)
+    return best, diffs[rows, best]
+
+
+def _block(args):
+    """
+    Returns the offsets and symmetric differences of the `top` add-ons most
+    similar to each of the add-ons from `start` to `stop`, best first.
+    """
+    start, stop, top = args
+    best, best_diffs = _top(_diffs(numpy.arange(start, stop)), top)
+    return start, best, best_diffs
+
+
+def similar(addons, top=10, processes=1):
+    """
+    Yields dicts of {addon: [(other addon, similarity)]} with the `top` other
+    add-ons most similar to every add-on of `addons`, a dict of
+    {addon: [collection]}, best first. A dict is yielded for every block, with
+    the blocks calculated by a pool of `processes` when it is more than one.
+    """
+    ids, X = incidence_matrix(addons)
+    top = min(top, len(ids) - 1)
+    if top < 1:
+        return
+
+    matrix = (X, X.T.tocsr(), numpy.diff(X.indptr).astype(numpy.int32))
+    size = max(1, BLOCK_CELLS // len(ids))
+    blocks = [(start, min(start + size, len(ids)), top)
+              for start in range(0, len(ids), size)]
+
+    pool = None
+    if processes > 1:
+        pool = multiprocessing.Pool(processes, _init, [matrix])
+        results = pool.imap(_block, blocks)
+    else:
+        _init(matrix)
+        results = (_block(block) for block in blocks)
+
+    try:
+        for start, best, diffs in results:
+            yield dict(zip(ids[start:start + len(best)].tolist(),
+                           _scores(ids, best, diffs)))
+    finally:
+        _init(None)
+        if pool:
+            pool.terminate()
+
+
+def _scores(ids, best, diffs):
+    """Returns [(other addon, similarity)] for each row of `best`."""
+    others = ids[best].tolist()
+    scores = (1. / (1. + diffs)).tolist()
+    return [zip(others[i], scores[i]) for i in range(len(others))]
+
+
+def _order(recommendation):
+    other, score = recommendation
+    return -score, other
+
+
+def _after(x, y):
+    """Whether recommendation `x` comes after `y`, by score and then id."""
+    other, score = x
+    return score < y[1] - 1e-6 or (abs(score - y[1]) < 1e-6 and other > y[0])
+
+
+def _same(xs, ys):
+    return len(xs) == len(ys) and all(x == y and abs(s - t) < 1e-6
+                                      for (x, s), (y, t) in zip(xs, ys))
+
+
+def update(addons, changed, current, top=10):
+    """
+    Returns the lists of `current`, the {addon: [(other addon, similarity)]}
+    calculated before the collections of the `changed` add-ons changed to the
+    ones in `addons`, that are different now. The add-ons of `current` not in
+    `addons` anymore get empty lists.
+
+    The changed add-ons are compared with all of the add-ons, which gives
+    their own lists and how similar they are to every other add-on. The list
+    of another add-on is patched with those when what it loses to them can
+    only be taken by changed add-ons, and is calculated again otherwise.
+    """
+    ids, X = incidence_matrix(addons)
+    index = dict((addon, row) for row, addon in enumerate(ids.tolist()))
+    changed = set(changed)
+    updated = dict((addon, []) for addon in current if addon not in index)
+    top = min(top, len(ids) - 1)
+    if top < 1:
+        updated.update((addon, []) for addon in index if current.get(addon))
+        return updated
+
+    _init((X, X.T.tocsr(), numpy.diff(X.indptr).astype(numpy.int32)))
+    try:
+        size = max(1, BLOCK_CELLS // len(ids))
+        rows = numpy.array(sorted(index[addon] for addon in changed
+                                  if addon in index), dtype=numpy.int64)
+        # The rows and differences of the `top` changed add-ons most similar
+        # to each add-on.
+        columns = numpy.zeros((len(ids), 0), dtype=numpy.int64)
+        column_diffs = numpy.zeros((len(ids), 0), dtype=numpy.int32)
+        for start in range(0, len(rows), size):
+            block = rows[start:start + size]
+            diffs = _diffs(block)
+            best, best_diffs = _top(diffs, top)
+            updated.update(zip(ids[block].tolist(),
+                               _scores(ids, best, best_diffs)))
+
+            columns = numpy.hstack(
+                [columns, numpy.tile(block, (len(ids), 1))])
+            column_diffs = numpy.hstack([column_diffs, diffs.T])
+            if columns.shape[1] > top:
+                best = _pick(_keys(column_diffs, columns), top)
+                everything = numpy.arange(len(ids))[:, None]
+                columns = columns[everything, best]
+                column_diffs = column_diffs[everything, best]
+
+        candidates = _scores(ids, columns, column_diffs)
+        again = []
+        for row, addon in enumerate(ids.tolist()):
+            if addon in changed:
+                continue
+            before = sorted(current.get(addon, []), key=_order)
+            kept = [(other, score) for other, score in before
+                    if other not in changed and other in index]
+            now = sorted(kept + candidates[row], key=_order)[:top]
+            # The add-ons that weren't on the list come after the last one,
+            # but unless it's full we don't know which they are.
+            if (len(before) < top or len(now) < top or
+                _after(now[-1], before[-1])):
+                again.append(row)
+            elif not _same(now, before):
+                updated[addon] = now
+
+        again = numpy.array(again, dtype=numpy.int64)
+        for start in range(0, len(again), size):
+            block = again[start:start + size]
+            best, best_diffs = _top(_diffs(block), top)
+            updated.update(zip(ids[block].tolist(),
+                               _scores(ids, best, best_diffs)))
+    finally:
+        _init(None)
+    return updated
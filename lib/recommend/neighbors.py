@@ -0,0 +1,173 @@
+"""
+The recommended add-ons of every add-on in one file, which the processes
+serving the discovery pane map into memory to recommend add-ons for a set of
+installed ones without a query.
+
+The file starts with a line of JSON telling where its arrays are:
+
+* `addons`, the sorted ids of the add-ons with recommendations, and a CSR
+  of what is recommended for them, `indptr`, `others` and `scores`, like in
+  `addon_recommendations`.
+* For every app, the sorted ids of the add-ons that can be recommended for
+  it, `support_addons`, with the `support_min` and `support_max` version ints
+  they support like in `appsupport`.
+
+The file is replaced as a whole, so a process keeps using the arrays it
+mapped until it opens the new one.
+"""
+import json
+import mmap
+import os
+import tempfile
+import time
+
+import numpy
+
+
+VERSION = 1
+
+# The arrays of the file and their types.
+ARRAYS = [('addons', '<u4'), ('indptr', '<u4'), ('others', '<u4'),
+          ('scores', '<f4'), ('support_addons', '<u4'),
+          ('support_min', '<i8'), ('support_max', '<i8')]
+
+# Stands in for the unknown min and max versions, which nothing is within.
+NO_MIN = numpy.iinfo(numpy.int64).max
+NO_MAX = -1
+
+
+def write(path, recs, support):
+    """
+    Writes `recs`, {addon: [(other addon, score)]}, and `support`,
+    {app: [(addon, min version int, max version int)]}, to a file at `path`.
+    """
+    addons = sorted(recs)
+    arrays = {
+        'addons': addons,
+        'indptr': [0] + list(numpy.cumsum([len(recs[a]) for a in addons])),
+        'others': [other for a in addons for other, score in recs[a]],
+        'scores': [score for a in addons for other, score in recs[a]],
+        'support_addons': [], 'support_min': [], 'support_max': []}
+    apps = {}
+    for app, rows in sorted(support.items()):
+        start = len(arrays['support_addons'])
+        for addon, min_, max_ in sorted(rows):
+            arrays['support_addons'].append(addon)
+            arrays['support_min'].append(NO_MIN if min_ is None else min_)
+            arrays['support_max'].append(NO_MAX if max_ is None else max_)
+        apps[app] = (start, len(arrays['support_addons']))
+
+    data = [numpy.array(arrays[name], dtype=dtype).tostring()
+            for name, dtype in ARRAYS]
+    header = {'version': VERSION, 'apps': apps, 'arrays': {}}
+    # Every array starts on a multiple of 8 after a header of 4096 bytes at
+    # most, padded with spaces.
+    offset = 4096
+    for (name, dtype), bytes in zip(ARRAYS, data):
+        count = len(bytes) // numpy.dtype(dtype).itemsize
+        header['arrays'][name] = (offset, count)
+        offset += len(bytes) + -len(bytes) % 8
+    header = json.dumps(header)
+    if len(header) >= 4096:
+        raise ValueError('Too many apps for the header.')
+
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, 'wb') as f:
+        f.write(header.ljust(4095) + '\n')
+        for bytes in data:
+            f.write(bytes + '\0' * (-len(bytes) % 8))
+    os.chmod(tmp, 0644)
+    os.rename(tmp, path)
+
+
+class Neighbors(object):
+    """The arrays of a file from `write`."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            header = json.loads(f.readline())
+            if header['version'] != VERSION:
+                raise ValueError('%s is version %s, not %s.'
+                                 % (path, header['version'], VERSION))
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.apps = dict((int(app), slice(*span))
+                         for app, span in header['apps'].items())
+        for name, dtype in ARRAYS:
+            offset, count = header['arrays'][name]
+            if count:
+                array = numpy.frombuffer(self.mmap, dtype, count, offset)
+            else:
+                array = numpy.zeros(0, dtype)
+            setattr(self, name, array)
+
+    def supported(self, ids, app, version_int, strict=True):
+        """
+        Returns which of the sorted `ids` can be recommended for `version_int`
+        of `app`, the way `Collection.get_recs_from_ids` filters them.
+        """
+        span = self.apps.get(app)
+        addons = self.support_addons[span or slice(0)]
+        if not len(addons):
+            return numpy.zeros(len(ids), dtype=bool)
+        rows = numpy.minimum(numpy.searchsorted(addons, ids), len(addons) - 1)
+        ok = ((addons[rows] == ids) &
+              (self.support_min[span][rows] <= version_int))
+        if strict:
+            ok &= self.support_max[span][rows] >= version_int
+        return ok
+
+    def recommend(self, installed, app, version_int, strict=True):
+        """
+        Returns the ids of the add-ons recommended for the `installed` ones,
+        best first, like `RecommendedCollection.build_recs` but only with the
+        add-ons that support `version_int` of `app`.
+        """
+        installed = numpy.unique(numpy.asarray(installed, dtype=numpy.uint32))
+        rows = numpy.searchsorted(self.addons, installed)
+        found = rows < len(self.addons)
+        found[found] = self.addons[rows[found]] == installed[found]
+        if not found.any():
+            return []
+
+        starts = self.indptr[rows[found]].astype(numpy.int64)
+        lengths = self.indptr[rows[found] + 1] - starts
+        # The positions of all their recommendations, start to stop for each.
+        positions = (numpy.arange(lengths.sum()) +
+                     numpy.repeat(starts - numpy.cumsum(lengths) + lengths,
+                                  lengths))
+        others, scores = self.others[positions], self.scores[positions]
+        # The total score of every add-on recommended for any of them.
+        ids, inverse = numpy.unique(others, return_inverse=True)
+        totals = numpy.bincount(inverse, weights=scores)
+
+        keep = ~numpy.in1d(ids, installed)
+        keep &= self.supported(ids, app, version_int, strict)
+        ids, totals = ids[keep], totals[keep]
+        return ids[numpy.lexsort((ids, -totals))].tolist()
+
+
+class NeighborsFile(object):
+    """
+    The `Neighbors` at `path`, or None when there is no file there, opened
+    again when it changes. That is checked every `check` seconds at most.
+    """
+
+    def __init__(self, path, check=60):
+        self.path = path
+        self.check = check
+        self.checked = None
+        self.mtime = None
+        self.neighbors = None
+
+    def get(self):
+        now = time.time()
+        if self.checked is None or now - self.checked >= self.check:
+            self.checked = now
+            try:
+                mtime = os.stat(self.path).st_mtime
+            except OSError:
+                mtime = None
+            if mtime != self.mtime:
+                self.neighbors = Neighbors(self.path) if mtime else None
+                self.mtime = mtime
+        return self.neighbors
@@ -1,7 +1,12 @@
+import os
+import tempfile
 from array import array
+
+import mock
 from nose.tools import eq_
 
 import recommend
+from recommend import matrix, neighbors
 
 
 def test_symmetric_diff_count():
@@ -31,3 +36,98 @@ def test_symmetric_diff_count():
 # The algorithm is in flux so this is minimal coverage.
 def test_similarity():
     eq_(1/2., recommend.similarity([1], [1, 2]))
+
+
+def test_similar():
+    addons = {1: [1, 2, 3], 2: [1, 2], 3: [4, 5], 4: [1, 2, 3, 4], 5: [3, 3]}
+    sims = {}
+    for block in matrix.similar(addons, top=3):
+        sims.update(block)
+    eq_(sorted(sims), sorted(addons))
+    for addon, others in sims.items():
+        # The best, other than the add-on, as the pairwise loop finds them.
+        xs = sorted((-recommend.similarity(sorted(set(addons[addon])),
+                                           sorted(set(addons[other]))), other)
+                    for other in addons if other != addon)
+        eq_(others, [(other, -score) for score, other in xs[:3]])
+
+
+def test_similar_ties():
+    # 1 is the most similar to all of them, and the others are tied.
+    addons = dict((i, [1, i]) for i in range(20, 0, -1))
+    sims = {}
+    for block in matrix.similar(addons, top=3):
+        sims.update(block)
+    eq_([o for o, s in sims[1]], [2, 3, 4])
+    eq_([o for o, s in sims[3]], [1, 2, 4])
+    eq_([o for o, s in sims[20]], [1, 2, 3])
+
+
+def test_similar_blocks():
+    addons = dict((i, [i % 7, i % 5 + 10, i % 3 + 20]) for i in range(50))
+    sims = {}
+    for block in matrix.similar(addons):
+        sims.update(block)
+    with mock.patch.object(matrix, 'BLOCK_CELLS', 1000):
+        blocks = list(matrix.similar(addons, processes=2))
+    eq_(len(blocks), 3)
+    eq_(dict(kv for block in blocks for kv in block.items()), sims)
+
+
+def test_similar_one_addon():
+    eq_(list(matrix.similar({1: [1, 2]})), [])
+
+
+def test_update():
+    addons = dict((i, [i % 7, i % 5 + 10, i % 3 + 20, i]) for i in range(40))
+    current = {}
+    for block in matrix.similar(addons):
+        current.update(block)
+
+    # 3 is in new collections, 4 is gone and 40 is new.
+    addons[3] = [1, 11, 21, 41]
+    del addons[4]
+    addons[40] = [0, 10, 20, 3]
+    updated = matrix.update(addons, [3, 4, 40], current)
+    eq_(updated[4], [])
+    current.update(updated)
+    del current[4]
+
+    expected = {}
+    for block in matrix.similar(addons):
+        expected.update(block)
+    eq_(sorted(current), sorted(expected))
+    for addon, others in expected.items():
+        eq_([(o, round(s, 6)) for o, s in current[addon]],
+            [(o, round(s, 6)) for o, s in others])
+
+
+def test_neighbors():
+    recs = {1: [(2, .5), (3, .25)], 2: [(1, .5), (4, .125)], 3: [(4, .5)],
+            5: []}
+    # 2 has no max version and 4 no min version.
+    support = {1: [(1, 10, 20), (2, 10, None), (3, 10, 20), (4, None, 20)],
+               59: [(3, 1, 2)]}
+    path = tempfile.mktemp()
+    neighbors.write(path, recs, support)
+    try:
+        model = neighbors.Neighbors(path)
+        eq_(model.recommend([1], 1, 15), [3])
+        eq_(model.recommend([1], 1, 15, strict=False), [2, 3])
+        eq_(model.recommend([1, 3, 9], 1, 15, strict=False), [2])
+        eq_(model.recommend([2, 3], 59, 1), [])
+        eq_(model.recommend([1], 59, 1), [3])
+        eq_(model.recommend([1], 18, 15), [])
+        eq_(model.recommend([5, 6], 1, 15), [])
+    finally:
+        os.remove(path)
+
+
+def test_neighbors_file():
+    path = tempfile.mktemp()
+    f = neighbors.NeighborsFile(path, check=0)
+    eq_(f.get(), None)
+    neighbors.write(path, {1: [(2, .5)]}, {1: [(2, 1, 1)]})
+    eq_(f.get().recommend([1], 1, 1), [2])
+    os.remove(path)
+    eq_(f.get(), None)
@@ -103,6 +103,51 @@ SERVICES_DATABASE = {
     'HOST': '',
 }
 
+# The options for the sqlalchemy QueuePool each service checks its
+# SERVICES_DATABASE connections out of. Any of them can be overridden for one
+# service in SERVICES_DATABASE_POOLS, which is keyed on the service: update,
+# verify or theme_update. For example, {'update': {'pool_size': 20}}.
+SERVICES_DATABASE_POOL = {
+    'pool_size': 5,
+    'max_overflow': 10,
+    'recycle': 300,
+    'timeout': 30,
+}
+SERVICES_DATABASE_POOLS = {}
+
+# The DB-API module the services connect to SERVICES_DATABASE with: MySQLdb,
+# or pymysql when they are served by gevent workers (see
+# services/gunicorn_async.py), so that waiting on MySQL doesn't block the
+# other requests in the process.
+SERVICES_DATABASE_DRIVER = 'MySQLdb'
+
+# Whether the services run their fixed queries as server side prepared
+# statements, so that MySQL only has to parse them once per connection.
+SERVICES_DATABASE_PREPARE = False
+
+# Whether services/update.py should answer update pings from an in-process
+# index of add-on versions and files, only querying SERVICES_DATABASE when an
+# add-on isn't in it. The index is patched with the rows modified every
+# SERVICES_UPDATE_INDEX_REFRESH seconds and rebuilt from scratch every
+# SERVICES_UPDATE_INDEX_REBUILD seconds.
+SERVICES_UPDATE_INDEX = False
+SERVICES_UPDATE_INDEX_REFRESH = 60
+SERVICES_UPDATE_INDEX_REBUILD = 60 * 60
+
+# How many rendered update responses services/update.py keeps in memory, and
+# for how many seconds. Set the size to 0 to turn it off.
+SERVICES_RDF_CACHE_SIZE = 10000
+SERVICES_RDF_CACHE_TIMEOUT = 5 * 60
+
+# How many rendered theme update responses, and base64 encoded theme icons,
+# services/theme_update.py keeps in memory, and for how many seconds.
+SERVICES_THEME_CACHE_SIZE = 10000
+SERVICES_THEME_CACHE_TIMEOUT = 60 * 60
+
+# How many rendered plugin finder responses services/pfs.py keeps in memory.
+# The responses only change with a deploy, so they don't expire.
+SERVICES_PFS_CACHE_SIZE = 5000
+
 DATABASE_ROUTERS = ('multidb.PinningMasterSlaveRouter',)
 
 # For use django-mysql-pool backend.
@@ -361,6 +406,7 @@ MIDDLEWARE_CLASSES = (
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'commonware.log.ThreadRequestMiddleware',
     'apps.search.middleware.ElasticsearchExceptionMiddleware',
+    'amo.middleware.SearchViewMiddleware',
     'session_csrf.CsrfMiddleware',
 
     # This should come after authentication middleware
@@ -1349,6 +1395,15 @@ DEFAULT_SUGGESTED_CONTRIBUTION = 5
 # Path to `ps`.
 PS_BIN = '/bin/ps'
 
+# How many processes the `recs` cron calculates the recommendations with.
+RECS_PROCESSES = 1
+
+# Where the recs crons write the recommendations for the discovery pane to
+# load, see lib/recommend/neighbors.py, and how often in seconds the
+# processes check for a new file there.
+RECS_NEIGHBORS_PATH = NETAPP_STORAGE + '/recs-neighbors'
+RECS_NEIGHBORS_CHECK = 60
+
 BLOCKLIST_COOKIE = 'BLOCKLIST_v1'
 
 # The maximum file size that is shown inside the file viewer.
@@ -1388,6 +1443,25 @@ ES_TIMEOUT = 30
 ES_DEFAULT_NUM_REPLICAS = 2
 ES_DEFAULT_NUM_SHARDS = 5
 ES_USE_PLUGINS = False
+# `reindex_mkt` extracts the documents in this many processes, and sizes its
+# bulk requests so that ES answers each in about this many seconds.
+ES_REINDEX_PROCESSES = 4
+ES_REINDEX_BULK_SECONDS = 2
+# Bulk index requests are sent once they reach this many bytes, and documents
+# ES rejects because its queue is full are tried this many more times.
+ES_BULK_MAX_BYTES = 5 * 1024 * 1024
+ES_BULK_RETRIES = 5
+# `index_changes --follow` indexes the objects saved in every window of this
+# many seconds together.
+ES_INDEX_CHANGES_WINDOW = 5
+# This fraction of the searches that take ES at least ES_SLOW_QUERY_MS
+# milliseconds are logged to z.es.slow with their query.
+ES_SLOW_QUERY_MS = 500
+ES_SLOW_QUERY_SAMPLE = 0.1
+# Index the daily download, update and theme user counts in an index per
+# month with this many shards, see stats.models.PartitionedSearchMixin.
+ES_STATS_PARTITIONED = False
+ES_STATS_PARTITION_SHARDS = 1
 
 # Default AMO user id to use for tasks.
 TASK_USER_ID = 4757633
@@ -1432,6 +1506,13 @@ WEBAPPS_RECEIPT_KEY = ''
 WEBAPPS_RECEIPT_EXPIRY_SECONDS = 60 * 60 * 24 * 182
 # Send a new receipt back when it expires.
 WEBAPPS_RECEIPT_EXPIRED_SEND = False
+# How many seconds the receipt verification service caches the install and
+# purchase it found for a receipt. Set to 0 to turn it off.
+WEBAPPS_RECEIPT_VERIFY_CACHE_TIMEOUT = 60
+# The most receipts that can be verified in one bulk request, and how many
+# threads decode them.
+WEBAPPS_RECEIPT_VERIFY_BULK_LIMIT = 500
+WEBAPPS_RECEIPT_VERIFY_BULK_WORKERS = 4
 
 CSRF_FAILURE_VIEW = 'amo.views.csrf_failure'
 
@@ -0,0 +1,17 @@
+CREATE TABLE `zadmin_index_changes` (
+  `id` int(11) unsigned NOT NULL AUTO_INCREMENT,
+  `mapping_type` varchar(64) NOT NULL,
+  `object_id` int(11) unsigned NOT NULL,
+  `created` datetime NOT NULL,
+  PRIMARY KEY (`id`),
+  KEY `mapping_type_idx` (`mapping_type`, `id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
+
+INSERT INTO waffle_switch_mkt (name, active, note, created, modified)
+    VALUES ('index-changes', 0,
+            'Index saved apps in bulk with manage.py index_changes rather '
+            'than a task per save.', NOW(), NOW());
+INSERT INTO waffle_switch_amo (name, active, note, created, modified)
+    VALUES ('index-changes', 0,
+            'Index saved add-ons in bulk with manage.py index_changes rather '
+            'than a task per save.', NOW(), NOW());
@@ -0,0 +1,6 @@
+CREATE TABLE `addon_recommendation_changes` (
+  `id` int(11) unsigned NOT NULL AUTO_INCREMENT,
+  `addon_id` int(11) unsigned NOT NULL,
+  `created` datetime NOT NULL,
+  PRIMARY KEY (`id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
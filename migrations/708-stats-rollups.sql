@@ -0,0 +1,23 @@
+CREATE TABLE `stats_rollup_keys` (
+  `id` int(11) unsigned NOT NULL AUTO_INCREMENT,
+  `metric` varchar(255) NOT NULL,
+  `dimensions` varchar(255) NOT NULL,
+  `rolled_until` date,
+  `created` datetime NOT NULL,
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `metric_dimensions_idx` (`metric`, `dimensions`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
+
+CREATE TABLE `stats_rollups` (
+  `id` int(11) unsigned NOT NULL AUTO_INCREMENT,
+  `key_id` int(11) unsigned NOT NULL,
+  `interval` varchar(5) NOT NULL,
+  `date` date NOT NULL,
+  `count` double NOT NULL,
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `key_interval_date_idx` (`key_id`, `interval`, `date`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
+
+ALTER TABLE `stats_rollups` ADD CONSTRAINT `stats_rollups_key_id_fk`
+    FOREIGN KEY (`key_id`) REFERENCES `stats_rollup_keys` (`id`)
+    ON DELETE CASCADE;
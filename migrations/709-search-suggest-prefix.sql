@@ -0,0 +1,4 @@
+INSERT INTO waffle_switch_mkt (name, active, note, created, modified)
+    VALUES ('search-suggest-prefix', 0,
+            'Match app suggestions on the name_suggest prefixes. Only turn '
+            'it on once reindex_mkt has run with that field.', NOW(), NOW());
@@ -145,6 +145,23 @@ class APIVersionMiddleware(object):
         return response
 
 
+def get_api_filters(request):
+    """
+    The filters that were applied to the API request, as (name, value) pairs.
+    """
+    devices = []
+    for device in ('GAIA', 'MOBILE', 'TABLET'):
+        if getattr(request, device, False):
+            devices.append(device.lower())
+    return (
+        ('carrier', get_carrier() or ''),
+        ('device', devices),
+        ('lang', request.LANG),
+        ('pro', request.GET.get('pro', '')),
+        ('region', request.REGION.slug),
+    )
+
+
 class APIFilterMiddleware(object):
     """
     Add an API-Filter header containing a urlencoded string of filters applied
@@ -152,18 +169,8 @@ class APIFilterMiddleware(object):
     """
     def process_response(self, request, response):
         if getattr(request, 'API', False) and response.status_code < 500:
-            devices = []
-            for device in ('GAIA', 'MOBILE', 'TABLET'):
-                if getattr(request, device, False):
-                    devices.append(device.lower())
-            filters = (
-                ('carrier', get_carrier() or ''),
-                ('device', devices),
-                ('lang', request.LANG),
-                ('pro', request.GET.get('pro', '')),
-                ('region', request.REGION.slug),
-            )
-            response['API-Filter'] = urlencode(filters, doseq=True)
+            response['API-Filter'] = urlencode(get_api_filters(request),
+                                               doseq=True)
             patch_vary_headers(response, ['API-Filter'])
         return response
 
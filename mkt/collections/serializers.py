@@ -26,7 +26,7 @@ import mkt
 from addons.models import Category
 from mkt.api.fields import TranslationSerializerField
 from mkt.api.resources import AppResource
-from mkt.features.utils import get_feature_profile
+from mkt.features.utils import filter_by_features, get_feature_profile
 from mkt.webapps.models import Webapp
 from users.models import UserProfile
 
@@ -83,9 +83,9 @@ class CollectionMembershipField(serializers.RelatedField):
 
         qs = Webapp.from_search(request, region=region)
         filters = {'collection.id': obj.pk}
-        if profile and waffle.switch_is_active('buchets'):
-            filters.update(**profile.to_kwargs(prefix='features.has_'))
         qs = qs.filter(**filters).order_by('collection.order')
+        if profile and waffle.switch_is_active('buchets'):
+            qs = filter_by_features(qs, profile)
 
         return [bundle.data
                 for bundle in search_resource.rehydrate_results(request, qs)]
@@ -400,3 +400,18 @@ class FeatureProfile(OrderedDict):
 
         """
         return dict((prefix + k, False) for k, v in self.iteritems() if not v)
+
+    def to_bits(self, value=True):
+        """
+        Returns the positions of the bits of `to_int()` that are `value`.
+
+        Stored with each app, the positions of the features it requires let
+        us exclude the apps needing any feature a profile lacks with a single
+        terms filter on `to_bits(False)`, rather than one term per feature.
+
+        >>> FeatureProfile.from_int(0x42).to_bits()
+        [1, 6]
+        """
+        features = self.to_int()
+        return [i for i in range(len(self))
+                if bool(features & 1 << i) == value]
@@ -61,3 +61,10 @@ class TestFeatureProfile(amo.tests.TestCase):
     def test_to_kwargs(self):
         self._test_kwargs('')
         self._test_kwargs('prefix_')
+
+    def test_to_bits(self):
+        profile = FeatureProfile.from_int(self.features)
+        bits = profile.to_bits()
+        eq_(len(bits), len(self.truths))
+        eq_(sum(1 << i for i in bits), self.features)
+        eq_(sorted(bits + profile.to_bits(False)), range(len(APP_FEATURES)))
@@ -1,3 +1,5 @@
+from elasticutils.contrib.django import F
+
 from mkt.constants.features import FeatureProfile
 
 
@@ -11,3 +13,14 @@ def get_feature_profile(request):
             except ValueError:
                 pass
     return profile
+
+
+def filter_by_features(qs, profile):
+    """
+    Excludes from the search `qs` the apps that require any of the features
+    `profile` doesn't support.
+    """
+    unsupported = profile.to_bits(False)
+    if unsupported:
+        qs = qs.filter(~F(required_features__in=unsupported))
+    return qs
@@ -2,6 +2,7 @@
 import calendar
 import json
 import time
+from StringIO import StringIO
 from urllib import urlencode
 
 from django.db import connection
@@ -266,6 +267,34 @@ class TestVerify(amo.tests.TestCase):
             eq_(res['status'], 'refunded')
         eq_(log.call_count, 2)
 
+    def test_cached(self):
+        self.make_install()
+        eq_(self.get(self.user_data)['status'], 'ok')
+        Installed.objects.all().delete()
+        eq_(self.get(self.user_data)['status'], 'ok')
+
+    @mock.patch.object(utils.settings, 'WEBAPPS_RECEIPT_VERIFY_CACHE_TIMEOUT',
+                       0)
+    def test_not_cached(self):
+        self.make_install()
+        eq_(self.get(self.user_data)['status'], 'ok')
+        Installed.objects.all().delete()
+        eq_(self.get(self.user_data)['status'], 'invalid')
+
+    def test_invalid_not_cached(self):
+        eq_(self.get(self.user_data)['reason'], 'WRONG_USER')
+        self.make_install()
+        eq_(self.get(self.user_data)['status'], 'ok')
+
+    @mock.patch('services.verify.receipt_cef.log')
+    def test_cached_refund(self, log):
+        self.addon.update(premium_type=amo.ADDON_PREMIUM)
+        self.make_install()
+        purchase = self.make_purchase()
+        eq_(self.get(self.user_data)['status'], 'ok')
+        purchase.update(type=amo.CONTRIB_REFUND)
+        eq_(self.get(self.user_data)['status'], 'refunded')
+
     def test_premium_no_charge(self):
         self.addon.update(premium_type=amo.ADDON_PREMIUM)
         self.make_install()
@@ -352,6 +381,74 @@ class TestVerify(amo.tests.TestCase):
         assert ('Cache-Control', 'no-cache') in hdrs, 'No cache header needed'
 
 
+@mock.patch.object(utils.settings, 'WEBAPPS_RECEIPT_URL',
+                   'https://foo.com/verifyme/')
+class TestBulkVerify(amo.tests.TestCase):
+    fixtures = fixture('webapp_337141', 'user_999')
+
+    def setUp(self):
+        self.addon = Addon.objects.get(pk=337141)
+        self.user = UserProfile.objects.get(pk=999)
+        Installed.objects.create(addon=self.addon,
+                                 user=self.user).update(uuid='some-uuid')
+        self.receipt = {'user': {'type': 'directed-identifier',
+                                 'value': 'some-uuid'},
+                        'product': {'url': 'http://f.com',
+                                    'storedata': urlencode({'id': 337141})},
+                        'verify': 'https://foo.com/verifyme/',
+                        'exp': calendar.timegm(time.gmtime()) + 1000,
+                        'typ': 'purchase-receipt'}
+        other = dict(self.receipt, user={'type': 'directed-identifier',
+                                         'value': 'other-uuid'})
+        self.receipts = {'good': self.receipt, 'other': other}
+
+    def decode_receipt(self, receipt):
+        if receipt not in self.receipts:
+            raise ValueError
+        return self.receipts[receipt]
+
+    def check(self, receipts):
+        with mock.patch.object(verify, 'decode_receipt',
+                               self.decode_receipt):
+            v = verify.BulkVerify(receipts,
+                                  RequestFactory().post('/bulk/').META)
+            v.cursor = connection.cursor()
+            return [r['status'] for r in json.loads(v.check())]
+
+    def test_statuses(self):
+        eq_(self.check(['good', 'other', 'garbage', 'good']),
+            ['ok', 'invalid', 'invalid', 'ok'])
+
+    @mock.patch('services.verify.receipt_cef.log')
+    def test_refunded(self, log):
+        self.addon.update(premium_type=amo.ADDON_PREMIUM)
+        Installed.objects.all().update(premium_type=amo.ADDON_PREMIUM)
+        purchase = AddonPurchase.objects.create(addon=self.addon,
+                                                user=self.user)
+        eq_(self.check(['good']), ['ok'])
+        purchase.update(type=amo.CONTRIB_REFUND)
+        eq_(self.check(['good']), ['refunded'])
+
+    @mock.patch.object(verify.BulkVerify, 'get_installs')
+    def test_one_install_query(self, get_installs):
+        get_installs.return_value = {}
+        self.check(['good', 'other', 'garbage'])
+        get_installs.assert_called_once_with([(337141, 'other-uuid'),
+                                              (337141, 'some-uuid')])
+
+    def test_application_too_many(self):
+        environ = {'REQUEST_METHOD': 'POST',
+                   'wsgi.input': StringIO(json.dumps(['good'] * 501))}
+        start_response = mock.Mock()
+        verify.bulk_application(environ, start_response)
+        eq_(start_response.call_args[0][0], '400 Bad Request')
+
+    def test_application_get(self):
+        start_response = mock.Mock()
+        verify.bulk_application({'REQUEST_METHOD': 'GET'}, start_response)
+        eq_(start_response.call_args[0][0], '405 Method Not Allowed')
+
+
 class TestBase(amo.tests.TestCase):
 
     def create(self, data, request=None):
@@ -1,4 +1,11 @@
+import hashlib
+from functools import partial
+
+from django.conf import settings
 from django.conf.urls import url
+from django.utils.encoding import smart_str
+
+import waffle
 
 from tastypie.authorization import ReadOnlyAuthorization
 from tastypie.exceptions import ImmediateHttpResponse
@@ -10,9 +17,11 @@ from translations.helpers import truncate
 
 import mkt
 from access import acl
+from amo.utils import cache_ns_key
 from mkt.api.authentication import (SharedSecretAuthentication,
                                     OptionalOAuthAuthentication)
 from mkt.api.base import CORSResource, MarketplaceResource
+from mkt.api.middleware import get_api_filters
 from mkt.api.resources import AppResource
 from mkt.api.serializers import SuggestionsSerializer
 from mkt.collections.constants import (COLLECTIONS_TYPE_BASIC,
@@ -25,7 +34,8 @@ from mkt.constants.regions import REGIONS_DICT
 from mkt.features.utils import get_feature_profile
 from mkt.search.views import _filter_search
 from mkt.search.forms import ApiSearchForm
-from mkt.webapps.models import Webapp
+from mkt.search.utils import CachedResults
+from mkt.webapps.models import Webapp, WebappIndexer
 from mkt.webapps.utils import es_app_to_dict
 
 
@@ -109,7 +119,46 @@ class SearchResource(CORSResource, MarketplaceResource):
         return _filter_search(request, qs, data, region=region,
                               profile=profile)
 
+    def get_cache_key(self, request):
+        """
+        The key the results for `request` are cached under, or None if they
+        aren't cached.
+
+        Only anonymous requests are cached, since what a user can see may
+        depend on who they are. Apart from the query string, the results
+        depend on the filters in the API-Filter header, and they are all
+        dropped with the `mkt-search` namespace by
+        `invalidate_cached_results` when apps are (re)indexed.
+        """
+        if (not settings.SEARCH_RESULTS_CACHE_TIMEOUT or
+            getattr(request, 'amo_user', None)):
+            return None
+        params = sorted((k, sorted(v)) for k, v in request.GET.lists()
+                        if k not in ('limit', 'offset'))
+        override = waffle.flag_is_active(request, 'override-region-exclusion')
+        key = repr((request.path, params, get_api_filters(request),
+                    override))
+        return 'search:%s:%s' % (cache_ns_key('mkt-search'),
+                                 hashlib.md5(smart_str(key)).hexdigest())
+
+    def get_cached_results(self, request, ids):
+        """
+        Looks up the results of a cached search, in the same order. The
+        filters of `get_query` apply again, so that apps disabled or excluded
+        from the region since then are left out.
+        """
+        if not ids:
+            return []
+        qs = self.get_query(request).filter(id__in=ids)[:len(ids)]
+        results = dict((obj.id, obj) for obj in qs)
+        return [results[id_] for id_ in ids if id_ in results]
+
     def paginate_results(self, request, qs):
+        key = self.get_cache_key(request)
+        if key:
+            qs = CachedResults(qs, key,
+                               partial(self.get_cached_results, request),
+                               settings.SEARCH_RESULTS_CACHE_TIMEOUT)
         paginator = self._meta.paginator_class(request.GET, qs,
             resource_uri=self.get_resource_list_uri(),
             limit=self._meta.limit)
@@ -233,7 +282,27 @@ class SuggestionsResource(SearchResource):
     def alter_list_data_to_serialize(self, request, data):
         return data
 
+    def apply_filters(self, request, qs, data=None):
+        # The name_suggest field is only in indexes made by reindex_mkt since
+        # it was added, so it's behind a switch until they all have it.
+        if not waffle.switch_is_active('search-suggest-prefix'):
+            return super(SuggestionsResource, self).apply_filters(
+                request, qs, data=data)
+        # Rather than running the full search query, only match the start of
+        # the words in the names, which is a lot cheaper for ES.
+        qs = super(SuggestionsResource, self).apply_filters(
+            request, qs, data=dict(data, q=''))
+        if self.query:
+            qs = qs.query(name_suggest__text={'query': self.query.lower(),
+                                              'operator': 'and'})
+        return qs
+
     def paginate_results(self, request, qs):
+        key = self.get_cache_key(request)
+        if key:
+            qs = CachedResults(qs, key,
+                               partial(self.get_cached_results, request),
+                               settings.SEARCH_RESULTS_CACHE_TIMEOUT)
         return self.rehydrate_results(request, qs[:self._meta.limit])
 
     def rehydrate_results(self, request, qs):
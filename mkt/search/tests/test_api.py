@@ -2,6 +2,7 @@
 import json
 
 from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
 from django.test.client import RequestFactory
 
 from mock import MagicMock, patch
@@ -16,6 +17,7 @@ from addons.models import (AddonCategory, AddonDeviceType, AddonUpsell,
                            Category)
 from amo.helpers import absolutify
 from amo.tests import app_factory, ESTestCase, TestCase
+from amo.utils import cache_ns_key
 from stats.models import ClientData
 from tags.models import Tag
 from translations.helpers import truncate
@@ -32,9 +34,10 @@ from mkt.constants.features import FeatureProfile
 from mkt.regions.middleware import RegionMiddleware
 from mkt.search.forms import DEVICE_CHOICES_IDS
 from mkt.search.api import SearchResource
+from mkt.search.utils import invalidate_cached_results
 from mkt.site.fixtures import fixture
 from mkt.webapps.models import Installed, Webapp
-from mkt.webapps.tasks import unindex_webapps
+from mkt.webapps.tasks import index_webapps, unindex_webapps
 
 
 class TestSearchResource(TestCase):
@@ -218,6 +221,92 @@ class TestApi(BaseOAuth, ESTestCase):
             ok_('latest_version' not in obj)
             ok_('reviewer_flags' not in obj)
 
+    def test_cached_results(self):
+        with self.settings(SEARCH_RESULTS_CACHE_TIMEOUT=60):
+            res = self.client.get(self.url)
+            eq_(res.json['meta']['total_count'], 1)
+
+            # The app is found in the cache, but looked up again.
+            with patch('mkt.search.utils.cache_ns_key'):
+                self.webapp.name = 'Cached'
+                self.webapp.save()
+                app = app_factory()
+                self.refresh('webapp')
+            res = self.client.get(self.url)
+            eq_(res.json['meta']['total_count'], 1)
+            eq_(res.json['objects'][0]['name'], u'Cached')
+
+            # Until the apps are reindexed.
+            cache_ns_key('mkt-search', increment=True)
+            res = self.client.get(self.url)
+            eq_(res.json['meta']['total_count'], 2)
+
+        unindex_webapps([app.id])
+        app.delete()
+
+    def test_cached_results_filtered(self):
+        with self.settings(SEARCH_RESULTS_CACHE_TIMEOUT=60):
+            res = self.client.get(self.url)
+            eq_(len(res.json['objects']), 1)
+
+            # An app disabled since it was cached is left out.
+            with patch('mkt.search.utils.cache_ns_key'):
+                self.webapp.disabled_by_user = True
+                self.webapp.save()
+                self.refresh('webapp')
+            res = self.client.get(self.url)
+            eq_(res.json['objects'], [])
+
+        self.webapp.disabled_by_user = False
+        self.webapp.save()
+        self.refresh('webapp')
+
+    def test_index_invalidates_cache(self):
+        before = cache_ns_key('mkt-search')
+        with self.settings(SEARCH_RESULTS_CACHE_TIMEOUT=60):
+            index_webapps([self.webapp.id])
+        ok_(cache_ns_key('mkt-search') != before)
+
+    def test_cached_results_kept(self):
+        with self.settings(SEARCH_RESULTS_CACHE_TIMEOUT=60):
+            invalidate_cached_results()
+            res = self.client.get(self.url)
+            eq_(res.json['meta']['total_count'], 1)
+
+            # Apps saved soon after the last time don't drop the cache.
+            before = cache_ns_key('mkt-search')
+            self.webapp.save()
+            app = app_factory()
+            self.refresh('webapp')
+            eq_(cache_ns_key('mkt-search'), before)
+            res = self.client.get(self.url)
+            eq_(res.json['meta']['total_count'], 1)
+
+        unindex_webapps([app.id])
+        app.delete()
+
+    def test_cache_key(self):
+        factory = RequestFactory()
+        resource = SearchResource()
+
+        def key(params=None, lang='en-US', user=None):
+            req = factory.get('/', params or {})
+            req.LANG = lang
+            req.amo_user = user
+            req.user = AnonymousUser()
+            RegionMiddleware().process_request(req)
+            return resource.get_cache_key(req)
+
+        with self.settings(SEARCH_RESULTS_CACHE_TIMEOUT=60):
+            ok_(key())
+            eq_(key(), key({'offset': 25}))
+            eq_(key({'q': 'a', 'cat': 'b'}), key({'cat': 'b', 'q': 'a'}))
+            ok_(key() != key({'q': 'a'}))
+            ok_(key() != key(lang='fr'))
+            ok_(key() != key({'region': 'br'}))
+            eq_(key(user=UserProfile.objects.all()[0]), None)
+        eq_(key(), None)
+
     def test_upsell(self):
         upsell = app_factory(premium_type=amo.ADDON_PREMIUM)
         AddonUpsell.objects.create(free=self.webapp, premium=upsell)
@@ -754,3 +843,33 @@ class TestSuggestionsApi(ESTestCase):
         unindex_webapps([app1.id, app2.id])
         app1.delete()
         app2.delete()
+
+    def names(self, q):
+        res = self.client.get(self.url + ({'q': q},))
+        eq_(res.status_code, 200)
+        return json.loads(res.content)[1]
+
+    def test_suggestions_prefix(self):
+        self.create_switch('search-suggest-prefix')
+        app1 = Webapp.objects.get(pk=337141)
+        app1.save()
+        app2 = app_factory(name=u'Second \xe2pp')
+        self.refresh('webapp')
+
+        eq_(self.names('sec'), [unicode(app2.name)])
+        eq_(self.names('Seco AP'), [unicode(app2.name)])
+        eq_(self.names('something steam'), [unicode(app1.name)])
+        eq_(self.names('steamcubes'), [])
+
+        unindex_webapps([app1.id, app2.id])
+        app1.delete()
+        app2.delete()
+
+    def test_suggestions_search_query(self):
+        # Without the switch, the names are searched like in SearchResource.
+        app = app_factory(name=u'Second \xe2pp')
+        self.refresh('webapp')
+        eq_(self.names('second'), [unicode(app.name)])
+
+        unindex_webapps([app.id])
+        app.delete()
@@ -1,6 +1,12 @@
+from django.conf import settings
+from django.core.cache import cache
+
 from elasticutils.contrib.django import S as eu_S
 from statsd import statsd
 
+from amo.search import record_search
+from amo.utils import cache_ns_key
+
 
 class S(eu_S):
 
@@ -8,4 +14,54 @@ class S(eu_S):
         with statsd.timer('search.raw'):
             hits = super(S, self).raw()
             statsd.timing('search.took', hits['took'])
+            record_search(self._build_query(), self.get_indexes(), hits)
             return hits
+
+
+class CachedResults(object):
+    """
+    Stands in for an `S` given to a paginator. The total and the ids of each
+    slice of the results are cached under `key` for `timeout` seconds, and
+    the slices found in the cache are looked up with `fetch(ids)` instead of
+    running the search again.
+    """
+
+    def __init__(self, qs, key, fetch, timeout):
+        self.qs = qs
+        self.key = key
+        self.fetch = fetch
+        self.timeout = timeout
+
+    def count(self):
+        key = '%s:count' % self.key
+        count = cache.get(key)
+        if count is None:
+            count = self.qs.count()
+            cache.set(key, count, self.timeout)
+        return count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, k):
+        key = '%s:%s:%s' % (self.key, k.start, k.stop)
+        ids = cache.get(key)
+        if ids is not None:
+            statsd.incr('search.cache.hit')
+            return self.fetch(ids)
+        statsd.incr('search.cache.miss')
+        results = list(self.qs[k])
+        cache.set(key, [obj.id for obj in results], self.timeout)
+        return results
+
+
+def invalidate_cached_results():
+    """
+    Drops the cached search results when apps are (re)indexed, at most once
+    every settings.SEARCH_RESULTS_CACHE_TIMEOUT seconds. Apps are indexed on
+    every save, and whatever was cached since the last time expires within
+    that many seconds anyway.
+    """
+    timeout = settings.SEARCH_RESULTS_CACHE_TIMEOUT
+    if timeout and cache.add('search:invalidated', 1, timeout):
+        cache_ns_key('mkt-search', increment=True)
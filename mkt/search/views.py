@@ -2,6 +2,7 @@ import waffle
 
 import amo
 from apps.search.views import _get_locale_analyzer
+from mkt.features.utils import filter_by_features
 
 from . import forms
 
@@ -129,6 +130,6 @@ def _filter_search(request, qs, query, filters=None, sorting=None,
 
     if profile and waffle.switch_is_active('buchets'):
         # Exclude apps that require any features we don't support.
-        qs = qs.filter(**profile.to_kwargs(prefix='features.has_'))
+        qs = filter_by_features(qs, profile)
 
     return qs
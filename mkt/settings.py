@@ -298,6 +298,10 @@ REST_FRAMEWORK = {
 # Tastypie config to match Django Rest Framework.
 API_LIMIT_PER_PAGE = 25
 
+# The ids of the apps found by anonymous API searches are cached for this many
+# seconds, keyed on the query and the API-Filter. Set to 0 to turn it off.
+SEARCH_RESULTS_CACHE_TIMEOUT = 60
+
 # Upon signing out (of Developer Hub/Reviewer Tools), redirect users to
 # Developer Hub instead of to Fireplace.
 LOGOUT_REDIRECT_URL = '/developers/'
@@ -314,3 +318,11 @@ COMMONPLACE_REPOS = ['commbadge', 'fireplace', 'marketplace-stats',
 #   override-app-purchase
 # For them to be able purchase apps.
 PURCHASE_LIMITED = False
+
+# The stats API rolls up the Monolith metrics it serves from this day, which
+# is before the first of them.
+MONOLITH_ROLLUPS_START = datetime.date(2013, 1, 1)
+
+# The days before yesterday that update_monolith_rollups rolls up again, for
+# the events that reach Monolith late.
+MONOLITH_ROLLUPS_LATE = 1
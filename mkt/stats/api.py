@@ -10,8 +10,6 @@ from rest_framework.generics import ListAPIView
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from lib.metrics import get_monolith_client
-
 import amo
 from stats.models import Contribution
 
@@ -23,6 +21,7 @@ from mkt.api.base import CORSMixin, SlugOrIdMixin
 from mkt.api.exceptions import NotImplemented, ServiceUnavailable
 from mkt.webapps.models import Webapp
 
+from . import rollups
 from .forms import StatsForm
 
 
@@ -99,14 +98,14 @@ APP_STATS = {
 
 
 def _get_monolith_data(stat, start, end, interval, dimensions):
-    # If stat has a 'lines' attribute, it's a multi-line graph. Do a
-    # request for each item in 'lines' and compose them in a single
-    # response.
-    try:
-        client = get_monolith_client()
-    except requests.ConnectionError as e:
-        log.info('Monolith connection error: {0}'.format(e))
-        raise ServiceUnavailable
+    # If stat has a 'lines' attribute, it's a multi-line graph. Every line is
+    # served from its rollups, with the days that aren't rolled up yet from
+    # one Monolith query for all the lines.
+    if 'lines' in stat:
+        lines = dict((line_name, dict(dimensions, **line_dimension))
+                     for line_name, line_dimension in stat['lines'].items())
+    else:
+        lines = {'objects': dimensions}
 
     def _coerce(data):
         for key, coerce in stat.get('coerce', {}).items():
@@ -116,19 +115,10 @@ def _get_monolith_data(stat, start, end, interval, dimensions):
         return data
 
     try:
-        data = {}
-        if 'lines' in stat:
-            for line_name, line_dimension in stat['lines'].items():
-                dimensions.update(line_dimension)
-                data[line_name] = map(_coerce,
-                                      client(stat['metric'], start, end,
-                                             interval, **dimensions))
-
-        else:
-            data['objects'] = map(_coerce,
-                                  client(stat['metric'], start, end, interval,
-                                         **dimensions))
-
+        data = rollups.series(stat['metric'], lines, start, end, interval)
+    except requests.ConnectionError as e:
+        log.info('Monolith connection error: {0}'.format(e))
+        raise ServiceUnavailable
     except ValueError as e:
         # This occurs if monolith doesn't have our metric and we get an
         # elasticsearch SearchPhaseExecutionException error.
@@ -136,7 +126,8 @@ def _get_monolith_data(stat, start, end, interval, dimensions):
             stat['metric'], e))
         raise ParseError('Invalid metric at this time. Try again later.')
 
-    return data
+    return dict((line_name, map(_coerce, objects))
+                for line_name, objects in data.items())
 
 
 class GlobalStats(CORSMixin, APIView):
@@ -8,6 +8,8 @@ import pyes
 
 from stats.models import Contribution
 from lib.es.utils import raise_if_reindex_in_progress
+from mkt.stats import rollups
+from mkt.stats.models import MonolithRollupKey
 from mkt.webapps.models import Installed
 
 cron_log = commonware.log.getLogger('mkt.cron')
@@ -43,3 +45,13 @@ def index_latest_mkt_stats(index=None, aliased=True):
 def index_mkt_stats(index=None, aliased=True):
     cron_log.info('index_mkt_stats')
     call_command('index_mkt_stats', addons=None, date=None)
+
+
+@cronjobs.register
+def update_monolith_rollups():
+    """Rolls up the days before today of the metrics the stats API serves."""
+    yesterday = datetime.date.today() - datetime.timedelta(days=1)
+    keys = MonolithRollupKey.objects.all()
+    cron_log.info('Rolling up %s Monolith metrics to %s.'
+                  % (len(keys), yesterday))
+    rollups.roll_up(keys, yesterday)
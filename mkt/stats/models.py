@@ -0,0 +1,45 @@
+import datetime
+import json
+
+from django.db import models
+
+
+class MonolithRollupKey(models.Model):
+    """
+    A Monolith metric and the dimensions it is filtered by, for which the
+    stats API keeps `MonolithRollup`s. Every metric the API is asked for gets
+    one, and `update_monolith_rollups` rolls up its days to `rolled_until`.
+    """
+    metric = models.CharField(max_length=255)
+    # The dimensions as JSON, with sorted keys.
+    dimensions = models.CharField(max_length=255)
+    rolled_until = models.DateField(null=True)
+    created = models.DateTimeField(default=datetime.datetime.now)
+
+    class Meta:
+        db_table = 'stats_rollup_keys'
+        unique_together = ('metric', 'dimensions')
+
+    @classmethod
+    def get(cls, metric, dimensions):
+        """Returns the key of `metric` with `dimensions`, created if new."""
+        return cls.objects.get_or_create(
+            metric=metric, dimensions=json.dumps(dimensions, sort_keys=True))[0]
+
+    def get_dimensions(self):
+        return json.loads(self.dimensions)
+
+
+class MonolithRollup(models.Model):
+    """
+    The total of the metric of `key` in the `interval`, a day, a week or a
+    month, starting on `date`. Periods without any are not stored.
+    """
+    key = models.ForeignKey(MonolithRollupKey)
+    interval = models.CharField(max_length=5)
+    date = models.DateField()
+    count = models.FloatField()
+
+    class Meta:
+        db_table = 'stats_rollups'
+        unique_together = ('key', 'interval', 'date')
@@ -0,0 +1,220 @@
+"""
+Daily, weekly and monthly totals of the Monolith metrics served by the stats
+API, kept in `stats_rollups` by the `update_monolith_rollups` cron. A chart
+adds up the rollups of its periods and only asks Monolith for the days that
+aren't rolled up yet, which is today's, for all of its lines in one query.
+Quarters and years are added up from months.
+"""
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+
+import commonware.log
+import requests
+
+import amo
+import mkt
+from amo.utils import chunked
+from lib.metrics import get_monolith_client
+
+from .models import MonolithRollup, MonolithRollupKey
+
+
+log = commonware.log.getLogger('z.stats')
+
+INTERVALS = ('day', 'week', 'month')
+
+# The values of the dimensions that are rolled up. The metrics of an app are
+# rolled up by its id.
+DIMENSIONS = {
+    'region': set(mkt.regions.REGIONS_DICT),
+    'package_type': set(amo.ADDON_WEBAPP_TYPES.values()),
+    'premium_type': set(amo.ADDON_PREMIUM_API.values()),
+}
+
+_MONTHS = {'month': 1, 'quarter': 3, 'year': 12}
+
+
+def period(interval, date):
+    """Returns the first day of the `interval` that `date` is in."""
+    if interval == 'day':
+        return date
+    if interval == 'week':
+        return date - datetime.timedelta(days=date.weekday())
+    months = _MONTHS[interval]
+    return date.replace(month=date.month - (date.month - 1) % months, day=1)
+
+
+def next_period(interval, date):
+    """Returns the first day of the `interval` after the one of `date`."""
+    date = period(interval, date)
+    if interval == 'day':
+        return date + datetime.timedelta(days=1)
+    if interval == 'week':
+        return date + datetime.timedelta(days=7)
+    month = date.month - 1 + _MONTHS[interval]
+    return date.replace(year=date.year + month // 12, month=month % 12 + 1)
+
+
+def periods(interval, start, end):
+    """Returns the first days of the `interval`s from `start` to `end`."""
+    dates = [period(interval, start)]
+    while next_period(interval, dates[-1]) <= end:
+        dates.append(next_period(interval, dates[-1]))
+    return dates
+
+
+def histograms(queries):
+    """
+    Returns the totals of the Monolith `queries`, a dict of
+    {name: (metric, dimensions, start, end, interval)}, as
+    {name: {first day of the interval: total}}. Each of them is a
+    date_histogram facet, all of them in one query.
+    """
+    if not queries:
+        return {}
+    facets = {}
+    for name, (metric, dimensions, start, end, interval) in queries.items():
+        filters = [{'range': {'date': {'gte': start.isoformat(),
+                                       'lte': end.isoformat()}}}]
+        filters.extend({'term': {key: value}}
+                       for key, value in sorted(dimensions.items()))
+        facets[str(name)] = {
+            'date_histogram': {'key_field': 'date', 'value_field': metric,
+                               'interval': interval},
+            'facet_filter': {'and': filters}}
+    res = get_monolith_client().raw({'query': {'match_all': {}},
+                                     'facets': facets, 'size': 0})
+
+    def date(entry):
+        return datetime.datetime.utcfromtimestamp(entry['time'] / 1000).date()
+
+    return dict((name, dict((date(entry), entry['total'])
+                            for entry in res['facets'][str(name)]['entries']))
+                for name in queries)
+
+
+def is_rolled_up(dimensions):
+    """
+    Whether the metrics with `dimensions` are rolled up, which is only when
+    they are all known values, so that requests can't add keys at will.
+    """
+    for key, value in dimensions.items():
+        if key == 'app-id':
+            if not isinstance(value, (int, long)):
+                return False
+        elif value not in DIMENSIONS.get(key, ()):
+            return False
+    return True
+
+
+def series(metric, lines, start, end, interval):
+    """
+    Returns {line: [{'count': total, 'date': first day}]} of `metric` for
+    every `interval` from `start` to `end`, with `lines` of
+    {line: dimensions}. The lines with dimensions that aren't rolled up all
+    come from Monolith.
+    """
+    dates = periods(interval, start, end)
+    first, last = dates[0], next_period(interval, dates[-1])
+    last -= datetime.timedelta(days=1)
+    keys = dict((line, MonolithRollupKey.get(metric, dimensions))
+                for line, dimensions in lines.items()
+                if is_rolled_up(dimensions))
+    totals = dict((line, dict.fromkeys(dates, 0)) for line in lines)
+
+    rolled = dict((key.id, line) for line, key in keys.items()
+                  if key.rolled_until)
+    rows = MonolithRollup.objects.filter(
+        key__in=rolled.keys(), date__gte=first, date__lte=last,
+        interval=interval if interval in INTERVALS else 'month')
+    for key, date, count in rows.values_list('key', 'date', 'count'):
+        totals[rolled[key]][period(interval, date)] += count
+
+    # The days after the rollups of a key, or all of them for a new one.
+    queries = {}
+    for line in lines:
+        key = keys.get(line)
+        if not key or not key.rolled_until:
+            queries[line] = (metric, lines[line], first, last, interval)
+        elif key.rolled_until < last:
+            queries[line] = (metric, lines[line],
+                             max(first, key.rolled_until +
+                                 datetime.timedelta(days=1)), last, 'day')
+    for line, counts in histograms(queries).items():
+        for date, count in counts.items():
+            if first <= date <= last:
+                totals[line][period(interval, date)] += count
+
+    return dict((line, [{'count': totals[line][date], 'date': date}
+                        for date in dates])
+                for line in lines)
+
+
+def _since(key, until):
+    """The first day of `key` that `roll_up` rolls up."""
+    if not key.rolled_until:
+        return settings.MONOLITH_ROLLUPS_START
+    return min(key.rolled_until + datetime.timedelta(days=1),
+               until - datetime.timedelta(days=settings.MONOLITH_ROLLUPS_LATE))
+
+
+def roll_up(keys, until, chunk_size=50):
+    """
+    Rolls up the days of `keys` to `until`, from the day after their last
+    rollup or from settings.MONOLITH_ROLLUPS_START, and the weeks and months
+    of those days. The settings.MONOLITH_ROLLUPS_LATE days before `until` are
+    rolled up again, for the events that reach Monolith late.
+
+    The keys that start on about the same day are queried together, a chunk
+    of them in one Monolith query.
+    """
+    keys = sorted(keys, key=lambda key: _since(key, until))
+    for chunk in chunked(keys, chunk_size):
+        start = _since(chunk[0], until)
+        if start > until:
+            continue
+        try:
+            days = histograms(dict(
+                (key.id, (key.metric, key.get_dimensions(), start, until,
+                          'day'))
+                for key in chunk))
+        except (requests.ConnectionError, ValueError) as e:
+            # Like a metric Monolith doesn't have yet. The chunk is rolled up
+            # from the same day next time.
+            log.error('Rolling up Monolith metrics %s failed: %s'
+                      % (', '.join(sorted(set(k.metric for k in chunk))), e))
+            continue
+
+        # The days before `start` in the weeks and months being rolled up.
+        first = min(period(interval, start) for interval in INTERVALS)
+        rows = MonolithRollup.objects.filter(
+            key__in=days.keys(), interval='day', date__gte=first,
+            date__lt=start).values_list('key', 'date', 'count')
+        for key, date, count in rows:
+            days[key][date] = count
+
+        rollups = []
+        for interval in INTERVALS:
+            since = period(interval, start)
+            for key, counts in days.items():
+                totals = {}
+                for date, count in counts.items():
+                    if since <= date <= until:
+                        date = period(interval, date)
+                        totals[date] = totals.get(date, 0) + count
+                rollups.extend(
+                    MonolithRollup(key_id=key, interval=interval, date=date,
+                                   count=count)
+                    for date, count in totals.items() if count)
+
+        with transaction.commit_on_success():
+            for interval in INTERVALS:
+                MonolithRollup.objects.filter(
+                    key__in=days.keys(), interval=interval,
+                    date__gte=period(interval, start)).delete()
+            for objs in chunked(rollups, 1000):
+                MonolithRollup.objects.bulk_create(objs)
+            MonolithRollupKey.objects.filter(id__in=days.keys()).update(
+                rolled_until=until)
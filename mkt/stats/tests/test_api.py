@@ -1,3 +1,5 @@
+import calendar
+import datetime
 import json
 
 import mock
@@ -12,7 +14,16 @@ from stats.models import Contribution
 
 from mkt.api.tests.test_oauth import RestOAuth
 from mkt.site.fixtures import fixture
+from mkt.stats import rollups
 from mkt.stats.api import APP_STATS, STATS, _get_monolith_data
+from mkt.stats.models import MonolithRollup, MonolithRollupKey
+
+
+def histogram(counts, name='objects'):
+    """The result of a Monolith date_histogram facet of `counts`."""
+    entries = [{'time': calendar.timegm(date.timetuple()) * 1000,
+                'total': count} for date, count in sorted(counts.items())]
+    return {'facets': {name: {'entries': entries}}}
 
 
 @mock.patch('monolith.client.Client')
@@ -61,7 +72,14 @@ class TestGlobalStatsResource(RestOAuth):
     def test_good(self, mocked):
         res = self.client.get(self.url(), data=self.data)
         eq_(res.status_code, 200)
-        eq_(json.loads(res.content)['objects'], [])
+        objects = json.loads(res.content)['objects']
+        eq_(len(objects), 15)
+        eq_(objects[0], {'count': 0, 'date': '2013-04-01'})
+
+    def terms(self, client, line):
+        query = client.raw.call_args[0][0]
+        filters = query['facets'][line]['facet_filter']['and'][1:]
+        return dict(f['term'].items()[0] for f in filters)
 
     def test_dimensions(self, mocked):
         client = mock.MagicMock()
@@ -71,8 +89,9 @@ class TestGlobalStatsResource(RestOAuth):
         data.update({'region': 'br', 'package_type': 'hosted'})
         res = self.client.get(self.url('apps_added_by_package'), data=data)
         eq_(res.status_code, 200)
-        ok_(client.called)
-        eq_(client.call_args[1], {'region': 'br', 'package_type': 'hosted'})
+        eq_(client.raw.call_count, 1)
+        eq_(self.terms(client, 'hosted'),
+            {'region': 'br', 'package_type': 'hosted'})
 
     def test_dimensions_default(self, mocked):
         client = mock.MagicMock()
@@ -81,8 +100,12 @@ class TestGlobalStatsResource(RestOAuth):
         res = self.client.get(self.url('apps_added_by_package'),
                               data=self.data)
         eq_(res.status_code, 200)
-        ok_(client.called)
-        eq_(client.call_args[1], {'region': 'us', 'package_type': 'hosted'})
+        # One query for all of the lines.
+        eq_(client.raw.call_count, 1)
+        eq_(self.terms(client, 'hosted'),
+            {'region': 'us', 'package_type': 'hosted'})
+        eq_(self.terms(client, 'packaged'),
+            {'region': 'us', 'package_type': 'packaged'})
 
     def test_dimensions_default_is_none(self, mocked):
         client = mock.MagicMock()
@@ -90,25 +113,27 @@ class TestGlobalStatsResource(RestOAuth):
 
         res = self.client.get(self.url('apps_installed'), data=self.data)
         eq_(res.status_code, 200)
-        ok_(client.called)
-        eq_(client.call_args[1], {})
+        ok_(client.raw.called)
+        eq_(self.terms(client, 'objects'), {})
 
         data = self.data.copy()
         data['region'] = 'us'
 
         res = self.client.get(self.url('apps_installed'), data=data)
         eq_(res.status_code, 200)
-        ok_(client.called)
-        eq_(client.call_args[1], {'region': 'us'})
+        ok_(client.raw.called)
+        eq_(self.terms(client, 'objects'), {'region': 'us'})
 
     def test_coersion(self, mocked):
         client = mock.MagicMock()
-        client.return_value = [{'count': 1.99, 'date': '2013-10-10'}]
+        client.raw.return_value = histogram(
+            {datetime.date(2013, 10, 10): 1.99})
         mocked.return_value = client
 
         data = _get_monolith_data(
-            {'metric': 'foo', 'coerce': {'count': str}}, '2013-10-10',
-            '2013-10-10', 'day', {})
+            {'metric': 'foo', 'coerce': {'count': str}},
+            datetime.date(2013, 10, 10), datetime.date(2013, 10, 10), 'day',
+            {})
         eq_(type(data['objects'][0]['count']), str)
 
 
@@ -222,3 +247,167 @@ class TestTransactionResource(RestOAuth):
         eq_(obj['app_id'], 337141)
         eq_(obj['amount_USD'], '1.99')
         eq_(obj['type'], 'Purchase')
+
+
+@mock.patch('monolith.client.Client')
+@mock.patch.object(settings, 'MONOLITH_SERVER', 'http://0.0.0.0:0')
+@mock.patch.object(settings, 'MONOLITH_ROLLUPS_START',
+                   datetime.date(2013, 4, 1))
+@mock.patch.object(settings, 'MONOLITH_ROLLUPS_LATE', 1)
+class TestRollups(amo.tests.TestCase):
+
+    def setUp(self):
+        self.client = mock.MagicMock()
+        self.key = MonolithRollupKey.get('app_installs', {'region': 'us'})
+        self.stat = {'metric': 'app_installs'}
+
+    def roll(self, rolled_until):
+        self.key.rolled_until = rolled_until
+        self.key.save()
+
+    def rollup(self, interval, date, count):
+        MonolithRollup.objects.create(key=self.key, interval=interval,
+                                      date=date, count=count)
+
+    def get(self, start, end, interval):
+        return _get_monolith_data(self.stat, start, end, interval,
+                                  {'region': 'us'})['objects']
+
+    def test_periods(self, mocked):
+        date = datetime.date(2013, 11, 20)
+        eq_(rollups.period('week', date), datetime.date(2013, 11, 18))
+        eq_(rollups.period('quarter', date), datetime.date(2013, 10, 1))
+        eq_(rollups.next_period('quarter', date), datetime.date(2014, 1, 1))
+        eq_(rollups.periods('month', date, datetime.date(2014, 1, 1)),
+            [datetime.date(2013, 11, 1), datetime.date(2013, 12, 1),
+             datetime.date(2014, 1, 1)])
+
+    def test_rolled_up(self, mocked):
+        mocked.return_value = self.client
+        self.roll(datetime.date(2013, 4, 30))
+        self.rollup('week', datetime.date(2013, 4, 1), 5)
+        self.rollup('week', datetime.date(2013, 4, 15), 7)
+        self.rollup('day', datetime.date(2013, 4, 15), 3)
+
+        eq_(self.get(datetime.date(2013, 4, 3), datetime.date(2013, 4, 16),
+                     'week'),
+            [{'count': 5, 'date': datetime.date(2013, 4, 1)},
+             {'count': 0, 'date': datetime.date(2013, 4, 8)},
+             {'count': 7, 'date': datetime.date(2013, 4, 15)}])
+        ok_(not self.client.raw.called)
+
+    def test_today_from_monolith(self, mocked):
+        mocked.return_value = self.client
+        self.client.raw.return_value = histogram(
+            {datetime.date(2013, 4, 15): 2})
+        self.roll(datetime.date(2013, 4, 14))
+        self.rollup('week', datetime.date(2013, 4, 8), 7)
+
+        eq_(self.get(datetime.date(2013, 4, 8), datetime.date(2013, 4, 15),
+                     'week'),
+            [{'count': 7, 'date': datetime.date(2013, 4, 8)},
+             {'count': 2, 'date': datetime.date(2013, 4, 15)}])
+        facet = self.client.raw.call_args[0][0]['facets']['objects']
+        eq_(facet['date_histogram']['interval'], 'day')
+        eq_(facet['facet_filter']['and'][0]['range']['date'],
+            {'gte': '2013-04-15', 'lte': '2013-04-21'})
+
+    def test_quarters_from_months(self, mocked):
+        mocked.return_value = self.client
+        self.roll(datetime.date(2013, 12, 31))
+        self.rollup('month', datetime.date(2013, 4, 1), 1)
+        self.rollup('month', datetime.date(2013, 6, 1), 2)
+        self.rollup('month', datetime.date(2013, 7, 1), 4)
+
+        eq_(self.get(datetime.date(2013, 5, 3), datetime.date(2013, 8, 1),
+                     'quarter'),
+            [{'count': 3, 'date': datetime.date(2013, 4, 1)},
+             {'count': 4, 'date': datetime.date(2013, 7, 1)}])
+
+    def test_new_key_from_monolith(self, mocked):
+        mocked.return_value = self.client
+        self.client.raw.return_value = histogram(
+            {datetime.date(2013, 4, 1): 6})
+
+        eq_(self.get(datetime.date(2013, 4, 3), datetime.date(2013, 4, 3),
+                     'month'),
+            [{'count': 6, 'date': datetime.date(2013, 4, 1)}])
+        facet = self.client.raw.call_args[0][0]['facets']['objects']
+        eq_(facet['date_histogram']['interval'], 'month')
+
+    def test_unknown_dimensions(self, mocked):
+        mocked.return_value = self.client
+        self.client.raw.return_value = histogram(
+            {datetime.date(2013, 4, 3): 6})
+
+        eq_(_get_monolith_data(self.stat, datetime.date(2013, 4, 3),
+                               datetime.date(2013, 4, 3), 'day',
+                               {'region': 'x' * 300})['objects'],
+            [{'count': 6, 'date': datetime.date(2013, 4, 3)}])
+        # They are served from Monolith without a key to roll them up.
+        eq_(list(MonolithRollupKey.objects.all()), [self.key])
+
+    def test_roll_up(self, mocked):
+        mocked.return_value = self.client
+        self.client.raw.return_value = histogram(
+            {datetime.date(2013, 4, 1): 1, datetime.date(2013, 4, 7): 2,
+             datetime.date(2013, 4, 8): 4}, name=str(self.key.id))
+        rollups.roll_up([self.key], datetime.date(2013, 4, 8))
+
+        facet = self.client.raw.call_args[0][0]['facets'][str(self.key.id)]
+        eq_(facet['facet_filter']['and'][0]['range']['date'],
+            {'gte': '2013-04-01', 'lte': '2013-04-08'})
+        rows = MonolithRollup.objects.filter(key=self.key)
+        eq_(sorted(rows.values_list('interval', 'date', 'count')),
+            [('day', datetime.date(2013, 4, 1), 1),
+             ('day', datetime.date(2013, 4, 7), 2),
+             ('day', datetime.date(2013, 4, 8), 4),
+             ('month', datetime.date(2013, 4, 1), 7),
+             ('week', datetime.date(2013, 4, 1), 3),
+             ('week', datetime.date(2013, 4, 8), 4)])
+        eq_(MonolithRollupKey.objects.get(id=self.key.id).rolled_until,
+            datetime.date(2013, 4, 8))
+
+    def test_roll_up_again(self, mocked):
+        mocked.return_value = self.client
+        self.roll(datetime.date(2013, 4, 8))
+        self.rollup('day', datetime.date(2013, 4, 1), 1)
+        self.rollup('day', datetime.date(2013, 4, 8), 4)
+        self.rollup('week', datetime.date(2013, 4, 1), 1)
+        self.rollup('week', datetime.date(2013, 4, 8), 4)
+        self.rollup('month', datetime.date(2013, 4, 1), 5)
+        # The 8th is rolled up again, with what came in late.
+        self.client.raw.return_value = histogram(
+            {datetime.date(2013, 4, 8): 5, datetime.date(2013, 4, 9): 2},
+            name=str(self.key.id))
+        rollups.roll_up([self.key], datetime.date(2013, 4, 9))
+
+        facet = self.client.raw.call_args[0][0]['facets'][str(self.key.id)]
+        eq_(facet['facet_filter']['and'][0]['range']['date'],
+            {'gte': '2013-04-08', 'lte': '2013-04-09'})
+        rows = MonolithRollup.objects.filter(key=self.key)
+        eq_(sorted(rows.values_list('interval', 'date', 'count')),
+            [('day', datetime.date(2013, 4, 1), 1),
+             ('day', datetime.date(2013, 4, 8), 5),
+             ('day', datetime.date(2013, 4, 9), 2),
+             ('month', datetime.date(2013, 4, 1), 8),
+             ('week', datetime.date(2013, 4, 1), 1),
+             ('week', datetime.date(2013, 4, 8), 7)])
+
+    def test_roll_up_failure(self, mocked):
+        mocked.return_value = self.client
+        other = MonolithRollupKey.get('app_visits', {'region': 'us'})
+
+        def raw(query):
+            if str(self.key.id) in query['facets']:
+                raise ValueError('No such metric.')
+            return histogram({datetime.date(2013, 4, 1): 1},
+                             name=str(other.id))
+
+        self.client.raw.side_effect = raw
+        rollups.roll_up([self.key, other], datetime.date(2013, 4, 8),
+                        chunk_size=1)
+        # The chunk after the one that failed is still rolled up.
+        eq_(MonolithRollupKey.objects.get(id=self.key.id).rolled_until, None)
+        eq_(MonolithRollupKey.objects.get(id=other.id).rolled_until,
+            datetime.date(2013, 4, 8))
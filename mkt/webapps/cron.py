@@ -15,7 +15,7 @@ from lib.es.utils import raise_if_reindex_in_progress
 import amo
 from amo.utils import chunked
 
-from .models import Installed, Webapp
+from .models import Installed
 from .tasks import update_trending, webapp_update_weekly_downloads
 
 log = commonware.log.getLogger('z.cron')
@@ -54,11 +54,7 @@ def update_app_trending():
     """
     Update trending for all apps.
 
-    In testing on the server, each calculation takes about 2.5s. A chunk size
-    of 50 means each task will take about 2 minutes.
+    The installs of all the apps are fetched in two Monolith queries, so this
+    is a single task.
     """
-    chunk_size = 50
-    all_ids = list(Webapp.objects.values_list('id', flat=True))
-
-    for ids in chunked(all_ids, chunk_size):
-        update_trending.delay(ids)
+    update_trending.delay()
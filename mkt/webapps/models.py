@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import collections
 import datetime
 import hashlib
 import json
@@ -25,9 +26,9 @@ import amo
 import amo.models
 from access.acl import action_allowed, check_reviewer
 from addons import query
-from addons.models import (Addon, AddonDeviceType, attach_categories,
-                           attach_devices, attach_prices, attach_tags,
-                           attach_translations, Category)
+from addons.models import (Addon, AddonDeviceType, AddonUpsell, AddonUser,
+                           attach_categories, attach_devices, attach_prices,
+                           attach_tags, attach_translations, Category, Preview)
 from addons.signals import version_changed
 from amo.decorators import skip_cache
 from amo.helpers import absolutify
@@ -35,24 +36,27 @@ from amo.storage_utils import copy_stored_file
 from amo.urlresolvers import reverse
 from amo.utils import JSONEncoder, memoize, memoize_key, smart_path, urlparams
 from constants.applications import DEVICE_TYPES
+from constants.payments import PROVIDER_BANGO
 from files.models import File, nfd_str, Platform
 from files.utils import parse_addon, WebAppParser
-from market.models import AddonPremium
-from stats.models import ClientData
+from market.models import AddonPremium, PriceCurrency
 from translations.fields import save_signal
 from versions.models import Version
 
 from lib.crypto import packaged
+from lib.es.models import IndexChange
 from lib.iarc.client import get_iarc_client
 from lib.iarc.utils import (render_xml, REVERSE_DESC_MAPPING,
                             REVERSE_INTERACTIVES_MAPPING)
 
 import mkt
 from mkt.constants import APP_FEATURES, apps
+from mkt.constants.features import FeatureProfile
 from mkt.regions.utils import parse_region
 from mkt.search.utils import S
 from mkt.site.models import DynamicBoolFieldsMixin
-from mkt.webapps.utils import get_locale_properties, get_supported_locales
+from mkt.webapps.utils import (get_app_data, get_locale_properties,
+                                get_supported_locales)
 
 
 log = commonware.log.getLogger('z.addons')
@@ -1203,6 +1207,24 @@ class WebappIndexer(MappingType, Indexable):
                 ],
             }
 
+        # Typeahead suggestions match the start of the words in the names,
+        # which are indexed as every prefix of them, see `name_suggest`.
+        filters['suggest_edge_ngram'] = {
+            'type': 'edgeNGram',
+            'min_gram': 1,
+            'max_gram': 20,
+        }
+        analyzers['suggest_index'] = {
+            'type': 'custom',
+            'tokenizer': 'standard',
+            'filter': ['lowercase', 'asciifolding', 'suggest_edge_ngram'],
+        }
+        analyzers['suggest_search'] = {
+            'type': 'custom',
+            'tokenizer': 'standard',
+            'filter': ['lowercase', 'asciifolding'],
+        }
+
         return {
             'analyzer': analyzers,
             'filter': filters,
@@ -1234,6 +1256,8 @@ class WebappIndexer(MappingType, Indexable):
                 '_boost': {'name': '_boost', 'null_value': 1.0},
                 'properties': {
                     'id': {'type': 'long'},
+                    # The API data, which is only stored.
+                    'api': {'type': 'object', 'enabled': False},
                     'app_slug': {'type': 'string'},
                     'app_type': {'type': 'byte'},
                     'author': {'type': 'string'},
@@ -1295,6 +1319,9 @@ class WebappIndexer(MappingType, Indexable):
                     'name': {'type': 'string', 'analyzer': 'default_icu'},
                     # Turn off analysis on name so we can sort by it.
                     'name_sort': {'type': 'string', 'index': 'not_analyzed'},
+                    'name_suggest': {'type': 'string',
+                                     'index_analyzer': 'suggest_index',
+                                     'search_analyzer': 'suggest_search'},
                     'owners': {'type': 'long'},
                     'popularity': {'type': 'long'},
                     'premium_type': {'type': 'byte'},
@@ -1312,6 +1339,7 @@ class WebappIndexer(MappingType, Indexable):
                         }
                     },
                     'region_exclusions': {'type': 'short'},
+                    'required_features': {'type': 'byte'},
                     'status': {'type': 'byte'},
                     'support_email': {'type': 'string',
                                       'index': 'not_analyzed'},
@@ -1373,16 +1401,135 @@ class WebappIndexer(MappingType, Indexable):
         return mapping
 
     @classmethod
-    def extract_document(cls, pk, obj=None):
-        """Extracts the ElasticSearch index document for this instance."""
+    def get_related(cls, objs):
+        """
+        Fetches everything `extract_document` needs that the indexing
+        transformer doesn't attach, for all of `objs` at once. This is one
+        query per relation for the whole chunk rather than one per relation
+        for every app.
+        """
+        from editors.models import EscalationQueue
+        from mkt.collections.models import CollectionMembership
+
+        def group(pairs):
+            grouped = collections.defaultdict(list)
+            for key, value in pairs:
+                grouped[key].append(value)
+            return grouped
+
+        ids = [obj.id for obj in objs]
+        related = {}
+
+        # The premium apps the free ones upsell to need their region
+        # exclusions too, so fetch those first.
+        upsells = dict(AddonUpsell.objects.filter(free__in=ids)
+                       .values_list('free', 'premium'))
+        upsold = {}
+        if upsells:
+            upsold = dict((app.id, app) for app in Webapp.with_deleted
+                          .no_cache().filter(id__in=set(upsells.values())))
+        related['upsells'] = dict((free, upsold[premium])
+                                  for free, premium in upsells.items()
+                                  if premium in upsold)
+        all_ids = ids + upsold.keys()
+
+        version_ids = [obj._current_version_id for obj in objs
+                       if obj._current_version_id]
+        related['features'] = dict(
+            (f.version_id, f) for f in
+            AppFeatures.objects.filter(version__in=version_ids))
+        related['escalated'] = set(
+            EscalationQueue.objects.filter(addon__in=ids)
+            .values_list('addon', flat=True))
+
+        # Install counts, in all and from each region.
+        related['installs'] = collections.defaultdict(int)
+        related['install_regions'] = collections.defaultdict(dict)
+        installs = (Installed.objects.filter(addon__in=ids)
+                    .values('addon', 'client_data__region')
+                    .annotate(count=models.Count('id')).order_by())
+        for row in installs:
+            related['installs'][row['addon']] += row['count']
+            if row['client_data__region'] is not None:
+                related['install_regions'][row['addon']][
+                    row['client_data__region']] = row['count']
+
+        related['content_ratings'] = group(
+            (cr.addon_id, cr) for cr in
+            ContentRating.objects.filter(addon__in=ids))
+        related['categories'] = group(
+            Category.objects.filter(addoncategory__addon__in=ids)
+            .values_list('addoncategory__addon', 'slug'))
+        related['collections'] = group(
+            (cms.app_id, cms) for cms in
+            CollectionMembership.objects.filter(app__in=ids))
+        related['owners'] = group(
+            AddonUser.objects.filter(addon__in=ids,
+                                     role=amo.AUTHOR_ROLE_OWNER)
+            .values_list('addon', 'user'))
+        related['previews'] = group(
+            (p.addon_id, p) for p in Preview.objects.filter(addon__in=ids))
+        related['versions'] = group(
+            (v.addon_id, v) for v in Version.objects.filter(addon__in=ids))
+
+        related['premium'] = dict(
+            (p.addon_id, p) for p in
+            AddonPremium.objects.filter(addon__in=all_ids)
+            .select_related('price'))
+        related['excluded_regions'] = group(
+            AddonExcludedRegion.objects.filter(addon__in=all_ids)
+            .values_list('addon', 'region'))
+        tier_ids = set(p.price_id for p in related['premium'].values()
+                       if p.price_id)
+        related['price_regions'] = group(
+            PriceCurrency.objects.filter(tier__in=tier_ids, paid=True,
+                                         provider=PROVIDER_BANGO)
+            .values_list('tier', 'region') if tier_ids else [])
+        return related
+
+    @classmethod
+    def get_excluded_region_ids(cls, obj, related):
+        """The same as `Webapp.get_excluded_region_ids`, from `related`."""
+        excluded = set(related['excluded_regions'].get(obj.id, []))
+        premium = related['premium'].get(obj.id)
+        if obj.is_premium() and premium and premium.price:
+            return excluded.union(
+                set(mkt.regions.ALL_REGION_IDS).difference(
+                    related['price_regions'].get(premium.price_id, [])))
+        return sorted(list(excluded))
+
+    @classmethod
+    def extract_documents(cls, ids, objs=None):
+        """
+        Extracts the ElasticSearch index documents for the apps in `ids`,
+        fetching their related objects in bulk.
+        """
+        if objs is None:
+            objs = Webapp.indexing_transformer(
+                Webapp.with_deleted.no_cache().filter(id__in=ids))
+        objs = list(objs)
+        related = cls.get_related(objs)
+        return [cls.extract_document(obj.id, obj, related) for obj in objs]
+
+    @classmethod
+    def extract_document(cls, pk, obj=None, related=None):
+        """
+        Extracts the ElasticSearch index document for this instance.
+
+        `related` is what `get_related` fetched for a chunk of apps
+        including this one; if it isn't given, it is fetched for this app
+        alone.
+        """
         if obj is None:
             obj = cls.get_model().objects.no_cache().get(pk=pk)
+        if related is None:
+            related = cls.get_related([obj])
 
         latest_version = obj.latest_version
         version = obj.current_version
-        features = (version.features.to_dict()
-                    if version else AppFeatures().to_dict())
-        is_escalated = obj.escalationqueue_set.exists()
+        features = related['features'].get(version.id) if version else None
+        features = (features or AppFeatures()).to_dict()
+        is_escalated = obj.id in related['escalated']
 
         try:
             status = latest_version.statuses[0][1] if latest_version else None
@@ -1390,12 +1537,11 @@ class WebappIndexer(MappingType, Indexable):
             status = None
 
         translations = obj.translations
-        installed_ids = list(Installed.objects.filter(addon=obj)
-                             .values_list('id', flat=True))
+        installs = related['installs'].get(obj.id, 0)
 
         # IARC.
         content_ratings = {}
-        for cr in obj.content_ratings.all():
+        for cr in related['content_ratings'].get(obj.id, []):
             for region in cr.get_region_slugs():
                 body = cr.get_body()
                 rating = cr.get_rating()
@@ -1415,9 +1561,9 @@ class WebappIndexer(MappingType, Indexable):
 
         d['app_type'] = obj.app_type_id
         d['author'] = obj.developer_name
-        d['category'] = list(obj.categories.values_list('slug', flat=True))
+        d['category'] = related['categories'].get(obj.id, [])
         d['collection'] = [{'id': cms.collection_id, 'order': cms.order}
-                           for cms in obj.collectionmembership_set.all()]
+                           for cms in related['collections'].get(obj.id, [])]
         d['content_ratings'] = content_ratings if content_ratings else None
         d['current_version'] = version.version if version else None
         d['default_locale'] = obj.default_locale
@@ -1425,6 +1571,9 @@ class WebappIndexer(MappingType, Indexable):
                                     in translations[obj.description_id]))
         d['device'] = getattr(obj, 'device_ids', [])
         d['features'] = features
+        d['required_features'] = FeatureProfile(
+            **dict((k[len('has_'):], v)
+                   for k, v in features.items())).to_bits()
         d['has_public_stats'] = obj.public_stats
         # TODO: Store all localizations of homepage.
         d['homepage'] = unicode(obj.homepage) if obj.homepage else ''
@@ -1449,24 +1598,24 @@ class WebappIndexer(MappingType, Indexable):
         d['name'] = list(set(string for _, string
                              in translations[obj.name_id]))
         d['name_sort'] = unicode(obj.name).lower()
-        d['owners'] = [au.user.id for au in
-                       obj.addonuser_set.filter(role=amo.AUTHOR_ROLE_OWNER)]
-        d['popularity'] = d['_boost'] = len(installed_ids)
+        d['name_suggest'] = d['name']
+        d['owners'] = related['owners'].get(obj.id, [])
+        d['popularity'] = d['_boost'] = installs
         d['previews'] = [{'filetype': p.filetype,
                           'image_url': p.image_url,
                           'thumbnail_url': p.thumbnail_url}
-                         for p in obj.previews.all()]
-        try:
-            p = obj.addonpremium.price
-            d['price_tier'] = p.name
-        except AddonPremium.DoesNotExist:
+                         for p in related['previews'].get(obj.id, [])]
+        premium = related['premium'].get(obj.id)
+        if premium and premium.price:
+            d['price_tier'] = premium.price.name
+        else:
             d['price_tier'] = None
 
         d['ratings'] = {
             'average': obj.average_rating,
             'count': obj.total_reviews,
         }
-        d['region_exclusions'] = obj.get_excluded_region_ids()
+        d['region_exclusions'] = cls.get_excluded_region_ids(obj, related)
         d['support_email'] = (unicode(obj.support_email)
                               if obj.support_email else None)
         d['support_url'] = (unicode(obj.support_url)
@@ -1478,33 +1627,32 @@ class WebappIndexer(MappingType, Indexable):
             d['supported_locales'] = []
 
         d['tags'] = getattr(obj, 'tag_list', [])
-        if obj.upsell:
-            upsell_obj = obj.upsell.premium
+        upsell_obj = related['upsells'].get(obj.id)
+        if upsell_obj:
             d['upsell'] = {
                 'id': upsell_obj.id,
                 'app_slug': upsell_obj.app_slug,
                 'icon_url': upsell_obj.get_icon_url(128),
                 # TODO: Store all localizations of upsell.name.
                 'name': unicode(upsell_obj.name),
-                'region_exclusions': upsell_obj.get_excluded_region_ids()
+                'region_exclusions': cls.get_excluded_region_ids(upsell_obj,
+                                                                 related)
             }
 
         d['versions'] = [dict(version=v.version,
                               resource_uri=reverse_version(v))
-                         for v in obj.versions.all()]
+                         for v in related['versions'].get(obj.id, [])]
 
         # Calculate regional popularity for "mature regions"
         # (installs + reviews/installs from that region).
-        installs = dict(ClientData.objects.filter(installed__in=installed_ids)
-                        .annotate(region_counts=models.Count('region'))
-                        .values_list('region', 'region_counts').distinct())
+        regions = related['install_regions'].get(obj.id, {})
         for region in mkt.regions.ALL_REGION_IDS:
-            cnt = installs.get(region, 0)
+            cnt = regions.get(region, 0)
             if cnt:
                 # Magic number (like all other scores up in this piece).
                 d['popularity_%s' % region] = d['popularity'] + cnt * 10
             else:
-                d['popularity_%s' % region] = len(installed_ids)
+                d['popularity_%s' % region] = installs
             d['_boost'] += cnt * 10
 
         # Bump the boost if the add-on is public.
@@ -1526,6 +1674,8 @@ class WebappIndexer(MappingType, Indexable):
                     in translations[obj.description_id]
                     if locale.lower() in languages))
 
+        d['api'] = get_app_data(d)
+
         return d
 
     @classmethod
@@ -1544,7 +1694,11 @@ Webapp._meta.translated_fields = Addon._meta.translated_fields
 def update_search_index(sender, instance, **kw):
     from . import tasks
     if not kw.get('raw'):
-        tasks.index_webapps.delay([instance.id])
+        if waffle.switch_is_active('index-changes'):
+            IndexChange.record(WebappIndexer.get_mapping_type_name(),
+                               [instance.id])
+        else:
+            tasks.index_webapps.delay([instance.id])
 
 
 models.signals.pre_save.connect(save_signal, sender=Webapp,
@@ -10,10 +10,12 @@ import time
 from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
 from django.core.files.storage import default_storage as storage
+from django.db import connection, transaction
 from django.template import Context, loader
 
 from celery.exceptions import RetryTaskError
 from celeryutils import task
+import numpy
 from pyelasticsearch.exceptions import ElasticHttpNotFoundError
 from test_utils import RequestFactory
 from tower import ugettext as _
@@ -26,14 +28,15 @@ from amo.utils import chunked, JSONEncoder, send_mail_jinja
 from editors.models import RereviewQueue
 from files.models import FileUpload
 from files.utils import WebAppParser
-from lib.es.utils import get_indices
+from lib.es.utils import BulkIndexer, get_indices
 from lib.metrics import get_monolith_client
 from users.utils import get_task_user
 
 import mkt
 from mkt.constants.regions import WORLDWIDE
 from mkt.developers.tasks import fetch_icon, _fetch_manifest, validator
-from mkt.webapps.models import AppManifest, Webapp, WebappIndexer
+from mkt.search.utils import invalidate_cached_results
+from mkt.webapps.models import AppManifest, Trending, Webapp, WebappIndexer
 from mkt.webapps.utils import get_locale_properties
 
 
@@ -301,12 +304,12 @@ def index_webapps(ids, **kw):
     indices = get_indices(index)
 
     es = WebappIndexer.get_es(urls=settings.ES_URLS)
-    qs = Webapp.indexing_transformer(Webapp.with_deleted.no_cache().filter(
-        id__in=ids))
-    for obj in qs:
-        doc = WebappIndexer.extract_document(obj.id, obj)
-        for idx in indices:
-            WebappIndexer.index(doc, id_=obj.id, es=es, index=idx)
+    bulk = BulkIndexer(es, WebappIndexer.get_mapping_type_name(), indices)
+    for doc in WebappIndexer.extract_documents(ids):
+        bulk.index(doc, doc['id'])
+    bulk.flush()
+    # The cached search results may not be right anymore.
+    invalidate_cached_results()
 
 
 @task(acks_late=True)
@@ -331,6 +334,7 @@ def unindex_webapps(ids, **kw):
                 # Ignore if it's not there.
                 task_log.info(
                     u'[Webapp:%s] Unindexing app but not found in index' % id_)
+    invalidate_cached_results()
 
 
 @task
@@ -454,86 +458,103 @@ def import_manifests(ids, **kw):
                               '%s: %s' % (app.id, version.id, e))
 
 
-def _get_trending(app_id, region=None):
+def _get_installs(start, end):
+    """
+    Returns the installs of every app from `start` to `end` in every region,
+    as {region id: {app id: installs}} with region 0 for all of the regions.
+
+    That is a terms_stats facet over the app ids for each region, all of them
+    in one Monolith query.
+    """
+    def facet(*filters):
+        dates = {'range': {'date': {'gte': start.isoformat(),
+                                    'lte': end.isoformat()}}}
+        return {'terms_stats': {'key_field': 'app-id',
+                                'value_field': 'app_installs', 'size': 0},
+                'facet_filter': {'and': [dates] + list(filters)}}
+
+    facets = {'0': facet()}
+    for region in mkt.regions.REGIONS_DICT.values():
+        facets[str(region.id)] = facet({'term': {'region': region.slug}})
+    res = get_monolith_client().raw({'query': {'match_all': {}},
+                                     'facets': facets, 'size': 0})
+    return dict((int(region), dict((int(t['term']), t['total'])
+                                   for t in res['facets'][region]['terms']))
+                for region in facets)
+
+
+def _installs_array(ids, regions, installs):
+    """
+    Returns an array of the `installs` from `_get_installs`, with a row for
+    each of the `regions` and a column for each of the sorted app `ids`.
+    """
+    counts = numpy.zeros((len(regions), len(ids)))
+    for row, region in enumerate(regions):
+        apps = installs.get(region, {})
+        keys = numpy.fromiter(apps.keys(), dtype=numpy.int64, count=len(apps))
+        values = numpy.fromiter(apps.values(), dtype=float, count=len(apps))
+        columns = numpy.searchsorted(ids, keys)
+        found = columns < len(ids)
+        found[found] = ids[columns[found]] == keys[found]
+        counts[row, columns[found]] = values[found]
+    return counts
+
+
+def _get_trending(ids, regions, recent, prior):
     """
-    Calculate trending.
+    Calculate trending, with a row for each of the `regions` and a column for
+    each of the sorted app `ids`.
 
-    a = installs from 7 days ago to now
-    b = installs from 28 days ago to 8 days ago, averaged per week
+    a = installs from 7 days ago to now, from `recent`
+    b = installs from 28 days ago to 8 days ago, from `prior`, averaged per
+        week
 
     trending = (a - b) / b if a > 100 and b > 1 else 0
 
     """
-    client = get_monolith_client()
+    a = _installs_array(ids, regions, recent)
+    b = _installs_array(ids, regions, prior) / 3
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        return numpy.where((a > 100) & (b > 1), (a - b) / b, 0.0)
 
-    kwargs = {'app-id': app_id}
-    if region:
-        kwargs['region'] = region.slug
 
-    today = datetime.datetime.today()
-    days_ago = lambda d: today - datetime.timedelta(days=d)
-
-    # If we query monolith with interval=week and the past 7 days
-    # crosses a Monday, Monolith splits the counts into two. We want
-    # the sum over the past week so we need to `sum` these.
-    try:
-        count_1 = sum(
-            c['count'] for c in
-            client('app_installs', days_ago(7), today, 'week', **kwargs)
-            if c.get('count'))
-    except ValueError as e:
-        task_log.info('Call to ES failed: {0}'.format(e))
-        count_1 = 0
-
-    # If count_1 isn't more than 100, stop here to avoid extra Monolith calls.
-    if not count_1 > 100:
-        return 0.0
+@task
+@write
+def update_trending(**kw):
+    t_start = time.time()
 
-    # Get the average installs for the prior 3 weeks. Don't use the `len` of
-    # the returned counts because of week boundaries.
+    today = datetime.date.today()
+    days_ago = lambda d: today - datetime.timedelta(days=d)
     try:
-        count_3 = sum(
-            c['count'] for c in
-            client('app_installs', days_ago(28), days_ago(8), 'week', **kwargs)
-            if c.get('count')) / 3
+        recent = _get_installs(days_ago(7), today)
+        prior = _get_installs(days_ago(28), days_ago(8))
     except ValueError as e:
         task_log.info('Call to ES failed: {0}'.format(e))
-        count_3 = 0
-
-    if count_3 > 1:
-        return (count_1 - count_3) / count_3
-    else:
-        return 0.0
-
+        return
 
-@task
-@write
-def update_trending(ids, **kw):
-    count = 0
-    times = []
-
-    for app in Webapp.objects.filter(id__in=ids).no_transforms():
-
-        count += 1
-        t_start = time.time()
-
-        # Calculate global trending, then per-region trending below.
-        value = _get_trending(app.id)
-        if value:
-            trending, created = app.trending.get_or_create(
-                region=0, defaults={'value': value})
-            if not created:
-                trending.update(value=value)
-
-        for region in mkt.regions.REGIONS_DICT.values():
-            value = _get_trending(app.id, region)
-            if value:
-                trending, created = app.trending.get_or_create(
-                    region=region.id, defaults={'value': value})
-                if not created:
-                    trending.update(value=value)
-
-        times.append(time.time() - t_start)
-
-    task_log.debug('Trending calculated for %s apps. Avg time overall: '
-                   '%0.2fs' % (count, sum(times) / count))
+    ids = numpy.array(sorted(Webapp.objects.values_list('id', flat=True)),
+                      dtype=numpy.int64)
+    # Region 0 is trending using install counts across all regions.
+    regions = [0] + sorted(r.id for r in mkt.regions.REGIONS_DICT.values())
+    trending = _get_trending(ids, regions, recent, prior)
+
+    rows, columns = numpy.nonzero(trending)
+    values = zip(ids[columns].tolist(), [regions[r] for r in rows],
+                 trending[rows, columns].tolist())
+    if values:
+        cursor = connection.cursor()
+        cursor.executemany("""
+            INSERT INTO addons_trending
+                (addon_id, region, value, created, modified)
+            VALUES (%s, %s, %s, NOW(), NOW())
+            ON DUPLICATE KEY UPDATE value=VALUES(value), modified=NOW()""",
+            values)
+        transaction.commit_unless_managed()
+
+        # The upsert was SQL, so invalidate the cached trending manually.
+        for chunk in chunked(sorted(set(ids[columns].tolist())), 100):
+            Trending.objects.invalidate(
+                *Trending.objects.no_cache().filter(addon__in=chunk))
+
+    task_log.debug('Trending calculated for %s apps in %0.2fs, %s values '
+                   'written.' % (len(ids), time.time() - t_start, len(values)))
@@ -8,6 +8,7 @@ from django.core.management import call_command
 from django.core.management.base import CommandError
 
 import mock
+import numpy
 from nose.tools import eq_
 
 import amo
@@ -20,8 +21,8 @@ import mkt
 from mkt.site.fixtures import fixture
 from mkt.webapps.cron import (clean_old_signed, update_app_trending,
                               update_weekly_downloads)
-from mkt.webapps.tasks import _get_trending
-from mkt.webapps.models import Installed, Webapp
+from mkt.webapps.tasks import _get_installs, _get_trending
+from mkt.webapps.models import Installed, Trending, Webapp
 
 
 class TestWeeklyDownloads(amo.tests.TestCase):
@@ -144,53 +145,69 @@ class TestUpdateTrending(amo.tests.TestCase):
 
     def setUp(self):
         self.app = Webapp.objects.create(type=amo.ADDON_WEBAPP)
+        self.regions = [0] + sorted(r.id for r in
+                                    mkt.regions.REGIONS_DICT.values())
 
-    @mock.patch('mkt.webapps.tasks._get_trending')
+    def trending(self):
+        return dict(Trending.objects.filter(addon=self.app)
+                    .values_list('region', 'value'))
+
+    @mock.patch('mkt.webapps.tasks._get_installs')
     def test_trending_saved(self, _mock):
-        _mock.return_value = 12.0
+        # 255 installs last week and 85 a week in the 3 weeks before.
+        _mock.return_value = dict((region, {self.app.id: 255.0})
+                                  for region in self.regions)
         update_app_trending()
-
-        eq_(self.app.get_trending(), 12.0)
+        eq_(self.trending(), dict((r, 2.0) for r in self.regions))
+        eq_(self.app.get_trending(), 2.0)
         for region in mkt.regions.REGIONS_DICT.values():
-            eq_(self.app.get_trending(region=region), 12.0)
+            eq_(self.app.get_trending(region=region), 2.0)
 
         # Test running again updates the values as we'd expect.
-        _mock.return_value = 2.0
+        _mock.side_effect = lambda start, end: dict(
+            (region, {self.app.id: 255.0 if end == date.today() else 153.0})
+            for region in self.regions)
         update_app_trending()
-        eq_(self.app.get_trending(), 2.0)
+        eq_(self.trending(), dict((r, 4.0) for r in self.regions))
+        eq_(self.app.get_trending(), 4.0)
         for region in mkt.regions.REGIONS_DICT.values():
-            eq_(self.app.get_trending(region=region), 2.0)
+            eq_(self.app.get_trending(region=region), 4.0)
 
-    @mock.patch('mkt.webapps.tasks.get_monolith_client')
-    def test_get_trending(self, _mock):
-        client = mock.Mock()
-        client.return_value = [
-            {'count': 133.0, 'date': date(2013, 8, 26)},
-            {'count': 122.0, 'date': date(2013, 9, 2)},
-        ]
-        _mock.return_value = client
-
-        # 1st week count: 133 + 122 = 255
-        # Prior 3 weeks get averaged: (133 + 122) / 3 = 85
-        # (255 - 85) / 85 = 2.0
-        eq_(_get_trending(self.app.id), 2.0)
+    @mock.patch('mkt.webapps.tasks._get_installs')
+    def test_trending_not_saved(self, _mock):
+        _mock.return_value = {}
+        update_app_trending()
+        eq_(self.trending(), {})
 
     @mock.patch('mkt.webapps.tasks.get_monolith_client')
-    def test_get_trending_threshold(self, _mock):
-        client = mock.Mock()
-        client.return_value = [
-            {'count': 49.0, 'date': date(2013, 8, 26)},
-            {'count': 50.0, 'date': date(2013, 9, 2)},
-        ]
-        _mock.return_value = client
-
-        # 1st week count: 49 + 50 = 99
-        # 99 is less than 100 so we return 0.0.
-        eq_(_get_trending(self.app.id), 0.0)
+    def test_get_installs(self, _mock):
+        _mock.return_value.raw.return_value = {'facets': dict(
+            (str(region), {'terms': [{'term': self.app.id, 'total': 5.0}]})
+            for region in self.regions)}
+        installs = _get_installs(date(2013, 9, 2), date(2013, 9, 9))
+        eq_(installs, dict((r, {self.app.id: 5.0}) for r in self.regions))
+
+        query = _mock.return_value.raw.call_args[0][0]
+        eq_(sorted(query['facets']), sorted(map(str, self.regions)))
+        facet = query['facets'][str(mkt.regions.BR.id)]
+        eq_(facet['terms_stats']['key_field'], 'app-id')
+        eq_(facet['facet_filter']['and'],
+            [{'range': {'date': {'gte': '2013-09-02', 'lte': '2013-09-09'}}},
+             {'term': {'region': 'br'}}])
+
+    def test_get_trending(self):
+        ids = numpy.array([1, 2, 3, 4])
+        # 1st week count: 255. Prior 3 weeks get averaged: 255 / 3 = 85.
+        # (255 - 85) / 85 = 2.0
+        # App 2 has 99 installs, which is less than 100, so we return 0.0,
+        # app 3 has less than 1 install a week before, and 4 has none.
+        recent = {0: {1: 255.0, 2: 99.0, 3: 255.0, 5: 255.0}, 1: {1: 101.0}}
+        prior = {0: {1: 255.0, 2: 255.0, 3: 2.0}, 1: {1: 303.0}}
+        trending = _get_trending(ids, [0, 1], recent, prior)
+        eq_(trending.tolist(), [[2.0, 0.0, 0.0, 0.0], [0.0, 0.0, 0.0, 0.0]])
 
     @mock.patch('mkt.webapps.tasks.get_monolith_client')
     def test_get_trending_monolith_error(self, _mock):
-        client = mock.Mock()
-        client.side_effect = ValueError
-        _mock.return_value = client
-        eq_(_get_trending(self.app.id), 0.0)
+        _mock.return_value.raw.side_effect = ValueError
+        update_app_trending()
+        eq_(self.trending(), {})
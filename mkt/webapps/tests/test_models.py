@@ -12,6 +12,7 @@ from datetime import datetime, timedelta
 from django.conf import settings
 from django.core import mail
 from django.core.files.storage import default_storage as storage
+from django.db import connection, reset_queries
 from django.db.models.signals import post_delete, post_save
 from django.test.utils import override_settings
 from django.utils.translation import ugettext_lazy as _
@@ -21,28 +22,33 @@ from nose.tools import eq_, ok_, raises
 
 import amo
 from addons.models import (Addon, AddonCategory, AddonDeviceType,
-                           BlacklistedSlug, Category, Preview, version_changed)
+                           AddonUpsell, BlacklistedSlug, Category, Preview,
+                           version_changed)
 from addons.signals import version_changed as version_changed_signal
 from amo.helpers import absolutify
 from amo.tests import app_factory, version_factory
 from amo.urlresolvers import reverse
 from comm.utils import create_comm_thread
 from constants.applications import DEVICE_TYPES
+from constants.payments import PROVIDER_BANGO
 from editors.models import EscalationQueue, RereviewQueue
 from files.models import File
 from files.tests.test_models import UploadTest as BaseUploadTest
 from files.utils import WebAppParser
 from lib.crypto import packaged
 from lib.crypto.tests import mock_sign
+from lib.es.models import IndexChange
 from lib.iarc.utils import (
     DESC_MAPPING, INTERACTIVES_MAPPING, REVERSE_DESC_MAPPING,
     REVERSE_INTERACTIVES_MAPPING)
-from market.models import AddonPremium, Price
+from market.models import AddonPremium, Price, PriceCurrency
+from stats.models import ClientData
 from users.models import UserProfile
 from versions.models import update_status, Version
 
 import mkt
 from mkt.constants import apps
+from mkt.constants.features import FeatureProfile
 from mkt.developers.models import (AddonPaymentAccount, PaymentAccount,
                                    SolitudeSeller)
 from mkt.site.fixtures import fixture
@@ -52,6 +58,7 @@ from mkt.webapps.models import (AddonExcludedRegion, AppFeatures, AppManifest,
                                 ContentRating, Geodata, get_excluded_in,
                                 IARCInfo, Installed, RatingDescriptors,
                                 RatingInteractives, Webapp, WebappIndexer)
+from mkt.webapps.utils import APP_DATA_VERSION
 
 
 class TestWebapp(amo.tests.TestCase):
@@ -1430,6 +1437,24 @@ class TestAppFeatures(DynamicBoolFieldsTestMixin, amo.tests.TestCase):
         eq_(getattr(obj, 'has_%s' % self.flags[0].lower()), False)
 
 
+class TestUpdateSearchIndex(amo.tests.WebappTestCase):
+
+    @mock.patch('mkt.webapps.tasks.index_webapps')
+    def test_task(self, index_webapps):
+        self.app.save()
+        index_webapps.delay.assert_called_with([self.app.id])
+        eq_(IndexChange.objects.count(), 0)
+
+    @mock.patch('mkt.webapps.tasks.index_webapps')
+    def test_change(self, index_webapps):
+        self.create_switch('index-changes')
+        self.app.save()
+        ok_(not index_webapps.delay.called)
+        eq_(list(IndexChange.objects.values_list('mapping_type',
+                                                 'object_id')),
+            [('webapp', self.app.id)])
+
+
 class TestWebappIndexer(amo.tests.TestCase):
     fixtures = fixture('webapp_337141')
 
@@ -1483,6 +1508,13 @@ class TestWebappIndexer(amo.tests.TestCase):
         eq_(doc['latest_version']['has_editor_comment'], False)
         eq_(doc['latest_version']['has_info_request'], False)
 
+    def test_extract_api(self):
+        obj, doc = self._get_doc()
+        eq_(doc['api']['version'], APP_DATA_VERSION)
+        eq_(doc['api']['data']['id'], str(obj.id))
+        eq_(doc['api']['data']['slug'], obj.app_slug)
+        eq_(doc['api']['prices'], {})
+
     def test_extract_category(self):
         cat = Category.objects.create(name='c', type=amo.ADDON_WEBAPP)
         AddonCategory.objects.create(addon=self.app, category=cat)
@@ -1504,6 +1536,8 @@ class TestWebappIndexer(amo.tests.TestCase):
         obj, doc = self._get_doc()
         for k, v in doc['features'].iteritems():
             eq_(v, k in enabled)
+        profile = FeatureProfile(apps=True, sms=True, geolocation=True)
+        eq_(sorted(doc['required_features']), profile.to_bits())
 
     def test_extract_regions(self):
         self.app.addonexcludedregion.create(region=mkt.regions.BR.id)
@@ -1533,6 +1567,80 @@ class TestWebappIndexer(amo.tests.TestCase):
         obj, doc = self._get_doc()
         eq_(doc['is_escalated'], True)
 
+    def test_extract_owners(self):
+        obj, doc = self._get_doc()
+        eq_(doc['owners'], [31337])
+
+    def test_extract_popularity(self):
+        user = UserProfile.objects.get(pk=31337)
+        client = ClientData.objects.create(region=mkt.regions.BR.id,
+                                           is_chromeless=False)
+        Installed.objects.create(addon=self.app, user=user,
+                                 client_data=client)
+        obj, doc = self._get_doc()
+        eq_(doc['popularity'], 1)
+        eq_(doc['popularity_%s' % mkt.regions.BR.id], 11)
+        eq_(doc['popularity_%s' % mkt.regions.US.id], 1)
+
+    def test_extract_popularity_region_installs(self):
+        user = UserProfile.objects.get(pk=31337)
+        client = ClientData.objects.create(region=mkt.regions.BR.id,
+                                           is_chromeless=False)
+        for install_type in (apps.INSTALL_TYPE_USER,
+                             apps.INSTALL_TYPE_REVIEWER):
+            Installed.objects.create(addon=self.app, user=user,
+                                     client_data=client,
+                                     install_type=install_type)
+        obj, doc = self._get_doc()
+        eq_(doc['popularity'], 2)
+        # Each install from the region counts.
+        eq_(doc['popularity_%s' % mkt.regions.BR.id], 22)
+        eq_(doc['popularity_%s' % mkt.regions.US.id], 2)
+
+    def test_extract_premium(self):
+        price = Price.objects.create(name='1', price='0.99')
+        PriceCurrency.objects.create(tier=price, region=mkt.regions.US.id,
+                                     currency='USD', price='0.99',
+                                     provider=PROVIDER_BANGO)
+        AddonPremium.objects.create(addon=self.app, price=price)
+        self.app.update(premium_type=amo.ADDON_PREMIUM)
+        self.app.addonexcludedregion.create(region=mkt.regions.BR.id)
+        obj, doc = self._get_doc()
+        eq_(doc['price_tier'], '1')
+        eq_(doc['region_exclusions'], obj.get_excluded_region_ids())
+        ok_(mkt.regions.US.id not in doc['region_exclusions'])
+
+    def test_extract_upsell(self):
+        upsell = amo.tests.app_factory()
+        upsell.addonexcludedregion.create(region=mkt.regions.BR.id)
+        AddonUpsell.objects.create(free=self.app, premium=upsell)
+        obj, doc = self._get_doc()
+        eq_(doc['upsell']['id'], upsell.id)
+        eq_(doc['upsell']['app_slug'], upsell.app_slug)
+        eq_(doc['upsell']['region_exclusions'], [mkt.regions.BR.id])
+
+    def test_extract_documents(self):
+        app = amo.tests.app_factory()
+        EscalationQueue.objects.create(addon=app)
+        Preview.objects.create(addon=app, filetype='image/png')
+        docs = WebappIndexer.extract_documents([self.app.pk, app.pk])
+        eq_(sorted(doc['id'] for doc in docs), sorted([self.app.pk, app.pk]))
+        for doc in docs:
+            qs = Webapp.indexing_transformer(
+                Webapp.with_deleted.no_cache().filter(id=doc['id']))
+            eq_(doc, WebappIndexer.extract_document(doc['id'], qs[0]))
+
+    @override_settings(DEBUG=True)
+    def test_extract_documents_queries(self):
+        # The number of queries doesn't grow with the number of apps.
+        apps = [amo.tests.app_factory() for i in range(4)]
+        reset_queries()
+        WebappIndexer.extract_documents([apps[0].pk])
+        one = len(connection.queries)
+        reset_queries()
+        WebappIndexer.extract_documents([app.pk for app in apps[1:]])
+        ok_(len(connection.queries) <= one)
+
     @mock.patch.object(mkt.regions.BR, 'ratingsbodies',
                        (mkt.ratingsbodies.PEGI,))
     @mock.patch.object(mkt.ratingsbodies.PEGI, 'name', 'peggyhill')
@@ -17,8 +17,8 @@ from market.models import PriceCurrency
 from mkt.constants import ratingsbodies, regions
 from mkt.site.fixtures import fixture
 from mkt.webapps.models import Installed, Webapp, WebappIndexer
-from mkt.webapps.utils import (app_to_dict, es_app_to_dict,
-                               get_supported_locales)
+from mkt.webapps.utils import (APP_DATA_VERSION, app_to_dict,
+                               es_app_to_dict, get_supported_locales)
 from users.models import UserProfile
 from versions.models import Version
 
@@ -316,6 +316,35 @@ class TestESAppToDict(amo.tests.ESTestCase):
         eq_(res['user'],
             {'developed': True, 'installed': True, 'purchased': True})
 
+    def test_stored_data(self):
+        obj = self.get_obj()
+        eq_(obj._source['api']['version'], APP_DATA_VERSION)
+        with mock.patch('mkt.webapps.utils.get_app_data') as get_app_data:
+            res = es_app_to_dict(obj)
+        ok_(not get_app_data.called)
+        eq_(res['slug'], self.app.app_slug)
+
+    def test_stale_data(self):
+        obj = self.get_obj()
+        obj._source['api']['version'] = APP_DATA_VERSION - 1
+        obj._source['api']['data']['slug'] = 'stale'
+        eq_(es_app_to_dict(obj)['slug'], self.app.app_slug)
+
+    def test_price(self):
+        premium = self.make_premium(self.app, price='0.99')
+        premium.price.update(name='1')
+        self.app.save()
+        self.refresh('webapp')
+
+        res = es_app_to_dict(self.get_obj(), region=regions.US.id)
+        eq_(res['price'], Decimal('0.99'))
+        eq_(res['price_locale'], '$0.99')
+        eq_(res['payment_required'], True)
+
+        res = es_app_to_dict(self.get_obj(), region=regions.BR.id)
+        eq_(res['price'], None)
+        eq_(res['price_locale'], None)
+
     def test_user_not_mine(self):
         self.app.addonuser_set.create(user_id=31337)
         Installed.objects.create(addon=self.app, user_id=31337)
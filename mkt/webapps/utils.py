@@ -1,3 +1,5 @@
+from decimal import Decimal
+
 from django.conf import settings
 from django.utils import translation
 
@@ -8,11 +10,11 @@ from addons.models import AddonUser
 from amo.helpers import absolutify
 from amo.utils import find_language, no_translation
 from constants.applications import DEVICE_TYPES
-from market.models import Price
+from market.models import Price, price_locale
 from users.models import UserProfile
 
 from mkt.purchase.utils import payments_enabled
-from mkt.regions import REGIONS_CHOICES_ID_DICT
+from mkt.regions import REGIONS_CHOICES_ID_DICT, WORLDWIDE
 from mkt.regions.api import RegionResource
 
 log = commonware.log.getLogger('z.webapps')
@@ -160,47 +162,55 @@ def get_attr_lang(src, attr, default_locale):
     return value[0] if value else u''
 
 
-def es_app_to_dict(obj, region=None, profile=None, request=None):
+# The version of the API data that `WebappIndexer` stores with each app, see
+# `get_app_data`. Bump it whenever that data changes: the apps indexed before
+# are then serialized again on every request, until they are reindexed.
+APP_DATA_VERSION = 1
+
+
+def get_app_data(src):
     """
-    Return app data as dict for API where `app` is the elasticsearch result.
+    Returns the part of the API data for an app that is the same for every
+    request, worked out from its elasticsearch document `src`, along with
+    the price of the app in each region.
+
+    `WebappIndexer` stores this in the document, so that `es_app_to_dict`
+    only has to add the parts that depend on the language, the region and
+    the user.
     """
     # Circular import.
     from mkt.api.base import GenericObject
-    from mkt.api.resources import AppResource, PrivacyPolicyResource
+    from mkt.api.resources import PrivacyPolicyResource
     from mkt.developers.api import AccountResource
     from mkt.developers.models import AddonPaymentAccount
-    from mkt.webapps.models import Installed, Webapp
+    from mkt.webapps.models import Webapp
 
-    src = obj._source
     # The following doesn't perform a database query, but gives us useful
-    # methods like `get_detail_url`. If you use `obj` make sure the calls
+    # methods like `get_detail_url`. If you use `app` make sure the calls
     # don't query the database.
     is_packaged = src.get('app_type') != amo.ADDON_WEBAPP_HOSTED
-    app = Webapp(app_slug=obj.app_slug, is_packaged=is_packaged)
+    app = Webapp(app_slug=src.get('app_slug'), is_packaged=is_packaged)
 
     attrs = ('content_ratings', 'created', 'current_version', 'default_locale',
              'homepage', 'manifest_url', 'previews', 'ratings', 'status',
              'support_email', 'support_url', 'weekly_downloads')
-    data = dict((a, getattr(obj, a, None)) for a in attrs)
+    data = dict((a, src.get(a)) for a in attrs)
     data.update({
         'absolute_url': absolutify(app.get_detail_url()),
         'app_type': app.app_type,
         'author': src.get('author', ''),
-        'categories': [c for c in obj.category],
-        'description': get_attr_lang(src, 'description', obj.default_locale),
+        'categories': [c for c in src.get('category')],
         'device_types': [DEVICE_TYPES[d].api_name for d in src.get('device')],
-        'icons': dict((i['size'], i['url']) for i in src.get('icons')),
-        'id': str(obj._id),
+        'id': str(src['id']),
         'is_packaged': is_packaged,
-        'name': get_attr_lang(src, 'name', obj.default_locale),
         'payment_required': False,
         'premium_type': amo.ADDON_PREMIUM_API[src.get('premium_type')],
         'privacy_policy': PrivacyPolicyResource().get_resource_uri(
-            GenericObject({'pk': obj._id})
+            GenericObject({'pk': src['id']})
         ),
-        'public_stats': obj.has_public_stats,
+        'public_stats': src.get('has_public_stats'),
         'supported_locales': src.get('supported_locales', ''),
-        'slug': obj.app_slug,
+        'slug': src.get('app_slug'),
         # TODO: Remove the type check once this code rolls out and our indexes
         # aren't between mapping changes.
         'versions': dict((v.get('version'), v.get('resource_uri')) for v in
@@ -210,11 +220,6 @@ def es_app_to_dict(obj, region=None, profile=None, request=None):
     if not data['public_stats']:
         data['weekly_downloads'] = None
 
-    data['regions'] = RegionResource().dehydrate_objects(
-        map(REGIONS_CHOICES_ID_DICT.get,
-            app.get_region_ids(worldwide=True,
-                               excluded=obj.region_exclusions)))
-
     if src.get('premium_type') in amo.ADDON_PREMIUMS:
         acct = list(AddonPaymentAccount.objects.filter(addon=app))
         if acct and acct.payment_account:
@@ -223,6 +228,54 @@ def es_app_to_dict(obj, region=None, profile=None, request=None):
     else:
         data['payment_account'] = None
 
+    # The price and currency in each region the app can be paid for in.
+    prices = {}
+    price_tier = src.get('price_tier')
+    if price_tier:
+        try:
+            price = Price.objects.get(name=price_tier)
+        except Price.DoesNotExist:
+            log.warning('Issue with price tier on app: {0}'.format(src['id']))
+            data['payment_required'] = True
+        else:
+            for region in REGIONS_CHOICES_ID_DICT:
+                price_currency = price.get_price_currency(region=region)
+                if price_currency and price_currency.paid:
+                    prices[str(region)] = (str(price_currency.price),
+                                           price_currency.currency)
+            data['payment_required'] = bool(price.price)
+
+    return {'version': APP_DATA_VERSION, 'data': data, 'prices': prices}
+
+
+def es_app_to_dict(obj, region=None, profile=None, request=None):
+    """
+    Return app data as dict for API where `app` is the elasticsearch result.
+
+    The data `WebappIndexer` stored with the app is used if it is of the
+    current `APP_DATA_VERSION`.
+    """
+    # Circular import.
+    from mkt.api.resources import AppResource
+    from mkt.webapps.models import Installed, Webapp
+
+    src = obj._source
+    stored = src.get('api')
+    if not stored or stored.get('version') != APP_DATA_VERSION:
+        stored = get_app_data(src)
+    data = dict(stored['data'])
+    data.update({
+        'description': get_attr_lang(src, 'description', obj.default_locale),
+        # Stored, these sizes would have become strings.
+        'icons': dict((i['size'], i['url']) for i in src.get('icons')),
+        'name': get_attr_lang(src, 'name', obj.default_locale),
+    })
+
+    data['regions'] = RegionResource().dehydrate_objects(
+        map(REGIONS_CHOICES_ID_DICT.get,
+            Webapp().get_region_ids(worldwide=True,
+                                    excluded=obj.region_exclusions)))
+
     data['upsell'] = False
     if hasattr(obj, 'upsell'):
         exclusions = obj.upsell.get('region_exclusions')
@@ -232,20 +285,10 @@ def es_app_to_dict(obj, region=None, profile=None, request=None):
                 Webapp(id=obj.upsell['id']))
 
     data['price'] = data['price_locale'] = None
-    try:
-        price_tier = src.get('price_tier')
-        if price_tier:
-            price = Price.objects.get(name=price_tier)
-            if (data['upsell'] or payments_enabled(request)):
-                price_currency = price.get_price_currency(region=region)
-                if price_currency and price_currency.paid:
-                    data['price'] = price.get_price(region=region)
-                    data['price_locale'] = price.get_price_locale(
-                        region=region)
-            data['payment_required'] = bool(price.price)
-    except Price.DoesNotExist:
-        log.warning('Issue with price tier on app: {0}'.format(obj._id))
-        data['payment_required'] = True
+    price = stored['prices'].get(str(region or WORLDWIDE.id))
+    if price and (data['upsell'] or payments_enabled(request)):
+        data['price'] = Decimal(price[0])
+        data['price_locale'] = price_locale(data['price'], price[1])
 
     # TODO: Let's get rid of these from the API to avoid db hits.
     if profile and isinstance(profile, UserProfile):
@@ -13,6 +13,7 @@ HOME=/tmp
 #once per hour
 5 * * * * %(z_cron)s update_collections_subscribers
 10 * * * * %(z_cron)s update_blog_posts
+15 * * * * %(z_cron)s recs_changes
 20 * * * * %(z_cron)s addon_last_updated
 25 * * * * %(z_cron)s update_collections_votes
 45 * * * * %(z_cron)s update_addon_appsupport
@@ -67,6 +68,7 @@ HOME=/tmp
 35 6 * * * %(z_cron)s update_monolith_stats
 30 7 * * * %(z_cron)s index_latest_stats
 35 7 * * * %(z_cron)s index_latest_mkt_stats --settings=settings_local_mkt
+40 7 * * * %(z_cron)s update_monolith_rollups --settings=settings_local_mkt
 45 7 * * * %(z_cron)s update_addons_collections_downloads
 50 7 * * * %(z_cron)s update_daily_theme_user_counts
 
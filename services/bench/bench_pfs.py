@@ -0,0 +1,68 @@
+"""
+Times `services.pfs.get_output` for a spread of plugin finder requests.
+
+    python services/bench/bench_pfs.py [-n NUMBER]
+
+It reports the cost per request with the rendered response cache cleared
+before every request (cold) and with it left alone (warm). To compare with
+another revision, check it out and run this again: only `get_output` is
+needed, so revisions without the cache report the same number for both.
+"""
+import itertools
+import optparse
+import os
+import site
+import timeit
+
+bench_dir = os.path.dirname(__file__)
+for path in ['../', '../..', '../../lib', '../../vendor/lib/python',
+             '../../apps']:
+    site.addsitedir(os.path.abspath(os.path.join(bench_dir, path)))
+
+import pfs
+
+
+MIMETYPES = [
+    'application/x-shockwave-flash', 'application/x-director',
+    'audio/x-pn-realaudio', 'video/quicktime',
+    'application/x-java-applet;version=1.5', 'application/pdf',
+    'video/x-ms-wmv', 'video/vnd.divx', 'application/x-unknown',
+]
+OSES = ['Windows NT 6.1', 'Intel Mac OS X 10.8', 'Linux x86_64']
+LOCALES = ['en-US', 'ja-JP']
+
+REQUESTS = [dict(mimetype=mimetype, clientOS=os_, chromeLocale=locale,
+                 appID='{ec8030f7-c20a-464f-9b0e-13a3a9e97384}',
+                 appVersion='26.0')
+            for mimetype, os_, locale
+            in itertools.product(MIMETYPES, OSES, LOCALES)]
+
+
+def cold():
+    cache = getattr(pfs, 'output_cache', None)
+    for data in REQUESTS:
+        if cache is not None:
+            cache.clear()
+        pfs.get_output(data)
+
+
+def warm():
+    for data in REQUESTS:
+        pfs.get_output(data)
+
+
+def main():
+    parser = optparse.OptionParser(usage=__doc__.strip())
+    parser.add_option('-n', '--number', type='int', default=200,
+                      help='times to replay every request [%default]')
+    options, args = parser.parse_args()
+
+    total = options.number * len(REQUESTS)
+    for name, func in [('cold', cold), ('warm', warm)]:
+        func()
+        secs = min(timeit.repeat(func, repeat=3, number=options.number))
+        print '%s: %.1f usec per request' % (name, secs / total * 1e6)
+
+
+if __name__ == '__main__':
+    main()
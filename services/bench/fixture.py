@@ -0,0 +1,366 @@
+"""
+A stand-in for the zamboni database with only the tables and columns the
+services read, filled with generated add-ons, and the requests to replay
+against it.
+
+The numbers of versions, files and applications per add-on, and how often
+each add-on is asked about, are skewed the way they are on AMO: most add-ons
+have a handful of versions and most update pings are for a few very popular
+add-ons.
+"""
+from datetime import datetime, timedelta
+import hashlib
+import random
+import urllib
+import uuid
+
+try:
+    from compare import version_int
+except ImportError:
+    from apps.versions.compare import version_int
+
+from constants import applications, base
+from constants.platforms import (PLATFORM_ALL, PLATFORM_LINUX, PLATFORM_MAC,
+                                 PLATFORM_WIN)
+
+
+SCHEMA = [
+    """CREATE TABLE addons (
+        id int NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        guid varchar(255) UNIQUE,
+        slug varchar(30),
+        name int,
+        summary int,
+        status tinyint NOT NULL,
+        addontype_id int NOT NULL,
+        inactive tinyint NOT NULL DEFAULT 0,
+        premium_type tinyint NOT NULL DEFAULT 0,
+        current_version int,
+        modified datetime NOT NULL)""",
+    """CREATE TABLE versions (
+        id int NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        addon_id int NOT NULL,
+        version varchar(255) NOT NULL,
+        releasenotes int,
+        modified datetime NOT NULL,
+        KEY (addon_id))""",
+    """CREATE TABLE files (
+        id int NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        version_id int NOT NULL,
+        platform_id int NOT NULL,
+        status tinyint NOT NULL,
+        hash varchar(255),
+        filename varchar(255) NOT NULL,
+        datestatuschanged datetime,
+        strict_compatibility tinyint NOT NULL DEFAULT 0,
+        binary_components tinyint NOT NULL DEFAULT 0,
+        modified datetime NOT NULL,
+        KEY (version_id))""",
+    """CREATE TABLE applications (
+        id int NOT NULL PRIMARY KEY,
+        guid varchar(255) NOT NULL)""",
+    """CREATE TABLE appversions (
+        id int NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        application_id int NOT NULL,
+        version varchar(255) NOT NULL,
+        version_int bigint NOT NULL)""",
+    """CREATE TABLE applications_versions (
+        id int NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        application_id int NOT NULL,
+        version_id int NOT NULL,
+        min int NOT NULL,
+        max int NOT NULL,
+        KEY (version_id))""",
+    """CREATE TABLE incompatible_versions (
+        id int NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        version_id int NOT NULL,
+        app_id int NOT NULL,
+        min_app_version varchar(255) NOT NULL,
+        max_app_version varchar(255) NOT NULL,
+        min_app_version_int bigint,
+        max_app_version_int bigint,
+        modified datetime NOT NULL,
+        KEY (version_id))""",
+    """CREATE TABLE translations (
+        autoid int NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        id int NOT NULL,
+        locale varchar(10) NOT NULL,
+        localized_string text,
+        UNIQUE KEY (id, locale))""",
+    """CREATE TABLE personas (
+        id int NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        addon_id int NOT NULL,
+        persona_id int NOT NULL,
+        display_username varchar(255),
+        header varchar(64),
+        footer varchar(64),
+        accentcolor varchar(10),
+        textcolor varchar(10),
+        KEY (addon_id),
+        KEY (persona_id))""",
+    """CREATE TABLE users_install (
+        id int NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        addon_id int NOT NULL,
+        user_id int NOT NULL,
+        uuid varchar(255) NOT NULL,
+        premium_type tinyint NOT NULL DEFAULT 0,
+        KEY (addon_id, uuid))""",
+    """CREATE TABLE addon_purchase (
+        id int NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        addon_id int NOT NULL,
+        user_id int NOT NULL,
+        type tinyint NOT NULL,
+        KEY (addon_id, user_id))""",
+]
+
+# The applications add-ons are made for, and how likely each is.
+APPS = [(applications.FIREFOX, 0.85), (applications.THUNDERBIRD, 0.08),
+        (applications.SEAMONKEY, 0.04), (applications.MOBILE, 0.03)]
+APP_VERSIONS = ['%s.0' % major for major in range(3, 27)] + ['*']
+
+# The appVersion of the update pings, most of them on a recent release.
+PING_APP_VERSIONS = [('26.0', 0.45), ('25.0.1', 0.2), ('24.0', 0.15),
+                     ('17.0.10', 0.1), ('3.6.28', 0.1)]
+PING_OSES = [('WINNT', 0.85), ('Darwin', 0.08), ('Linux', 0.07)]
+COMPAT_MODES = [('normal', 0.9), ('strict', 0.08), ('ignore', 0.02)]
+LOCALES = [('en-US', 0.5), ('de', 0.12), ('fr', 0.1), ('es-ES', 0.1),
+           ('ja', 0.08), ('pt-BR', 0.1)]
+MIMETYPES = [('application/x-shockwave-flash', 0.6),
+             ('application/pdf', 0.1), ('video/x-ms-wmv', 0.08),
+             ('application/x-java-applet', 0.07), ('video/quicktime', 0.05),
+             ('application/x-director', 0.03), ('video/vnd.divx', 0.02),
+             ('application/x-unknown', 0.05)]
+CLIENT_OSES = [('Windows NT 6.1', 0.7), ('Intel Mac OS X 10.8', 0.2),
+               ('Linux x86_64', 0.1)]
+
+# How much more often popular add-ons are asked about, see `popular`.
+POPULARITY = 1.1
+BATCH = 1000
+
+
+def choose(weighted):
+    """Picks one value of the (value, weight) pairs in `weighted`."""
+    point = random.uniform(0, sum(weight for value, weight in weighted))
+    for value, weight in weighted:
+        point -= weight
+        if point <= 0:
+            return value
+    return weighted[-1][0]
+
+
+def popular(items):
+    """Picks one of `items`, which are sorted by popularity."""
+    index = int(random.paretovariate(POPULARITY)) - 1
+    return items[min(index, len(items) - 1)]
+
+
+class Fixture(object):
+    """
+    Fills the empty database behind `cursor` with `seed`, or reads back what
+    is in it with `load`, and makes up requests for what is there.
+    """
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.now = datetime.now()
+        self.translation_id = 0
+        # (guid, app, [version strings]) of the add-ons, the most popular
+        # first.
+        self.addons = []
+        # (addon id, persona id) of the themes, the most popular first.
+        self.themes = []
+        self.rows = dict((table, []) for table in (
+            'addons', 'versions', 'files', 'applications_versions',
+            'incompatible_versions', 'translations', 'personas'))
+        self.appversions = {}
+
+    def insert(self, table, **row):
+        self.rows[table].append(row)
+        if len(self.rows[table]) >= BATCH:
+            self.flush(table)
+
+    def flush(self, table):
+        rows = self.rows[table]
+        if not rows:
+            return
+        columns = sorted(rows[0])
+        self.cursor.executemany(
+            'INSERT INTO %s (%s) VALUES (%s)' % (
+                table, ', '.join(columns),
+                ', '.join('%%(%s)s' % column for column in columns)),
+            rows)
+        self.rows[table] = []
+
+    def translation(self, string):
+        self.translation_id += 1
+        self.insert('translations', id=self.translation_id, locale='en-US',
+                    localized_string=string)
+        if random.random() < 0.2:
+            self.insert('translations', id=self.translation_id,
+                        locale=choose(LOCALES[1:]),
+                        localized_string=string[::-1])
+        return self.translation_id
+
+    def seed(self, addons, themes):
+        for statement in SCHEMA:
+            self.cursor.execute(statement)
+        self.seed_apps()
+        version_id, file_id = 0, 0
+        for addon_id in range(1, addons + 1):
+            version_id, file_id = self.seed_addon(addon_id, version_id,
+                                                  file_id)
+        for addon_id in range(addons + 1, addons + themes + 1):
+            self.seed_theme(addon_id)
+        for table in self.rows:
+            self.flush(table)
+
+    def load(self):
+        apps = dict((app.id, app) for app, weight in APPS)
+        self.cursor.execute("""
+            SELECT addons.id, addons.guid,
+                applications_versions.application_id, versions.version
+            FROM addons
+            INNER JOIN versions ON versions.addon_id = addons.id
+            INNER JOIN applications_versions
+                ON applications_versions.version_id = versions.id
+            WHERE addons.guid IS NOT NULL
+            ORDER BY addons.id, versions.id""")
+        last = None
+        for addon_id, guid, app_id, version in self.cursor.fetchall():
+            if addon_id != last:
+                self.addons.append((guid, apps[app_id], []))
+                last = addon_id
+            self.addons[-1][2].append(version)
+
+        self.cursor.execute('SELECT addon_id, persona_id FROM personas '
+                            'ORDER BY addon_id')
+        self.themes = list(self.cursor.fetchall())
+
+    def seed_apps(self):
+        appversion_id = 0
+        for app, weight in APPS:
+            self.cursor.execute('INSERT INTO applications (id, guid) '
+                                'VALUES (%s, %s)', (app.id, app.guid))
+            for version in APP_VERSIONS:
+                appversion_id += 1
+                self.cursor.execute(
+                    'INSERT INTO appversions (id, application_id, version, '
+                    'version_int) VALUES (%s, %s, %s, %s)',
+                    (appversion_id, app.id, version, version_int(version)))
+                self.appversions[app.id, version] = appversion_id
+
+    def seed_addon(self, addon_id, version_id, file_id):
+        guid = '{%s}' % uuid.uuid4()
+        status = choose([(base.STATUS_PUBLIC, 0.9), (base.STATUS_LITE, 0.07),
+                         (base.STATUS_DISABLED, 0.03)])
+        app = choose(APPS)
+        # Most add-ons have a few versions, some have a great many.
+        count = min(int(random.paretovariate(1.2)), 100)
+        changed = self.now - timedelta(days=random.randint(1, 1000))
+        for number in range(count):
+            version_id += 1
+            version = '%s.%s' % (number // 10, number % 10)
+            self.insert('versions', id=version_id, addon_id=addon_id,
+                        version=version, modified=changed,
+                        releasenotes=(self.translation('Notes')
+                                      if random.random() < 0.3 else None))
+
+            # Later versions support later app versions.
+            low = min(number * len(APP_VERSIONS) // count,
+                      len(APP_VERSIONS) - 2)
+            high = random.randint(low, len(APP_VERSIONS) - 2)
+            self.insert('applications_versions', application_id=app.id,
+                        version_id=version_id,
+                        min=self.appversions[app.id, APP_VERSIONS[low]],
+                        max=self.appversions[app.id, APP_VERSIONS[high]])
+            if random.random() < 0.01:
+                self.insert('incompatible_versions', version_id=version_id,
+                            app_id=app.id, min_app_version='0',
+                            max_app_version=APP_VERSIONS[high],
+                            min_app_version_int=None,
+                            max_app_version_int=version_int(
+                                APP_VERSIONS[high]),
+                            modified=changed)
+
+            if random.random() < 0.9:
+                platforms = [PLATFORM_ALL.id]
+            else:
+                platforms = [PLATFORM_WIN.id, PLATFORM_MAC.id,
+                             PLATFORM_LINUX.id]
+            if random.random() < 0.05:
+                file_status = base.STATUS_BETA
+            elif status == base.STATUS_LITE:
+                file_status = base.STATUS_LITE
+            else:
+                file_status = base.STATUS_PUBLIC
+            for platform in platforms:
+                file_id += 1
+                self.insert(
+                    'files', id=file_id, version_id=version_id,
+                    platform_id=platform, status=file_status,
+                    hash='sha256:%s' % hashlib.sha256(guid + version)
+                                              .hexdigest(),
+                    filename='addon-%s-%s.xpi' % (addon_id, version),
+                    datestatuschanged=changed, modified=changed,
+                    strict_compatibility=int(random.random() < 0.05),
+                    binary_components=int(random.random() < 0.05))
+
+        self.insert('addons', id=addon_id, guid=guid, slug=None,
+                    name=self.translation('Add-on %s' % addon_id),
+                    summary=None, status=status,
+                    addontype_id=base.ADDON_EXTENSION, current_version=None,
+                    modified=changed)
+        return version_id, file_id
+
+    def seed_theme(self, addon_id):
+        self.insert('addons', id=addon_id, guid=None,
+                    slug='theme-%s' % addon_id,
+                    name=self.translation('Theme %s' % addon_id),
+                    summary=self.translation('A theme'),
+                    status=base.STATUS_PUBLIC, addontype_id=base.ADDON_PERSONA,
+                    current_version=None,
+                    modified=self.now - timedelta(
+                        days=random.randint(1, 1000)))
+        # Themes imported from getpersonas.com have their own id.
+        persona_id = addon_id if random.random() < 0.5 else 0
+        self.insert('personas', addon_id=addon_id, persona_id=persona_id,
+                    display_username='user%s' % addon_id,
+                    header='header.png', footer='footer.png',
+                    accentcolor='ffffff', textcolor='000000')
+
+    def update_requests(self, number):
+        """The paths and query strings of `number` update pings."""
+        requests = []
+        for i in range(number):
+            if random.random() < 0.05:
+                # Add-ons that aren't hosted on AMO ping us too.
+                guid, app, versions = '{%s}' % uuid.uuid4(), APPS[0][0], []
+            else:
+                guid, app, versions = popular(self.addons)
+            requests.append('/update/VersionCheck.php?' + urllib.urlencode([
+                ('reqVersion', 2), ('id', guid),
+                ('version', random.choice(versions or ['1.0'])),
+                ('status', 'userEnabled'), ('appID', app.guid),
+                ('appVersion', choose(PING_APP_VERSIONS)),
+                ('appOS', choose(PING_OSES)), ('appABI', 'x86-msvc'),
+                ('locale', choose(LOCALES)), ('updateType', 112),
+                ('compatMode', choose(COMPAT_MODES))]))
+        return requests
+
+    def theme_update_requests(self, number):
+        requests = []
+        for i in range(number):
+            addon_id, persona_id = popular(self.themes)
+            path = '/%s/themes/update-check/' % choose(LOCALES)
+            if persona_id:
+                requests.append('%s%s?src=gp' % (path, persona_id))
+            else:
+                requests.append('%s%s' % (path, addon_id))
+        return requests
+
+    def pfs_requests(self, number):
+        return ['/plugins/PluginFinderService.php?' + urllib.urlencode([
+            ('mimetype', choose(MIMETYPES)), ('appID', APPS[0][0].guid),
+            ('appVersion', '20131112160018'),
+            ('clientOS', choose(CLIENT_OSES)),
+            ('chromeLocale', choose(LOCALES))]) for i in range(number)]
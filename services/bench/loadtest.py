@@ -0,0 +1,86 @@
+"""
+Replays recorded requests against a running service, as many at once as
+`--concurrency`, and reports the latency and throughput. For example::
+
+    python services/bench/loadtest.py -c 500 -n 20000 \
+        http://127.0.0.1:9000 versioncheck.txt
+
+Every line of the file is appended to the URL, so it holds the path and query
+string of one request as it appears in the access logs::
+
+    /update/VersionCheck.php?reqVersion=2&id=...&appVersion=26.0&...
+
+With `--post` every line is posted to the URL instead, which is how receipts
+are sent to receiptverify. The lines are replayed in a loop until
+`--number` requests have been made.
+
+Run the service against a local MySQL, for example a copy of the test
+database, rather than anything shared. The requests are made from gevent
+greenlets when it is installed, and from threads otherwise.
+"""
+import collections
+import itertools
+import optparse
+import time
+
+try:
+    from gevent import monkey
+    monkey.patch_all()
+    from gevent.pool import Pool
+except ImportError:
+    from multiprocessing.pool import ThreadPool as Pool
+
+import urllib2
+
+from results import report
+
+
+def fetch(url, data=None):
+    """Returns the status of the request to `url`, and how long it took."""
+    start = time.time()
+    try:
+        response = urllib2.urlopen(url, data)
+        response.read()
+        status = response.getcode()
+    except urllib2.HTTPError, err:
+        status = err.code
+    except Exception, err:
+        status = err.__class__.__name__
+    return status, time.time() - start
+
+
+def main():
+    parser = optparse.OptionParser(usage=__doc__.strip())
+    parser.add_option('-c', '--concurrency', type='int', default=100,
+                      help='requests to have in flight at once [%default]')
+    parser.add_option('-n', '--number', type='int', default=10000,
+                      help='requests to make in total [%default]')
+    parser.add_option('--post', action='store_true', default=False,
+                      help='post every line to the URL')
+    options, args = parser.parse_args()
+    if len(args) != 2:
+        parser.error('Give the URL of the service and the file to replay.')
+
+    url, filename = args
+    with open(filename) as f:
+        lines = [line.strip() for line in f if line.strip()]
+    if not lines:
+        parser.error('There is nothing to replay in %s.' % filename)
+
+    if options.post:
+        request = lambda line: fetch(url, line)
+    else:
+        request = lambda line: fetch(url + line)
+
+    replay = itertools.islice(itertools.cycle(lines), options.number)
+    start = time.time()
+    results = Pool(options.concurrency).map(request, replay)
+    elapsed = time.time() - start
+
+    statuses = collections.Counter(status for status, timing in results)
+    report(url, [timing for status, timing in results], elapsed,
+           ['%s: %d' % item for item in sorted(statuses.items())])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+"""
+Replays requests through the `application` of each service in this process,
+against a scratch MySQL database, and reports the latency percentiles, the
+queries per request and the requests per second. Nothing has to be served
+and nothing but the scratch database is touched. For example::
+
+    python services/bench/replay.py --seed --database services_bench
+    python services/bench/replay.py --database services_bench -n 20000 \
+        update theme_update pfs
+
+`--seed` creates the database, which must not exist yet, with only the
+tables the services read and fills it with generated add-ons, see
+`fixture.py`. Without `--requests`, the requests are made up from what is in
+the database, with as many of them for popular add-ons as there are on AMO.
+To replay recorded requests instead, give a file of them for the service,
+one path and query string per line as in the access logs, or one receipt per
+line for verify::
+
+    python services/bench/replay.py --database services_bench \
+        --requests update=versioncheck.txt update
+"""
+import collections
+import optparse
+import os
+import random
+import site
+import sys
+import time
+import urllib
+from StringIO import StringIO
+from urlparse import parse_qsl, urlparse
+
+bench_dir = os.path.dirname(__file__)
+for path in ['../', '../..', '../../lib', '../../vendor/lib/python',
+             '../../apps']:
+    site.addsitedir(os.path.abspath(os.path.join(bench_dir, path)))
+
+import utils
+from utils import settings
+
+from fixture import Fixture
+from results import report
+
+
+SERVICES = ['update', 'update_batch', 'theme_update', 'pfs', 'verify']
+
+# The number of queries sent for the request being replayed.
+queries = [0]
+
+
+class CountingCursor(object):
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def execute(self, *args, **kw):
+        queries[0] += 1
+        return self.cursor.execute(*args, **kw)
+
+    def executemany(self, *args, **kw):
+        queries[0] += 1
+        return self.cursor.executemany(*args, **kw)
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+
+class CountingConnection(object):
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def cursor(self, *args, **kw):
+        return CountingCursor(self.conn.cursor(*args, **kw))
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+
+real_getconn = utils.getconn
+
+
+def getconn():
+    return CountingConnection(real_getconn())
+
+
+def get_application(service):
+    """Returns the WSGI application of `service`."""
+    if service == 'update':
+        from update import application
+    elif service == 'update_batch':
+        from update import batch_application as application
+    elif service == 'theme_update':
+        from theme_update import application
+    elif service == 'pfs':
+        from pfs import application
+    elif service == 'verify':
+        from verify import application
+    return application
+
+
+def get_requests(service, fixture, number, filename=None):
+    """Returns `number` WSGI environs of requests for `service`."""
+    if filename:
+        with open(filename) as f:
+            lines = [line.strip() for line in f if line.strip()]
+        lines = [lines[i % len(lines)] for i in range(number)]
+    elif service == 'update':
+        lines = fixture.update_requests(number)
+    elif service == 'update_batch':
+        lines = batch_requests(fixture, number)
+    elif service == 'theme_update':
+        lines = fixture.theme_update_requests(number)
+    elif service == 'pfs':
+        lines = fixture.pfs_requests(number)
+    else:
+        raise ValueError('There are no requests for %s, give a file of them '
+                         'with --requests.' % service)
+
+    environs = []
+    for line in lines:
+        if service == 'verify':
+            environ = {'REQUEST_METHOD': 'POST', 'QUERY_STRING': '',
+                       'PATH_INFO': urlparse(settings.WEBAPPS_RECEIPT_URL)
+                                    .path,
+                       'wsgi.input': line}
+        else:
+            url = urlparse(line)
+            environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': url.path,
+                       'QUERY_STRING': url.query, 'wsgi.input': ''}
+        environs.append(environ)
+    return environs
+
+
+def batch_requests(fixture, number, size=20):
+    """Update pings for `size` add-ons at once, like the batch endpoint."""
+    requests = []
+    for i in range(number):
+        pings = [parse_qsl(urlparse(line).query)
+                 for line in fixture.update_requests(size)]
+        query = [(k, v) for k, v in pings[0] if k not in ('id', 'version')]
+        for ping in pings:
+            query.extend((k, v) for k, v in ping if k in ('id', 'version'))
+        requests.append('/update/VersionCheck.php?' + urllib.urlencode(query))
+    return requests
+
+
+def replay(service, environs, cold=False):
+    application = get_application(service)
+    module = sys.modules[application.__module__]
+    caches = [value for value in vars(module).values()
+              if isinstance(value, utils.LRUCache)]
+
+    statuses = collections.Counter()
+    timings, counts = [], []
+
+    def start_response(status, headers):
+        statuses[status.split()[0]] += 1
+
+    start = time.time()
+    for environ in environs:
+        if cold:
+            for cache in caches:
+                cache.clear()
+        environ = dict(environ, **{'wsgi.input': StringIO(
+            environ['wsgi.input'])})
+        queries[0] = 0
+        began = time.time()
+        ''.join(application(environ, start_response))
+        timings.append(time.time() - began)
+        counts.append(queries[0])
+    elapsed = time.time() - start
+
+    report(service, timings, elapsed,
+           ['%.2f queries/request' % (float(sum(counts)) / len(counts))] +
+           ['%s: %d' % item for item in sorted(statuses.items())])
+
+
+def main():
+    parser = optparse.OptionParser(usage=__doc__.strip())
+    parser.add_option('--database',
+                      help='the scratch database to use instead of '
+                           'SERVICES_DATABASE["NAME"]')
+    parser.add_option('--seed', action='store_true', default=False,
+                      help='create the database and fill it')
+    parser.add_option('--addons', type='int', default=20000,
+                      help='add-ons to seed [%default]')
+    parser.add_option('--themes', type='int', default=10000,
+                      help='themes to seed [%default]')
+    parser.add_option('-n', '--number', type='int', default=5000,
+                      help='requests to replay for each service [%default]')
+    parser.add_option('--requests', action='append', default=[],
+                      metavar='SERVICE=FILE',
+                      help='replay the requests in FILE for SERVICE')
+    parser.add_option('--cold', action='store_true', default=False,
+                      help="empty the services' in-process caches before "
+                           "every request")
+    parser.add_option('--index', action='store_true', default=False,
+                      help='turn on SERVICES_UPDATE_INDEX')
+    parser.add_option('--random-seed', type='int', default=0,
+                      help='make the same requests as another run')
+    options, services = parser.parse_args()
+
+    if not options.database:
+        parser.error('Give the scratch database to use with --database.')
+    for service in services:
+        if service not in SERVICES:
+            parser.error('Unknown service %s, pick from %s.'
+                         % (service, ', '.join(SERVICES)))
+    files = dict(item.split('=', 1) for item in options.requests)
+
+    random.seed(options.random_seed)
+    settings.SERVICES_DATABASE = dict(settings.SERVICES_DATABASE,
+                                      NAME=options.database)
+    settings.SERVICES_UPDATE_INDEX = options.index
+
+    if options.seed:
+        db = settings.SERVICES_DATABASE
+        conn = utils.get_driver().connect(host=db['HOST'], user=db['USER'],
+                                          passwd=db['PASSWORD'])
+        cursor = conn.cursor()
+        # This fails if the database is there, so we never fill a real one.
+        cursor.execute('CREATE DATABASE %s CHARACTER SET utf8'
+                       % options.database)
+        cursor.execute('USE %s' % options.database)
+        start = time.time()
+        Fixture(cursor).seed(options.addons, options.themes)
+        conn.commit()
+        conn.close()
+        print 'Seeded %s in %.1fs' % (options.database, time.time() - start)
+
+    if not services:
+        return
+
+    conn = real_getconn()
+    fixture = Fixture(conn.cursor())
+    fixture.load()
+    conn.close()
+
+    utils.getconn = getconn
+    for service in services:
+        environs = get_requests(service, fixture, options.number,
+                                files.get(service))
+        replay(service, environs, options.cold)
+
+
+if __name__ == '__main__':
+    main()
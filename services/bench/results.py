@@ -0,0 +1,21 @@
+def percentile(values, percent):
+    """The `percent` percentile of the sorted list `values`."""
+    if not values:
+        return 0
+    index = int(round(percent / 100.0 * (len(values) - 1)))
+    return values[index]
+
+
+def report(name, timings, elapsed, extra=None):
+    """
+    Prints the latency percentiles in milliseconds of `timings`, in seconds,
+    and the requests per second over `elapsed` seconds.
+    """
+    timings = sorted(timings)
+    line = ['%s: %d requests, %.1f req/s' % (
+        name, len(timings), len(timings) / elapsed if elapsed else 0)]
+    for percent in (50, 95, 99):
+        line.append('p%d %.2fms' % (percent,
+                                     percentile(timings, percent) * 1000))
+    line.extend(extra or [])
+    print ', '.join(line)
@@ -0,0 +1,25 @@
+"""
+Gunicorn settings for serving a service with gevent workers, so that one
+process can hold many requests that are waiting on MySQL, memcached or the
+signing server at once. For example::
+
+    cd services
+    gunicorn -c gunicorn_async.py -b 127.0.0.1:9000 \
+        wsgi.versioncheck:application
+
+The workers talk to MySQL with pymysql, which gevent can make cooperative,
+instead of MySQLdb. Since every request in a worker shares its connection
+pool, give the service a bigger one in settings.SERVICES_DATABASE_POOLS.
+"""
+import multiprocessing
+import os
+
+
+os.environ.setdefault('SERVICES_DATABASE_DRIVER', 'pymysql')
+
+worker_class = 'gevent'
+workers = multiprocessing.cpu_count()
+# How many requests each worker holds at once.
+worker_connections = 2000
+timeout = 90
+max_requests = 50000
@@ -11,7 +11,7 @@ from django.core.management import setup_environ
 import commonware.log
 import jinja2
 
-from utils import log_configure
+from utils import log_configure, LRUCache
 
 import settings_local as settings
 setup_environ(settings)
@@ -64,265 +64,306 @@ java_re = re.compile(r'^application/x-java-((applet|bean)(;jpi-version=1\.5|;ver
 wmp_re = re.compile(r'^(application/(asx|x-(mplayer2|ms-wmp))|video/x-ms-(asf(-plugin)?|wm(p|v|x)?|wvx)|audio/x-ms-w(ax|ma))$')
 
 
+# Every plugin we know where to get, in the order they are checked. A rule
+# applies when the requested mimetype is one of `mimetypes` (or matches
+# `mimetype_re`) and `clientOS` matches `os`. The first of its `variants` whose
+# patterns all match the request is then applied on top of `plugin`.
+PLUGINS = [
+    {'mimetypes': ('application/x-shockwave-flash',
+                   'application/futuresplash'),
+     'os': flash_re,
+     # Tell the user where they can go to get the installer.
+     'plugin': dict(
+         name='Adobe Flash Player',
+         manualInstallationURL='http://www.adobe.com/go/getflashplayer'),
+     # Offer Windows users a specific flash plugin installer instead.
+     # Don't use a https URL for the license here, per request from
+     # Macromedia.
+     'variants': [
+         ({'clientOS': 'Win'}, dict(
+             guid='{4cfaef8a-a6c9-41a0-8e6f-967eb8f49143}',
+             XPILocation='',
+             iconUrl='http://fpdownload2.macromedia.com/pub/flashplayer/current/fp_win_installer.ico',
+             needsRestart='false',
+             InstallerShowsUI='true',
+             version='11.9.900.152',
+             InstallerHash='sha256:68ef5992a658e1304fcb4d556c770fb9f381928c5de1e133f3a741b51d9671cf',
+             InstallerLocation='http://download.macromedia.com/pub/flashplayer/pdc/fp_pl_pfs_installer.exe')),
+     ]},
+
+    {'mimetypes': ('application/x-director',),
+     'os': 'Win',
+     'plugin': dict(
+         name='Adobe Shockwave Player',
+         manualInstallationURL='http://get.adobe.com/shockwave/',
+         # Even though the shockwave installer is not a silent installer, we
+         # need to show its EULA here since we've got a slimmed down
+         # installer that doesn't do that itself.
+         licenseURL='http://www.adobe.com/go/eula_shockwaveplayer',
+         guid='{45f2a22c-4029-4209-8b3d-1421b989633f}',
+         XPILocation='',
+         version='12.0.5.146',
+         InstallerHash='sha256:eb6e5fb375c7e2f75c14d8678c595569bfc3da5fb5b1a7a0b293197867e42545',
+         InstallerLocation='http://fpdownload.macromedia.com/pub/shockwave/default/english/win95nt/latest/Shockwave_Installer_FF.exe',
+         needsRestart='false',
+         InstallerShowsUI='false'),
+     'variants': [
+         ({'chromeLocale': r'ja-JP\Z'}, dict(
+             licenseURL='http://www.adobe.com/go/eula_shockwaveplayer_jp')),
+     ]},
+
+    {'mimetypes': ('audio/x-pn-realaudio-plugin', 'audio/x-pn-realaudio'),
+     'os': r'^(Win|Linux|PPC Mac OS X)',
+     'plugin': dict(
+         name='Real Player',
+         version='10.5',
+         manualInstallationURL='http://www.real.com',
+         guid='{269eb771-59de-4702-9209-ca97ce522f6d}'),
+     'variants': [
+         ({'clientOS': 'Win'}, dict(
+             XPILocation='http://forms.real.com/real/player/download.html?type=firefox',
+             guid='{d586351c-cb55-41a7-8e7b-4aaac5172d39}')),
+     ]},
+
+    # Well, we don't have a plugin that can handle any of those mimetypes,
+    # but the Apple Quicktime plugin can. Point the user to the Quicktime
+    # download page.
+    {'mimetype_re': quicktime_re,
+     'os': r'^(Win|PPC Mac OS X)',
+     'plugin': dict(
+         name='Apple Quicktime',
+         guid='{a42bb825-7eee-420f-8ee7-834062b6fefd}',
+         InstallerShowsUI='true',
+         manualInstallationURL='http://www.apple.com/quicktime/download/')},
+
+    # We serve up the Java plugin for application/x-java-vm and the
+    # application/x-java-applet and application/x-java-bean mimetypes, with
+    # or without a version of 1.1 to 1.5.
+    #
+    # We don't want to link users directly to the Java plugin because we
+    # want to warn them about ongoing security problems first. Link to SUMO.
+    {'mimetype_re': java_re,
+     'os': r'^(Win|Linux|PPC Mac OS X)',
+     'plugin': dict(
+         name='Java Runtime Environment',
+         manualInstallationURL='https://support.mozilla.org/kb/use-java-plugin-to-view-interactive-content',
+         needsRestart='false',
+         guid='{fbe640ef-4375-4f45-8d79-767d60bf75b8}')},
+
+    {'mimetypes': ('application/pdf', 'application/vnd.fdf',
+                   'application/vnd.adobe.xfdf',
+                   'application/vnd.adobe.xdp+xml',
+                   'application/vnd.adobe.xfd+xml'),
+     'os': r'^(Win|PPC Mac OS X|Linux(?! x86_64))',
+     'plugin': dict(
+         name='Adobe Acrobat Plug-In',
+         guid='{d87cd824-67cb-4547-8587-616c70318095}',
+         manualInstallationURL='http://www.adobe.com/products/acrobat/readstep.html')},
+
+    {'mimetypes': ('application/x-mtx',),
+     'os': r'^(Win|PPC Mac OS X)',
+     'plugin': dict(
+         name='Viewpoint Media Player',
+         guid='{03f998b2-0e00-11d3-a498-00104b6eb52e}',
+         manualInstallationURL='http://www.viewpoint.com/pub/products/vmp.html')},
+
+    # We serve up the Windows Media Player plugin for application/asx,
+    # application/x-mplayer2, audio/x-ms-wax, audio/x-ms-wma and the
+    # video/x-ms-* mimetypes.
+    {'mimetype_re': wmp_re,
+     'plugin': {},
+     'variants': [
+         # For all windows users who don't have the WMP 11 plugin, give them
+         # a link for it.
+         ({'clientOS': 'Win'}, dict(
+             name='Windows Media Player',
+             version='11',
+             guid='{cff1240a-fd24-4b9f-8183-ccd96e5300d0}',
+             manualInstallationURL='http://port25.technet.com/pages/windows-media-player-firefox-plugin-download.aspx')),
+         # For OSX users -- added Intel to this since flip4mac is a UB.
+         # Contact at MS was okay w/ this, plus MS points to this anyway.
+         ({'clientOS': r'^(PPC|Intel) Mac OS X'}, dict(
+             name='Flip4Mac',
+             version='2.1',
+             guid='{cff0240a-fd24-4b9f-8183-ccd96e5300d0}',
+             manualInstallationURL='http://www.flip4mac.com/wmv_download.htm')),
+     ]},
+
+    {'mimetypes': ('application/x-xstandard',),
+     'os': r'^(Win|PPC Mac OS X)',
+     'plugin': dict(
+         name='XStandard XHTML WYSIWYG Editor',
+         guid='{3563d917-2f44-4e05-8769-47e655e92361}',
+         iconUrl='http://xstandard.com/images/xicon32x32.gif',
+         XPILocation='http://xstandard.com/download/xstandard.xpi',
+         InstallerShowsUI='false',
+         manualInstallationURL='http://xstandard.com/download/',
+         licenseURL='http://xstandard.com/license/')},
+
+    {'mimetypes': ('application/x-dnl',),
+     'os': 'Win',
+     'plugin': dict(
+         name='DNL Reader',
+         guid='{ce9317a3-e2f8-49b9-9b3b-a7fb5ec55161}',
+         version='5.5',
+         iconUrl='http://digitalwebbooks.com/reader/dwb16.gif',
+         XPILocation='http://digitalwebbooks.com/reader/xpinst.xpi',
+         InstallerShowsUI='false',
+         manualInstallationURL='http://digitalwebbooks.com/reader/')},
+
+    {'mimetypes': ('application/x-videoegg-loader',),
+     'os': 'Win',
+     'plugin': dict(
+         name='VideoEgg Publisher',
+         guid='{b8b881f0-2e07-11db-a98b-0800200c9a66}',
+         iconUrl='http://videoegg.com/favicon.ico',
+         XPILocation='http://update.videoegg.com/Install/Windows/Initial/VideoEggPublisher.xpi',
+         InstallerShowsUI='true',
+         manualInstallationURL='http://www.videoegg.com/')},
+
+    {'mimetypes': ('video/vnd.divx',),
+     'os': 'Win',
+     'plugin': dict(
+         name='DivX Web Player',
+         guid='{a8b771f0-2e07-11db-a98b-0800200c9a66}',
+         iconUrl='http://images.divx.com/divx/player/webplayer.png',
+         XPILocation='http://download.divx.com/player/DivXWebPlayer.xpi',
+         InstallerShowsUI='false',
+         licenseURL='http://go.divx.com/plugin/license/',
+         manualInstallationURL='http://go.divx.com/plugin/download/')},
+
+    {'mimetypes': ('video/vnd.divx',),
+     'os': r'^(PPC|Intel) Mac OS X',
+     'plugin': dict(
+         name='DivX Web Player',
+         guid='{a8b771f0-2e07-11db-a98b-0800200c9a66}',
+         iconUrl='http://images.divx.com/divx/player/webplayer.png',
+         XPILocation='http://download.divx.com/player/DivXWebPlayerMac.xpi',
+         InstallerShowsUI='false',
+         licenseURL='http://go.divx.com/plugin/license/',
+         manualInstallationURL='http://go.divx.com/plugin/download/')},
+]
+
+# Some defaults we override depending on what we find.
+DEFAULT_PLUGIN = dict(mimetype='-1', name='-1', guid='-1', version='',
+                      iconUrl='', XPILocation='', InstallerLocation='',
+                      InstallerHash='', InstallerShowsUI='',
+                      manualInstallationURL='', licenseURL='',
+                      needsRestart='true')
+
+REQUIRED = ['mimetype', 'appID', 'appVersion', 'clientOS', 'chromeLocale']
+
+output_template = Template(xml_template)
+
+
+def compile_pattern(pattern):
+    """Returns a `re.match` for `pattern`, which may be compiled already."""
+    if isinstance(pattern, basestring):
+        pattern = re.compile(pattern)
+    return pattern.match
+
+
+def compile_rules(plugins):
+    """
+    Turns the PLUGINS table into a dict of the rules to check for each exact
+    mimetype, and the list of rules that have to be checked with a regex.
+    """
+    rules = []
+    for plugin in plugins:
+        rules.append({
+            'mimetypes': plugin.get('mimetypes', ()),
+            'mimetype': compile_pattern(plugin.get('mimetype_re', r'(?!)')),
+            'os': compile_pattern(plugin.get('os', '')),
+            'plugin': plugin['plugin'],
+            'variants': [
+                ([(field, compile_pattern(pattern))
+                  for field, pattern in conditions.items()], update)
+                for conditions, update in plugin.get('variants', [])],
+        })
+
+    # A regex rule can match one of the exact mimetypes too, so check every
+    # rule for those, keeping to the order of the table.
+    by_mimetype = {}
+    for rule in rules:
+        for mimetype in rule['mimetypes']:
+            by_mimetype[mimetype] = [
+                r for r in rules
+                if mimetype in r['mimetypes'] or r['mimetype'](mimetype)]
+    by_regex = [r for r, p in zip(rules, plugins) if 'mimetype_re' in p]
+    return by_mimetype, by_regex
+
+
+rules_by_mimetype, rules_by_regex = compile_rules(PLUGINS)
+
+# Every clientOS pattern we check. Two clientOS strings that match the same
+# patterns get the same response, see `get_os_family`.
+os_patterns = [compile_pattern(pattern) for pattern in set(
+    [p['os'] for p in PLUGINS if 'os' in p] +
+    [c['clientOS'] for p in PLUGINS for c, u in p.get('variants', [])
+     if 'clientOS' in c])]
+
+# Rendered responses, keyed on `get_cache_key`.
+output_cache = LRUCache('pfs', settings.SERVICES_PFS_CACHE_SIZE)
+
+
+def get_os_family(client_os):
+    return tuple(bool(match(client_os)) for match in os_patterns)
+
+
+def get_rules(mimetype):
+    if mimetype in rules_by_mimetype:
+        return rules_by_mimetype[mimetype]
+    return [r for r in rules_by_regex if r['mimetype'](mimetype)]
+
+
+def find_plugin(g):
+    """Returns the plugin fields for the first rule that applies."""
+    plugin = {}
+    for rule in get_rules(g['mimetype']):
+        if not rule['os'](g['clientOS']):
+            continue
+        plugin.update(rule['plugin'])
+        for conditions, update in rule['variants']:
+            if all(match(g[field]) for field, match in conditions):
+                plugin.update(update)
+                break
+        break
+    return plugin
+
+
+def get_cache_key(data):
+    # Nothing else in the request changes the response.
+    return (data['mimetype'], get_os_family(data['clientOS']),
+            data['chromeLocale'])
+
+
 def get_output(data):
-    g = defaultdict(str, [(k, jinja2.escape(v)) for k, v in data.iteritems()])
+    for s in REQUIRED:
+        if s not in data:
+            # A sort of 404, matching what was returned in the original PHP.
+            return render(data)
 
-    required = ['mimetype', 'appID', 'appVersion', 'clientOS', 'chromeLocale']
+    key = get_cache_key(data)
+    output = output_cache.get(key)
+    if output is None:
+        output = render(data)
+        output_cache.set(key, output)
+    return output
 
-    # Some defaults we override depending on what we find below.
-    plugin = dict(mimetype='-1', name='-1', guid='-1', version='',
-                  iconUrl='', XPILocation='', InstallerLocation='',
-                  InstallerHash='', InstallerShowsUI='',
-                  manualInstallationURL='', licenseURL='',
-                  needsRestart='true')
 
+def render(data):
+    g = defaultdict(str, [(k, jinja2.escape(v)) for k, v in data.iteritems()])
+
+    plugin = dict(DEFAULT_PLUGIN)
     # Special case for mimetype if they are provided.
     plugin['mimetype'] = g['mimetype'] or '-1'
 
-    output = Template(xml_template)
+    if all(s in data for s in REQUIRED):
+        # Figure out what plugins we've got, and what plugins we know where
+        # to get.
+        plugin.update(find_plugin(g))
 
-    for s in required:
-        if s not in data:
-            # A sort of 404, matching what was returned in the original PHP.
-            return output.substitute(plugin)
-
-    # Figure out what plugins we've got, and what plugins we know where
-    # to get.
-
-    # Begin our huge and embarrassing if-else statement.
-    if (g['mimetype'] in ['application/x-shockwave-flash',
-                          'application/futuresplash'] and
-        re.match(flash_re, g['clientOS'])):
-
-        # Tell the user where they can go to get the installer.
-
-        plugin.update(
-            name='Adobe Flash Player',
-            manualInstallationURL='http://www.adobe.com/go/getflashplayer')
-
-        # Offer Windows users a specific flash plugin installer instead.
-        # Don't use a https URL for the license here, per request from
-        # Macromedia.
-
-        if g['clientOS'].startswith('Win'):
-            plugin.update(
-                guid='{4cfaef8a-a6c9-41a0-8e6f-967eb8f49143}',
-                XPILocation='',
-                iconUrl='http://fpdownload2.macromedia.com/pub/flashplayer/current/fp_win_installer.ico',
-                needsRestart='false',
-                InstallerShowsUI='true',
-                version='11.9.900.152',
-                InstallerHash='sha256:68ef5992a658e1304fcb4d556c770fb9f381928c5de1e133f3a741b51d9671cf',
-                InstallerLocation='http://download.macromedia.com/pub/flashplayer/pdc/fp_pl_pfs_installer.exe')
-
-    elif (g['mimetype'] == 'application/x-director' and
-          g['clientOS'].startswith('Win')):
-        plugin.update(
-            name='Adobe Shockwave Player',
-            manualInstallationURL='http://get.adobe.com/shockwave/')
-
-        # Even though the shockwave installer is not a silent installer, we
-        # need to show its EULA here since we've got a slimmed down
-        # installer that doesn't do that itself.
-        if g['chromeLocale'] != 'ja-JP':
-            plugin.update(
-                licenseURL='http://www.adobe.com/go/eula_shockwaveplayer')
-        else:
-            plugin.update(
-                licenseURL='http://www.adobe.com/go/eula_shockwaveplayer_jp')
-        plugin.update(
-            guid='{45f2a22c-4029-4209-8b3d-1421b989633f}',
-            XPILocation='',
-            version='12.0.5.146',
-            InstallerHash='sha256:eb6e5fb375c7e2f75c14d8678c595569bfc3da5fb5b1a7a0b293197867e42545',
-            InstallerLocation='http://fpdownload.macromedia.com/pub/shockwave/default/english/win95nt/latest/Shockwave_Installer_FF.exe',
-            needsRestart='false',
-            InstallerShowsUI='false')
-
-    elif (g['mimetype'] in ['audio/x-pn-realaudio-plugin',
-                            'audio/x-pn-realaudio'] and
-          re.match(r'^(Win|Linux|PPC Mac OS X)', g['clientOS'])):
-        plugin.update(
-            name='Real Player',
-            version='10.5',
-            manualInstallationURL='http://www.real.com')
-
-        if g['clientOS'].startswith('Win'):
-            plugin.update(
-                XPILocation='http://forms.real.com/real/player/download.html?type=firefox',
-                guid='{d586351c-cb55-41a7-8e7b-4aaac5172d39}')
-        else:
-            plugin.update(
-                guid='{269eb771-59de-4702-9209-ca97ce522f6d}')
-
-    elif (re.match(quicktime_re, g['mimetype']) and
-          re.match(r'^(Win|PPC Mac OS X)', g['clientOS'])):
-
-        # Well, we don't have a plugin that can handle any of those
-        # mimetypes, but the Apple Quicktime plugin can. Point the user to
-        # the Quicktime download page.
-
-        plugin.update(
-            name='Apple Quicktime',
-            guid='{a42bb825-7eee-420f-8ee7-834062b6fefd}',
-            InstallerShowsUI='true',
-            manualInstallationURL='http://www.apple.com/quicktime/download/')
-
-    elif (re.match(java_re, g['mimetype']) and
-          re.match(r'^(Win|Linux|PPC Mac OS X)', g['clientOS'])):
-
-        # We serve up the Java plugin for the following mimetypes:
-        #
-        # application/x-java-vm
-        # application/x-java-applet;jpi-version=1.5
-        # application/x-java-bean;jpi-version=1.5
-        # application/x-java-applet;version=1.3
-        # application/x-java-bean;version=1.3
-        # application/x-java-applet;version=1.2.2
-        # application/x-java-bean;version=1.2.2
-        # application/x-java-applet;version=1.2.1
-        # application/x-java-bean;version=1.2.1
-        # application/x-java-applet;version=1.4.2
-        # application/x-java-bean;version=1.4.2
-        # application/x-java-applet;version=1.5
-        # application/x-java-bean;version=1.5
-        # application/x-java-applet;version=1.3.1
-        # application/x-java-bean;version=1.3.1
-        # application/x-java-applet;version=1.4
-        # application/x-java-bean;version=1.4
-        # application/x-java-applet;version=1.4.1
-        # application/x-java-bean;version=1.4.1
-        # application/x-java-applet;version=1.2
-        # application/x-java-bean;version=1.2
-        # application/x-java-applet;version=1.1.3
-        # application/x-java-bean;version=1.1.3
-        # application/x-java-applet;version=1.1.2
-        # application/x-java-bean;version=1.1.2
-        # application/x-java-applet;version=1.1.1
-        # application/x-java-bean;version=1.1.1
-        # application/x-java-applet;version=1.1
-        # application/x-java-bean;version=1.1
-        # application/x-java-applet
-        # application/x-java-bean
-        #
-        #
-        # We don't want to link users directly to the Java plugin because
-        # we want to warn them about ongoing security problems first. Link
-        # to SUMO.
-
-        plugin.update(
-            name='Java Runtime Environment',
-            manualInstallationURL='https://support.mozilla.org/kb/use-java-plugin-to-view-interactive-content',
-            needsRestart='false',
-            guid='{fbe640ef-4375-4f45-8d79-767d60bf75b8}')
-
-    elif (g['mimetype'] in ['application/pdf', 'application/vnd.fdf',
-                            'application/vnd.adobe.xfdf',
-                            'application/vnd.adobe.xdp+xml',
-                            'application/vnd.adobe.xfd+xml'] and
-          re.match(r'^(Win|PPC Mac OS X|Linux(?! x86_64))', g['clientOS'])):
-        plugin.update(
-            name='Adobe Acrobat Plug-In',
-            guid='{d87cd824-67cb-4547-8587-616c70318095}',
-            manualInstallationURL='http://www.adobe.com/products/acrobat/readstep.html')
-
-    elif (g['mimetype'] == 'application/x-mtx' and
-          re.match(r'^(Win|PPC Mac OS X)', g['clientOS'])):
-        plugin.update(
-            name='Viewpoint Media Player',
-            guid='{03f998b2-0e00-11d3-a498-00104b6eb52e}',
-            manualInstallationURL='http://www.viewpoint.com/pub/products/vmp.html')
-
-    elif re.match(wmp_re, g['mimetype']):
-        # We serve up the Windows Media Player plugin for the following
-        # mimetypes:
-        #
-        # application/asx
-        # application/x-mplayer2
-        # audio/x-ms-wax
-        # audio/x-ms-wma
-        # video/x-ms-asf
-        # video/x-ms-asf-plugin
-        # video/x-ms-wm
-        # video/x-ms-wmp
-        # video/x-ms-wmv
-        # video/x-ms-wmx
-        # video/x-ms-wvx
-        #
-        # For all windows users who don't have the WMP 11 plugin, give them
-        # a link for it.
-        if g['clientOS'].startswith('Win'):
-            plugin.update(
-                name='Windows Media Player',
-                version='11',
-                guid='{cff1240a-fd24-4b9f-8183-ccd96e5300d0}',
-                manualInstallationURL='http://port25.technet.com/pages/windows-media-player-firefox-plugin-download.aspx')
-
-        # For OSX users -- added Intel to this since flip4mac is a UB.
-        # Contact at MS was okay w/ this, plus MS points to this anyway.
-        elif re.match(r'^(PPC|Intel) Mac OS X', g['clientOS']):
-            plugin.update(
-                name='Flip4Mac',
-                version='2.1',
-                guid='{cff0240a-fd24-4b9f-8183-ccd96e5300d0}',
-                manualInstallationURL='http://www.flip4mac.com/wmv_download.htm')
-
-    elif (g['mimetype'] == 'application/x-xstandard' and
-          re.match(r'^(Win|PPC Mac OS X)', g['clientOS'])):
-        plugin.update(
-            name='XStandard XHTML WYSIWYG Editor',
-            guid='{3563d917-2f44-4e05-8769-47e655e92361}',
-            iconUrl='http://xstandard.com/images/xicon32x32.gif',
-            XPILocation='http://xstandard.com/download/xstandard.xpi',
-            InstallerShowsUI='false',
-            manualInstallationURL='http://xstandard.com/download/',
-            licenseURL='http://xstandard.com/license/')
-
-    elif (g['mimetype'] == 'application/x-dnl' and
-          g['clientOS'].startswith('Win')):
-        plugin.update(
-            name='DNL Reader',
-            guid='{ce9317a3-e2f8-49b9-9b3b-a7fb5ec55161}',
-            version='5.5',
-            iconUrl='http://digitalwebbooks.com/reader/dwb16.gif',
-            XPILocation='http://digitalwebbooks.com/reader/xpinst.xpi',
-            InstallerShowsUI='false',
-            manualInstallationURL='http://digitalwebbooks.com/reader/')
-
-    elif (g['mimetype'] == 'application/x-videoegg-loader' and
-          g['clientOS'].startswith('Win')):
-        plugin.update(
-            name='VideoEgg Publisher',
-            guid='{b8b881f0-2e07-11db-a98b-0800200c9a66}',
-            iconUrl='http://videoegg.com/favicon.ico',
-            XPILocation='http://update.videoegg.com/Install/Windows/Initial/VideoEggPublisher.xpi',
-            InstallerShowsUI='true',
-            manualInstallationURL='http://www.videoegg.com/')
-
-    elif (g['mimetype'] == 'video/vnd.divx' and
-          g['clientOS'].startswith('Win')):
-        plugin.update(
-            name='DivX Web Player',
-            guid='{a8b771f0-2e07-11db-a98b-0800200c9a66}',
-            iconUrl='http://images.divx.com/divx/player/webplayer.png',
-            XPILocation='http://download.divx.com/player/DivXWebPlayer.xpi',
-            InstallerShowsUI='false',
-            licenseURL='http://go.divx.com/plugin/license/',
-            manualInstallationURL='http://go.divx.com/plugin/download/')
-
-    elif (g['mimetype'] == 'video/vnd.divx' and
-          re.match(r'^(PPC|Intel) Mac OS X', g['clientOS'])):
-        plugin.update(
-            name='DivX Web Player',
-            guid='{a8b771f0-2e07-11db-a98b-0800200c9a66}',
-            iconUrl='http://images.divx.com/divx/player/webplayer.png',
-            XPILocation='http://download.divx.com/player/DivXWebPlayerMac.xpi',
-            InstallerShowsUI='false',
-            licenseURL='http://go.divx.com/plugin/license/',
-            manualInstallationURL='http://go.divx.com/plugin/download/')
-
-    # End ridiculously huge and embarrassing if-else block.
-    return output.substitute(plugin)
+    return output_template.substitute(plugin)
 
 
 def format_date(secs):
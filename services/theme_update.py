@@ -1,15 +1,19 @@
 import base64
+import calendar
+import hashlib
 import json
 import os
 import posixpath
 import re
+from email.utils import parsedate
 from time import time
 from wsgiref.handlers import format_date_time
 
 from django.core.management import setup_environ
 
 from constants import base
-from utils import log_configure, log_exception, mypool
+from utils import (connect, log_configure, log_exception, LRUCache,
+                   Statement)
 
 from services.utils import settings
 setup_environ(settings)
@@ -20,6 +24,46 @@ log_configure()
 # This has to be imported after the settings (utils).
 from django_statsd.clients import statsd
 
+# Rendered JSON and its ETag, keyed on `ThemeUpdate.cache_key`.
+json_cache = LRUCache('theme_update', settings.SERVICES_THEME_CACHE_SIZE,
+                      settings.SERVICES_THEME_CACHE_TIMEOUT)
+# Base64 encoded icons, keyed on their path and mtime.
+icon_cache = LRUCache('theme_update.icon', settings.SERVICES_THEME_CACHE_SIZE,
+                      settings.SERVICES_THEME_CACHE_TIMEOUT)
+
+# The name and summary are fetched in both our locale and `en-US`, which we
+# fall back to if the name is empty for our locale.
+theme_sql = """
+    SELECT p.persona_id, a.id, a.slug, v.version,
+        t_name.localized_string AS name,
+        t_desc.localized_string AS description,
+        p.display_username, p.header,
+        p.footer, p.accentcolor, p.textcolor,
+        UNIX_TIMESTAMP(a.modified) AS modified,
+        t_name_default.localized_string AS default_name,
+        t_desc_default.localized_string AS default_description
+    FROM addons AS a
+    LEFT JOIN personas AS p ON p.addon_id=a.id
+    LEFT JOIN versions AS v ON a.current_version=v.id
+    LEFT JOIN translations AS t_name
+        ON t_name.id=a.name AND t_name.locale=%(locale)s
+    LEFT JOIN translations AS t_desc
+        ON t_desc.id=a.summary AND t_desc.locale=%(locale)s
+    LEFT JOIN translations AS t_name_default
+        ON t_name_default.id=a.name AND t_name_default.locale='en-US'
+    LEFT JOIN translations AS t_desc_default
+        ON t_desc_default.id=a.summary AND t_desc_default.locale='en-US'
+    WHERE p.{primary_key}=%(id)s AND
+        a.addontype_id=%(atype)s AND a.status=4 AND a.inactive=0
+    """
+
+# If we came from getpersonas.com, we look up by `persona_id`, otherwise by
+# `addon_id`.
+theme_statements = dict(
+    (key, Statement('theme_update_%s' % key,
+                    theme_sql.format(primary_key=key)))
+    for key in ('persona_id', 'addon_id'))
+
 
 class ThemeUpdate(object):
 
@@ -35,16 +79,26 @@ class ThemeUpdate(object):
             'atype': base.ADDON_PERSONA,
             'row': {}
         }
+        self.etag = None
+
+    def setup_db(self):
+        # If you are accessing this from unit tests, you can assign your own
+        # cursor before calling get_update.
         if not self.cursor:
-            self.conn = mypool.connect()
+            self.conn = connect('theme_update')
             self.cursor = self.conn.cursor()
 
     def base64_icon(self, addon_id):
         path = self.image_path('icon.jpg')
         try:
-            with open(path, 'r') as f:
-                return base64.b64encode(f.read())
-        except IOError, e:
+            key = (path, os.stat(path).st_mtime)
+            icon = icon_cache.get(key)
+            if icon is None:
+                with open(path, 'r') as f:
+                    icon = base64.b64encode(f.read())
+                icon_cache.set(key, icon)
+            return icon
+        except (IOError, OSError), e:
             if len(e.args) == 1:
                 log_exception('I/O error: {0}'.format(e[0]))
             else:
@@ -52,11 +106,32 @@ class ThemeUpdate(object):
             return ''
 
     def get_headers(self, length):
-        return [('Cache-Control', 'public, max-age=3600'),
-                ('Content-Length', str(length)),
-                ('Content-Type', 'application/json'),
-                ('Expires', format_date_time(time() + 3600)),
-                ('Last-Modified', format_date_time(time()))]
+        headers = [('Cache-Control', 'public, max-age=3600'),
+                   ('Content-Length', str(length)),
+                   ('Content-Type', 'application/json'),
+                   ('Expires', format_date_time(time() + 3600)),
+                   ('Last-Modified', format_date_time(self.get_modified()))]
+        if self.etag:
+            headers.append(('ETag', self.etag))
+        return headers
+
+    def get_modified(self):
+        modified = self.data['row'].get('modified')
+        return int(modified) if modified else time()
+
+    def is_not_modified(self, environ):
+        """
+        Whether the client already has this response, going by its
+        If-None-Match or If-Modified-Since headers.
+        """
+        if 'HTTP_IF_NONE_MATCH' in environ:
+            return (self.etag is not None and
+                    self.etag in environ['HTTP_IF_NONE_MATCH'].split(', '))
+
+        since = parsedate(environ.get('HTTP_IF_MODIFIED_SINCE', ''))
+        if since and self.data['row'].get('modified'):
+            return int(self.data['row']['modified']) <= calendar.timegm(since)
+        return False
 
     def get_update(self):
         """
@@ -74,55 +149,52 @@ class ThemeUpdate(object):
 
         """
 
-        sql = """
-        SELECT p.persona_id, a.id, a.slug, v.version,
-            t_name.localized_string AS name,
-            t_desc.localized_string AS description,
-            p.display_username, p.header,
-            p.footer, p.accentcolor, p.textcolor,
-            UNIX_TIMESTAMP(a.modified) AS modified
-        FROM addons AS a
-        LEFT JOIN personas AS p ON p.addon_id=a.id
-        LEFT JOIN versions AS v ON a.current_version=v.id
-        LEFT JOIN translations AS t_name
-            ON t_name.id=a.name AND t_name.locale=%(locale)s
-        LEFT JOIN translations AS t_desc
-            ON t_desc.id=a.summary AND t_desc.locale=%(locale)s
-        WHERE p.{primary_key}=%(id)s AND
-            a.addontype_id=%(atype)s AND a.status=4 AND a.inactive=0
-        """.format(primary_key=self.data['primary_key'])
-
-        self.cursor.execute(sql, self.data)
+        self.setup_db()
+        theme_statements[self.data['primary_key']].execute(self.cursor,
+                                                           self.data)
         row = self.cursor.fetchone()
 
-        row_to_dict = lambda row: dict(zip((
-            'persona_id', 'addon_id', 'slug', 'current_version', 'name',
-            'description', 'username', 'header', 'footer', 'accentcolor',
-            'textcolor', 'modified'),
-            list(row)))
-
         if row:
-            self.data['row'] = row_to_dict(row)
+            self.data['row'] = dict(zip((
+                'persona_id', 'addon_id', 'slug', 'current_version', 'name',
+                'description', 'username', 'header', 'footer', 'accentcolor',
+                'textcolor', 'modified', 'default_name',
+                'default_description'),
+                list(row)))
 
             # Fall back to `en-US` if the name was null for our locale.
-            # TODO: Write smarter SQL and don't rerun the whole query.
-            if not self.data['row']['name']:
+            row = self.data['row']
+            if not row['name']:
                 self.data['locale'] = 'en-US'
-                self.cursor.execute(sql, self.data)
-                row = self.cursor.fetchone()
-                if row:
-                    self.data['row'] = row_to_dict(row)
+                row['name'] = row['default_name']
+                row['description'] = row['default_description']
 
             return True
 
         return False
 
-    # TODO: Cache on row['modified']
+    def cache_key(self):
+        row = self.data['row']
+        return (self.data['primary_key'], self.data['id'],
+                self.data['locale'], self.from_gp, row['modified'],
+                row['current_version'])
+
     def get_json(self):
         if not self.get_update():
             # Persona not found.
             return
 
+        key = self.cache_key()
+        cached = json_cache.get(key)
+        if cached is None:
+            output = self.render_json()
+            cached = (output, '"%s"' % hashlib.md5(output).hexdigest())
+            json_cache.set(key, cached)
+
+        output, self.etag = cached
+        return output
+
+    def render_json(self):
         row = self.data['row']
         accent = row.get('accentcolor')
         text = row.get('textcolor')
@@ -220,6 +292,12 @@ def application(environ, start_response):
             if not output:
                 start_response('404 Not Found', [])
                 return ['']
+            if update.is_not_modified(environ):
+                statsd.incr('services.theme_update.not_modified')
+                headers = [h for h in update.get_headers(0)
+                           if h[0] not in ('Content-Length', 'Content-Type')]
+                start_response('304 Not Modified', headers)
+                return ['']
             start_response(status, update.get_headers(len(output)))
         except:
             log_exception(data)
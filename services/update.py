@@ -1,5 +1,7 @@
+import hashlib
 import smtplib
 import sys
+import threading
 import traceback
 
 from email.Utils import formatdate
@@ -14,10 +16,9 @@ import settings_local as settings
 setup_environ(settings)
 # This has to be imported after the settings so statsd knows where to log to.
 from django_statsd.clients import statsd
+from django.core.cache import cache
 
 import commonware.log
-import MySQLdb as mysql
-import sqlalchemy.pool as pool
 
 try:
     from compare import version_int
@@ -25,8 +26,9 @@ except ImportError:
     from apps.versions.compare import version_int
 
 from constants import applications, base
-from utils import (APP_GUIDS, get_mirror, log_configure, PLATFORMS,
-                   STATUSES_PUBLIC)
+from update_index import ROW_FIELDS, UpdateIndex
+from utils import (APP_GUIDS, connect, get_mirror, log_configure, LRUCache,
+                   PLATFORMS, Statement, STATUSES_PUBLIC)
 
 # Go configure the log.
 log_configure()
@@ -76,17 +78,49 @@ no_updates_rdf = """<?xml version="1.0"?>
 </RDF:RDF>"""
 
 
+batch_rdf = """<?xml version="1.0"?>
+<RDF:RDF xmlns:RDF="http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+         xmlns:em="http://www.mozilla.org/2004/em-rdf#">
+%(items)s</RDF:RDF>"""
+
+# The most add-ons we answer for in one batch request.
+BATCH_LIMIT = 100
+
+
 timing_log = commonware.log.getLogger('z.timer')
 error_log = commonware.log.getLogger('z.services')
 
 
-def getconn():
-    db = settings.SERVICES_DATABASE
-    return mysql.connect(host=db['HOST'], user=db['USER'],
-                         passwd=db['PASSWORD'], db=db['NAME'])
+addon_statement = Statement('update_addon', """
+    SELECT id, status, addontype_id, guid FROM addons
+    WHERE guid = %(guid)s AND
+          inactive = 0 AND
+          status != %(STATUS_DELETED)s
+    LIMIT 1;""")
+
+beta_statement = Statement('update_beta', """
+    SELECT versions.id, status
+    FROM files INNER JOIN versions
+    ON files.version_id = versions.id
+    WHERE versions.addon_id = %(id)s
+          AND versions.version = %(version)s LIMIT 1;""")
 
+# The statements `Update.get_update` has built, keyed on the shape of the
+# request, see `Update.get_update_key`.
+update_statements = {}
 
-mypool = pool.QueuePool(getconn, max_overflow=10, pool_size=5, recycle=300)
+# The in-process index used when settings.SERVICES_UPDATE_INDEX is on. It is
+# never changed once in use: it is rebuilt or refreshed into a new one that
+# replaces it, so that other requests never see one half loaded.
+update_index = UpdateIndex()
+# Held by the request rebuilding or refreshing the index, while the others
+# carry on with the one there is.
+update_index_lock = threading.Lock()
+
+# Rendered responses, keyed on `get_cache_key`. This is flushed whenever
+# zamboni bumps the UPDATE_RDF_NAMESPACE generation.
+rdf_cache = LRUCache('update', settings.SERVICES_RDF_CACHE_SIZE,
+                     settings.SERVICES_RDF_CACHE_TIMEOUT)
 
 
 class Update(object):
@@ -99,14 +133,74 @@ class Update(object):
         self.is_beta_version = False
         self.version_int = 0
         self.compat_mode = compat_mode
-
-    def is_valid(self):
+        # Whether the add-on was found in the update index, in which case we
+        # can look for the update there too.
+        self.indexed = False
+        # The add-ons already looked up by a BatchUpdate, keyed on the
+        # lowercased guid.
+        self.addons = None
+        # The update index this request uses, see `use_index`.
+        self.index = None
+
+    def setup_db(self):
         # If you accessing this from unit tests, then before calling
         # is valid, you can assign your own cursor.
         if not self.cursor:
-            self.conn = mypool.connect()
+            self.conn = connect('update')
             self.cursor = self.conn.cursor()
 
+    def use_index(self):
+        if not settings.SERVICES_UPDATE_INDEX:
+            return False
+
+        if self.index is None:
+            if self.is_index_stale() and update_index_lock.acquire(False):
+                try:
+                    self.renew_index()
+                finally:
+                    update_index_lock.release()
+            self.index = update_index
+        # Until the first build is done, SQL answers.
+        return self.index.ready
+
+    def is_index_stale(self):
+        return update_index.is_stale(settings.SERVICES_UPDATE_INDEX_REFRESH,
+                                     settings.SERVICES_UPDATE_INDEX_REBUILD)
+
+    def renew_index(self):
+        global update_index
+        # Another request may have just done it.
+        stale = self.is_index_stale()
+        if not stale:
+            return
+        self.setup_db()
+        if stale == 'rebuild':
+            index = UpdateIndex()
+        else:
+            index = update_index.copy()
+        with statsd.timer('services.update.index.%s' % stale):
+            getattr(index, stale)(self.cursor)
+        update_index = index
+
+    def get_addon(self):
+        if self.use_index():
+            result = self.index.get_addon(self.data['id'])
+            if result is not None:
+                self.indexed = True
+                statsd.incr('services.update.index.hit')
+                return result
+            statsd.incr('services.update.index.miss')
+
+        if self.addons is not None:
+            return self.addons.get(self.data['id'].lower())
+
+        self.setup_db()
+        addon_statement.execute(self.cursor,
+                                {'guid': self.data['id'],
+                                 'STATUS_DELETED': base.STATUS_DELETED})
+        return self.cursor.fetchone()
+
+    def is_valid(self):
         data = self.data
         # Version can be blank.
         data['version'] = data.get('version', '')
@@ -118,14 +212,7 @@ class Update(object):
         if not data['app_id']:
             return False
 
-        sql = """SELECT id, status, addontype_id, guid FROM addons
-                 WHERE guid = %(guid)s AND
-                       inactive = 0 AND
-                       status != %(STATUS_DELETED)s
-                 LIMIT 1;"""
-        self.cursor.execute(sql, {'guid': self.data['id'],
-                                  'STATUS_DELETED': base.STATUS_DELETED})
-        result = self.cursor.fetchone()
+        result = self.get_addon()
         if result is None:
             return False
 
@@ -151,13 +238,8 @@ class Update(object):
             # Beta channel looks at the addon name to see if it's beta.
             if self.is_beta_version:
                 # For beta look at the status of the existing files.
-                sql = """
-                    SELECT versions.id, status
-                    FROM files INNER JOIN versions
-                    ON files.version_id = versions.id
-                    WHERE versions.addon_id = %(id)s
-                          AND versions.version = %(version)s LIMIT 1;"""
-                self.cursor.execute(sql, data)
+                self.setup_db()
+                beta_statement.execute(self.cursor, data)
                 result = self.cursor.fetchone()
                 # Only change the status if there are files.
                 if result is not None:
@@ -182,6 +264,45 @@ class Update(object):
         self.get_beta()
         data = self.data
 
+        if self.compat_mode == 'normal':
+            d2c_max = applications.D2C_MAX_VERSIONS.get(data['app_id'])
+            if d2c_max:
+                data['d2c_max_version'] = version_int(d2c_max)
+
+        if self.indexed and not self.flags['use_version']:
+            # Looking up a specific version is rare enough to leave to SQL.
+            if self.flags['multiple_status']:
+                statuses = STATUSES_PUBLIC.values()
+            else:
+                statuses = [data['status']]
+            row = self.index.get_update(data, statuses, self.compat_mode)
+            return self.set_row(row)
+
+        key = self.get_update_key()
+        if key not in update_statements:
+            # Named after the SQL, so that requests filling this in at the
+            # same time can't prepare different SQL under one name.
+            sql = self.get_update_sql()
+            update_statements[key] = Statement(
+                'update_%s' % hashlib.md5(sql).hexdigest()[:12], sql)
+
+        self.setup_db()
+        update_statements[key].execute(self.cursor, data)
+        result = self.cursor.fetchone()
+
+        if result:
+            return self.set_row(dict(zip(ROW_FIELDS, list(result))))
+
+        return False
+
+    def get_update_key(self):
+        """Everything that changes the SQL `get_update_sql` builds."""
+        return (bool(self.data.get('appOS')), self.flags['use_version'],
+                self.flags['multiple_status'], self.compat_mode,
+                bool(self.data.get('d2c_max_version')))
+
+    def get_update_sql(self):
+        data = self.data
         sql = ["""
             SELECT
                 addons.guid as guid, addons.addontype_id as type,
@@ -239,9 +360,7 @@ class Update(object):
             """)
             # Filter out versions that don't have the minimum maxVersion
             # requirement to qualify for default-to-compatible.
-            d2c_max = applications.D2C_MAX_VERSIONS.get(data['app_id'])
-            if d2c_max:
-                data['d2c_max_version'] = version_int(d2c_max)
+            if data.get('d2c_max_version'):
                 sql.append("AND appmax.version_int >= %(d2c_max_version)s ")
 
             # Filter out versions found in compat overrides
@@ -260,24 +379,17 @@ class Update(object):
             sql.append('AND appmax.version_int >= %(version_int)s ')
 
         sql.append('ORDER BY versions.id DESC LIMIT 1;')
+        return ''.join(sql)
 
-        self.cursor.execute(''.join(sql), data)
-        result = self.cursor.fetchone()
-
-        if result:
-            row = dict(zip([
-                'guid', 'type', 'disabled_by_user', 'appguid', 'min', 'max',
-                'file_id', 'file_status', 'hash', 'filename', 'version_id',
-                'datestatuschanged', 'strict_compat', 'releasenotes',
-                'version', 'premium_type'],
-                list(result)))
-            row['type'] = base.ADDON_SLUGS_UPDATE[row['type']]
-            row['url'] = get_mirror(self.data['addon_status'],
-                                    self.data['id'], row)
-            data['row'] = row
-            return True
+    def set_row(self, row):
+        if not row:
+            return False
 
-        return False
+        row['type'] = base.ADDON_SLUGS_UPDATE[row['type']]
+        row['url'] = get_mirror(self.data['addon_status'],
+                                self.data['id'], row)
+        self.data['row'] = row
+        return True
 
     def get_bad_rdf(self):
         return bad_rdf
@@ -290,7 +402,8 @@ class Update(object):
                 rdf = self.get_no_updates_rdf()
         else:
             rdf = self.get_bad_rdf()
-        self.cursor.close()
+        if self.cursor:
+            self.cursor.close()
         if self.conn:
             self.conn.close()
         return rdf
@@ -316,14 +429,132 @@ class Update(object):
         return good_rdf % data
 
     def format_date(self, secs):
-        return '%s GMT' % formatdate(time() + secs)[:25]
+        return format_date(secs)
 
     def get_headers(self, length):
-        return [('Content-Type', 'text/xml'),
-                ('Cache-Control', 'public, max-age=3600'),
-                ('Last-Modified', self.format_date(0)),
-                ('Expires', self.format_date(3600)),
-                ('Content-Length', str(length))]
+        return get_headers(length)
+
+
+class BatchUpdate(object):
+    """
+    Answers the update check for several add-ons that share the same
+    `appID`, `appVersion` and `appOS` in one response.
+
+    `items` is a list of (guid, version) pairs. Responses already in the
+    `rdf_cache` are reused. The add-ons for the rest are found in the update
+    index, or else all looked up in one query, and the files of those are
+    then loaded into an `UpdateIndex` of their own with three more queries,
+    so that `Update.get_update` picks their updates in Python. Only the
+    add-ons that look for a beta or a specific version, like in
+    `Update.get_beta`, still make a query each.
+    """
+
+    def __init__(self, data, items, compat_mode='strict'):
+        self.conn, self.cursor = None, None
+        self.data = data
+        self.items = items[:BATCH_LIMIT]
+        self.compat_mode = compat_mode
+
+    def setup_db(self):
+        if not self.cursor:
+            self.conn = connect('update')
+            self.cursor = self.conn.cursor()
+
+    def get_addons(self, guids):
+        """
+        Returns the rows `Update.is_valid` would select for each of `guids`,
+        keyed on the lowercased guid since MySQL compares them that way.
+        """
+        if not guids:
+            return {}
+
+        self.setup_db()
+        sql = """SELECT id, status, addontype_id, guid FROM addons
+                 WHERE guid IN %(guids)s AND
+                       inactive = 0 AND
+                       status != %(STATUS_DELETED)s;"""
+        self.cursor.execute(sql, {'guids': tuple(set(guids)),
+                                  'STATUS_DELETED': base.STATUS_DELETED})
+        return dict((row[3].lower(), row) for row in self.cursor.fetchall())
+
+    def get_items(self):
+        """Returns the RDF for each item, in order."""
+        rdfs, missing = [], []
+        for guid, version in self.items:
+            data = dict(self.data, id=guid, version=version)
+            key = get_cache_key(data, self.compat_mode)
+            rdfs.append(rdf_cache.get(key))
+            if rdfs[-1] is None:
+                missing.append((len(rdfs) - 1, key, data))
+
+        # Every item uses the same update index, and only the add-ons it
+        # doesn't have are looked up, in one query.
+        index, indexed = None, False
+        if missing:
+            update = Update(missing[0][2], self.compat_mode)
+            update.conn, update.cursor = self.conn, self.cursor
+            indexed = update.use_index()
+            index = update.index
+            self.conn, self.cursor = update.conn, update.cursor
+        addons = self.get_addons(
+            [data['id'] for i, k, data in missing
+             if not indexed or index.get_addon(data['id']) is None])
+        batch_index = UpdateIndex()
+        if addons:
+            batch_index.load(self.cursor, [row[0] for row in addons.values()])
+
+        for i, key, data in missing:
+            update = Update(data, self.compat_mode)
+            update.conn, update.cursor = self.conn, self.cursor
+            update.addons = addons
+            update.index = index
+            if update.is_valid():
+                if not update.indexed:
+                    # Found by `get_addons`, so its files were loaded too.
+                    update.index, update.indexed = batch_index, True
+                if update.get_update():
+                    output = update.get_good_rdf()
+                else:
+                    output = update.get_no_updates_rdf()
+            else:
+                output = update.get_bad_rdf()
+            # Share the connection with the next item.
+            self.conn, self.cursor = update.conn, update.cursor
+            rdfs[i] = output
+            rdf_cache.set(key, output)
+
+        return rdfs
+
+    def get_rdf(self):
+        try:
+            items = [get_rdf_body(rdf) for rdf in self.get_items()]
+        finally:
+            if self.cursor:
+                self.cursor.close()
+            if self.conn:
+                self.conn.close()
+        return batch_rdf % {'items': ''.join(items)}
+
+    def get_headers(self, length):
+        return get_headers(length)
+
+
+def get_rdf_body(rdf):
+    """Strips the XML declaration and the RDF:RDF element from `rdf`."""
+    start = rdf.index('>', rdf.index('<RDF:RDF')) + 1
+    return rdf[start:rdf.rindex('</RDF:RDF>')].strip('\n') + '\n'
+
+
+def format_date(secs):
+    return '%s GMT' % formatdate(time() + secs)[:25]
+
+
+def get_headers(length):
+    return [('Content-Type', 'text/xml'),
+            ('Cache-Control', 'public, max-age=3600'),
+            ('Last-Modified', format_date(0)),
+            ('Expires', format_date(3600)),
+            ('Content-Length', str(length))]
 
 
 def mail_exception(data):
@@ -347,17 +578,69 @@ def log_exception(data):
     error_log.error(u'Type: %s, %s. Query: %s' % (typ, value, data))
 
 
+def get_cache_key(data, compat_mode):
+    """
+    Returns the parts of the query that the response depends on, with
+    `appOS` normalized the same way `Update.is_valid` does it.
+    """
+    app_os = None
+    for k, v in PLATFORMS.items():
+        if k in data.get('appOS', ''):
+            app_os = v
+            break
+    return ('reqVersion' in data, data.get('id'), data.get('version', ''),
+            data.get('appID'), data.get('appVersion'), app_os, compat_mode)
+
+
 def application(environ, start_response):
     status = '200 OK'
     with statsd.timer('services.update'):
         data = dict(parse_qsl(environ['QUERY_STRING']))
         compat_mode = data.pop('compatMode', 'strict')
         try:
-            update = Update(data, compat_mode)
+            rdf_cache.set_generation(
+                cache.get('ns:%s' % base.UPDATE_RDF_NAMESPACE))
+            key = get_cache_key(data, compat_mode)
+            output = rdf_cache.get(key)
+            if output is None:
+                output = Update(data, compat_mode).get_rdf()
+                rdf_cache.set(key, output)
+            # The dates in the headers are always from now.
+            start_response(status, get_headers(len(output)))
+        except:
+            #mail_exception(data)
+            log_exception(data)
+            raise
+    return [output]
+
+
+def batch_application(environ, start_response):
+    """
+    Takes the same query as `application`, but with an `id` and a `version`
+    for each add-on, matched up by their order.
+    """
+    status = '200 OK'
+    with statsd.timer('services.update.batch'):
+        query = parse_qsl(environ['QUERY_STRING'], keep_blank_values=True)
+        data = dict((k, v) for k, v in query if k not in ('id', 'version'))
+        compat_mode = data.pop('compatMode', 'strict')
+        ids = [v for k, v in query if k == 'id']
+        versions = [v for k, v in query if k == 'version']
+        if len(ids) != len(versions):
+            # They can't be matched up, so don't guess.
+            output = 'There must be a version for every id.'
+            start_response('400 Bad Request',
+                           [('Content-Type', 'text/plain'),
+                            ('Content-Length', str(len(output)))])
+            return [output]
+        items = zip(ids, versions)
+        try:
+            rdf_cache.set_generation(
+                cache.get('ns:%s' % base.UPDATE_RDF_NAMESPACE))
+            update = BatchUpdate(data, items, compat_mode)
             output = update.get_rdf()
             start_response(status, update.get_headers(len(output)))
         except:
-            #mail_exception(data)
             log_exception(data)
             raise
     return [output]
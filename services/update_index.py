@@ -0,0 +1,301 @@
+from bisect import bisect_right
+from time import time
+
+from constants import base
+from constants.platforms import PLATFORM_ALL
+
+
+# The columns we keep for every (version, application, file) combination.
+# The first part matches the row that `Update.get_update` builds from SQL, the
+# rest is what we need to filter on.
+ROW_FIELDS = (
+    'guid', 'type', 'disabled_by_user', 'appguid', 'min', 'max', 'file_id',
+    'file_status', 'hash', 'filename', 'version_id', 'datestatuschanged',
+    'strict_compat', 'releasenotes', 'version', 'premium_type')
+
+FILES_SQL = """
+    SELECT
+        addons.guid, addons.addontype_id, addons.inactive,
+        applications.guid, appmin.version, appmax.version, files.id,
+        files.status, files.hash, files.filename, versions.id,
+        files.datestatuschanged, files.strict_compatibility,
+        versions.releasenotes, versions.version, addons.premium_type,
+        addons.id, applications.id, files.platform_id,
+        files.binary_components, appmin.version_int, appmax.version_int
+    FROM versions
+    INNER JOIN addons
+        ON addons.id = versions.addon_id
+    INNER JOIN applications_versions
+        ON applications_versions.version_id = versions.id
+    INNER JOIN applications
+        ON applications_versions.application_id = applications.id
+    INNER JOIN appversions appmin
+        ON appmin.id = applications_versions.min
+    INNER JOIN appversions appmax
+        ON appmax.id = applications_versions.max
+    INNER JOIN files
+        ON files.version_id = versions.id
+    WHERE addons.inactive = 0 AND addons.status != %(STATUS_DELETED)s
+    """
+
+ADDONS_SQL = """
+    SELECT id, status, addontype_id, guid FROM addons
+    WHERE inactive = 0 AND status != %(STATUS_DELETED)s
+    """
+
+OVERRIDES_SQL = """
+    SELECT incompatible_versions.version_id, incompatible_versions.app_id,
+        incompatible_versions.min_app_version,
+        incompatible_versions.max_app_version,
+        incompatible_versions.min_app_version_int,
+        incompatible_versions.max_app_version_int
+    FROM incompatible_versions
+    INNER JOIN versions ON versions.id = incompatible_versions.version_id
+    """
+
+# Datetimes only have seconds, so what was modified in the second of the last
+# run is reloaded as well, which is harmless, rather than missed.
+# applications_versions has no modified date, so saving or deleting one, and
+# clearing the incompatible_versions of a version, bump versions.modified.
+CHANGED_SQL = """
+    SELECT id FROM addons WHERE modified >= %(since)s
+    UNION
+    SELECT addon_id FROM versions WHERE modified >= %(since)s
+    UNION
+    SELECT versions.addon_id FROM files
+    INNER JOIN versions ON versions.id = files.version_id
+    WHERE files.modified >= %(since)s
+        OR files.datestatuschanged >= %(since)s
+    UNION
+    SELECT versions.addon_id FROM incompatible_versions
+    INNER JOIN versions ON versions.id = incompatible_versions.version_id
+    WHERE incompatible_versions.modified >= %(since)s
+    """
+
+
+class Bucket(object):
+    """
+    All the files of one add-on for one application, platform and file
+    status, sorted by the `version_int` of their minimum app version so that
+    the candidates for an app version can be found with a binary search.
+    """
+
+    def __init__(self):
+        self.mins = []
+        self.entries = []
+
+    def add(self, entry):
+        pos = bisect_right(self.mins, entry['min_int'])
+        self.mins.insert(pos, entry['min_int'])
+        self.entries.insert(pos, entry)
+
+    def candidates(self, version_int):
+        """Entries with `appmin.version_int <= version_int`."""
+        return self.entries[:bisect_right(self.mins, version_int)]
+
+
+class UpdateIndex(object):
+    """
+    An in-process copy of the rows that `Update.is_valid` and
+    `Update.get_update` would otherwise look up in the database on every
+    update ping.
+
+    It is built once with `rebuild` and then patched by `refresh`, which
+    reloads every add-on that had its addon, versions, files, compat ranges
+    (applications_versions) or incompatible_versions rows saved or deleted
+    through the models since the last run. The next full rebuild is the
+    first to see:
+
+    * versions and files deleted outright,
+    * applications_versions and incompatible_versions rows changed with
+      queryset updates or SQL rather than the models,
+    * changes to the appversions the compat ranges point to.
+
+    Both change it in place, so one that is in use is only ever refreshed as
+    a `copy`, or replaced by a new one that was rebuilt.
+    """
+
+    def __init__(self):
+        # guid -> (id, status, addontype_id, guid) as is_valid selects it.
+        self.addons = {}
+        # (addon id, app id, platform id, file status) -> Bucket.
+        self.buckets = {}
+        # addon id -> set of bucket keys, so an add-on can be dropped.
+        self.addon_keys = {}
+        # addon id -> guid.
+        self.guids = {}
+        # version id -> list of incompatible_versions rows.
+        self.overrides = {}
+        self.since = None
+        self.refreshed = 0
+        self.rebuilt = 0
+
+    @property
+    def ready(self):
+        return self.since is not None
+
+    def is_stale(self, refresh, rebuild):
+        now = time()
+        if not self.ready or now - self.rebuilt > rebuild:
+            return 'rebuild'
+        if now - self.refreshed > refresh:
+            return 'refresh'
+
+    def copy(self):
+        """
+        Returns a copy to refresh instead of this one. It shares the buckets
+        and overrides, which `refresh` replaces rather than changes.
+        """
+        index = UpdateIndex()
+        index.__dict__.update(self.__dict__)
+        for name in ('addons', 'buckets', 'addon_keys', 'guids', 'overrides'):
+            setattr(index, name, dict(getattr(self, name)))
+        return index
+
+    def rebuild(self, cursor):
+        self.__init__()
+        since = self._now(cursor)
+        self._load(cursor)
+        self.since = since
+        self.refreshed = self.rebuilt = time()
+
+    def refresh(self, cursor):
+        since = self._now(cursor)
+        cursor.execute(CHANGED_SQL, {'since': self.since})
+        ids = [r[0] for r in cursor.fetchall()]
+        if ids:
+            for id_ in ids:
+                self._drop(id_)
+            self._load(cursor, ids)
+        self.since = since
+        self.refreshed = time()
+        return len(ids)
+
+    def load(self, cursor, ids):
+        """
+        Loads the add-ons with `ids` into an index that is never rebuilt or
+        refreshed, to answer the update checks of a `BatchUpdate`.
+        """
+        if ids:
+            self._load(cursor, ids)
+
+    def _now(self, cursor):
+        # Use the database clock so that we don't miss any changes because
+        # of clock skew between us and the database.
+        cursor.execute('SELECT NOW();')
+        return cursor.fetchone()[0]
+
+    def _drop(self, addon_id):
+        for key in self.addon_keys.pop(addon_id, ()):
+            for entry in self.buckets.pop(key).entries:
+                self.overrides.pop(entry['row']['version_id'], None)
+        guid = self.guids.pop(addon_id, None)
+        if guid is not None:
+            self.addons.pop(guid, None)
+
+    def _load(self, cursor, ids=None):
+        params = {'STATUS_DELETED': base.STATUS_DELETED}
+
+        def only(clause, column):
+            if not ids:
+                return ''
+            # These are ids from the database, not from the request.
+            return ' %s %s IN (%s)' % (clause, column,
+                                       ','.join(str(int(i)) for i in ids))
+
+        cursor.execute(ADDONS_SQL + only('AND', 'id'), params)
+        for row in cursor.fetchall():
+            if row[3] is None:
+                continue
+            self.addons[row[3]] = row
+            self.guids[row[0]] = row[3]
+
+        cursor.execute(FILES_SQL + only('AND', 'addons.id'), params)
+        for row in cursor.fetchall():
+            (addon_id, app_id, platform_id, binary,
+             min_int, max_int) = row[len(ROW_FIELDS):]
+            if min_int is None:
+                # This could never satisfy `appmin.version_int <= x`.
+                continue
+            entry = {'row': dict(zip(ROW_FIELDS, row[:len(ROW_FIELDS)])),
+                     'min_int': min_int, 'max_int': max_int,
+                     'binary_components': binary}
+            key = (addon_id, app_id, platform_id, entry['row']['file_status'])
+            if key not in self.buckets:
+                self.buckets[key] = Bucket()
+                self.addon_keys.setdefault(addon_id, set()).add(key)
+            self.buckets[key].add(entry)
+
+        cursor.execute(OVERRIDES_SQL + only('WHERE', 'versions.addon_id'))
+        overrides = {}
+        for row in cursor.fetchall():
+            overrides.setdefault(row[0], []).append(row[1:])
+        self.overrides.update(overrides)
+
+    def get_addon(self, guid):
+        return self.addons.get(guid)
+
+    def is_incompatible(self, version_id, app_id, version_int):
+        """
+        Mirrors the `incompatible_versions` subquery in `Update.get_update`,
+        including the way its last two OR clauses are not limited to the
+        app.
+        """
+        for (app, min_app, max_app,
+             min_int, max_int) in self.overrides.get(version_id, ()):
+            above_min = min_int is not None and min_int <= version_int
+            below_max = max_int is not None and max_int >= version_int
+            if ((app == app_id and min_app == '0' and below_max) or
+                (above_min and max_app == '*') or
+                (above_min and below_max)):
+                return True
+        return False
+
+    def is_compatible(self, entry, data, compat_mode):
+        version_int = data['version_int']
+        max_int = entry['max_int']
+        reaches_max = max_int is not None and max_int >= version_int
+
+        if compat_mode == 'ignore':
+            return True
+
+        elif compat_mode == 'normal':
+            row = entry['row']
+            if ((row['strict_compat'] or entry['binary_components'])
+                and not reaches_max):
+                return False
+            d2c_max = data.get('d2c_max_version')
+            if d2c_max and (max_int is None or max_int < d2c_max):
+                return False
+            return not self.is_incompatible(row['version_id'],
+                                            data['app_id'], version_int)
+
+        return reaches_max
+
+    def get_update(self, data, statuses, compat_mode):
+        """
+        Returns a copy of the row for the newest matching file, or None.
+
+        `statuses` are the file statuses to consider, the same as the
+        `files.status` clause the SQL would be built with.
+        """
+        platforms = [PLATFORM_ALL.id]
+        if data.get('appOS'):
+            platforms.append(data['appOS'])
+
+        best = None
+        for platform in platforms:
+            for status in statuses:
+                bucket = self.buckets.get((data['id'], data['app_id'],
+                                           platform, status))
+                if not bucket:
+                    continue
+                for entry in bucket.candidates(data['version_int']):
+                    version_id = entry['row']['version_id']
+                    if best and best['row']['version_id'] >= version_id:
+                        continue
+                    if self.is_compatible(entry, data, compat_mode):
+                        best = entry
+
+        if best:
+            return best['row'].copy()
@@ -1,3 +1,4 @@
+from collections import OrderedDict
 from datetime import datetime, timedelta
 import dictconfig
 import logging
@@ -15,9 +16,11 @@ if settingmodule.startswith(('zamboni',  # typical git clone destination
 import posixpath
 import re
 import sys
+import time
 
 from cef import log_cef as _log_cef
 import MySQLdb as mysql
+from sqlalchemy import event, exc
 import sqlalchemy.pool as pool
 
 from django.core.management import setup_environ
@@ -29,6 +32,8 @@ settings = importlib.import_module(settingmodule)
 # Pyflakes will complain about these, but they are required for setup.
 setup_environ(settings)
 from lib.log_settings_base import formatters, handlers, loggers
+# This has to be imported after the settings so statsd knows where to log to.
+from django_statsd.clients import statsd
 
 # Ugh. But this avoids any zamboni or django imports at all.
 # Perhaps we can import these without any problems and we can
@@ -91,13 +96,190 @@ def get_mirror(status, id, row):
     return posixpath.join(host, str(id), row['filename'])
 
 
+def get_driver():
+    """
+    Returns the DB-API module named by settings.SERVICES_DATABASE_DRIVER,
+    which the SERVICES_DATABASE_DRIVER environment variable overrides.
+    """
+    name = os.environ.get('SERVICES_DATABASE_DRIVER',
+                          settings.SERVICES_DATABASE_DRIVER)
+    if name == 'pymysql':
+        # Pure python, so gevent can make its sockets cooperative.
+        import pymysql
+        return pymysql
+    return mysql
+
+
 def getconn():
     db = settings.SERVICES_DATABASE
-    return mysql.connect(host=db['HOST'], user=db['USER'],
-                         passwd=db['PASSWORD'], db=db['NAME'])
+    return get_driver().connect(host=db['HOST'], user=db['USER'],
+                                passwd=db['PASSWORD'], db=db['NAME'])
+
+
+# A connection pool for each service, see `get_pool`.
+pools = {}
+
+
+def get_pool(name):
+    """
+    Returns the connection pool for the service `name`, set up from
+    settings.SERVICES_DATABASE_POOL and any overrides for the service in
+    settings.SERVICES_DATABASE_POOLS.
+    """
+    if name not in pools:
+        options = dict(settings.SERVICES_DATABASE_POOL)
+        options.update(settings.SERVICES_DATABASE_POOLS.get(name, {}))
+        pools[name] = pool.QueuePool(getconn, **options)
+        # Count the connections we make, so that churn shows up.
+        event.listen(pools[name], 'connect',
+                     lambda *args: statsd.incr('services.%s.pool.connect'
+                                               % name))
+    return pools[name]
+
+
+def connect(name):
+    """
+    Checks a connection out of the pool for the service `name`, and sends
+    how long that took and how many connections are checked out to statsd.
+    """
+    service_pool = get_pool(name)
+    start = time.time()
+    try:
+        conn = service_pool.connect()
+    except exc.TimeoutError:
+        statsd.incr('services.%s.pool.timeout' % name)
+        raise
+    statsd.timing('services.%s.pool.wait' % name,
+                  (time.time() - start) * 1000)
+    statsd.incr('services.%s.pool.checkout' % name)
+    statsd.gauge('services.%s.pool.checkedout' % name,
+                 service_pool.checkedout())
+    return conn
+
+
+# The `%(name)s` placeholders in a query.
+param_re = re.compile(r'%\((\w+)\)s')
+
+# MySQL's error when a connection doesn't know the statement, for example
+# after it was reconnected.
+UNKNOWN_STMT_HANDLER = 1243
+
+
+class Statement(object):
+    """
+    One of the fixed queries of a service. Once
+    settings.SERVICES_DATABASE_PREPARE is on, it is prepared on the server
+    the first time a connection runs it, and after that only the parameters
+    are sent so that MySQL doesn't parse the query again.
+
+    MySQLdb only speaks the text protocol, so this uses PREPARE and EXECUTE
+    with user variables. The query must only use `%(name)s` placeholders,
+    each for a single value rather than a list.
+    """
+
+    def __init__(self, name, sql):
+        self.name = 'services_%s' % name
+        self.sql = sql
+        self.params = param_re.findall(sql)
+        self.prepared_sql = param_re.sub('?', sql).replace('%%', '%')
+
+    def execute(self, cursor, params):
+        if not settings.SERVICES_DATABASE_PREPARE:
+            return cursor.execute(self.sql, params)
+
+        try:
+            return self.execute_prepared(cursor, params)
+        except get_driver().DatabaseError, err:
+            if err.args[0] != UNKNOWN_STMT_HANDLER:
+                raise
+            get_prepared(cursor).discard(self.name)
+            return self.execute_prepared(cursor, params)
+
+    def execute_prepared(self, cursor, params):
+        prepared = get_prepared(cursor)
+        if self.name not in prepared:
+            cursor.execute('PREPARE %s FROM %%s' % self.name,
+                           [self.prepared_sql])
+            prepared.add(self.name)
+            statsd.incr('services.db.prepare')
+
+        if not self.params:
+            return cursor.execute('EXECUTE %s' % self.name)
+
+        names = sorted(set(self.params))
+        cursor.execute('SET %s' % ', '.join('@services_%s = %%s' % n
+                                            for n in names),
+                       [params[n] for n in names])
+        return cursor.execute('EXECUTE %s USING %s' % (
+            self.name, ', '.join('@services_%s' % n for n in self.params)))
+
+
+def get_prepared(cursor):
+    """The names of the statements prepared on the cursor's connection."""
+    conn = cursor.connection
+    if not hasattr(conn, 'services_prepared'):
+        conn.services_prepared = set()
+    return conn.services_prepared
+
+
+class LRUCache(object):
+    """
+    A bounded, in-process cache that evicts the least recently used entry
+    when it is full. Entries older than `timeout` seconds are treated as
+    missing. Hits, misses and evictions are counted in statsd as
+    `services.<name>.cache.<event>` so the size can be tuned.
+
+    Call `set_generation` before `get` to flush everything whenever an
+    external generation counter moves on.
+    """
+
+    def __init__(self, name, size, timeout=None):
+        self.name = name
+        self.size = size
+        self.timeout = timeout
+        self.generation = None
+        self.data = OrderedDict()
+
+    def incr(self, event):
+        statsd.incr('services.%s.cache.%s' % (self.name, event))
+
+    def set_generation(self, generation):
+        if generation != self.generation:
+            if self.data:
+                self.incr('flush')
+            self.data.clear()
+            self.generation = generation
+
+    def get(self, key, default=None):
+        try:
+            created, value = self.data.pop(key)
+        except KeyError:
+            self.incr('miss')
+            return default
+
+        if self.timeout and time.time() - created > self.timeout:
+            self.incr('expired')
+            return default
+
+        # Put it back as the most recently used.
+        self.data[key] = (created, value)
+        self.incr('hit')
+        return value
+
+    def set(self, key, value):
+        if self.size <= 0:
+            return
+        self.data.pop(key, None)
+        while len(self.data) >= self.size:
+            self.data.popitem(last=False)
+            self.incr('eviction')
+        self.data[key] = (time.time(), value)
 
+    def clear(self):
+        self.data.clear()
 
-mypool = pool.QueuePool(getconn, max_overflow=10, pool_size=5, recycle=300)
+    def __len__(self):
+        return len(self.data)
 
 
 def log_configure():
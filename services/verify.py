@@ -1,20 +1,24 @@
 import calendar
+import hashlib
 import json
 
 from datetime import datetime
+from multiprocessing.pool import ThreadPool
 from time import gmtime, time
 from urlparse import parse_qsl, urlparse
 from wsgiref.handlers import format_date_time
 
 from django.core.management import setup_environ
 
-from utils import (log_configure, log_exception, log_info, mypool,
-                   ADDON_PREMIUM, CONTRIB_CHARGEBACK, CONTRIB_NO_CHARGE,
-                   CONTRIB_PURCHASE, CONTRIB_REFUND)
+from utils import (connect, log_configure, log_exception, log_info,
+                   Statement, ADDON_PREMIUM, CONTRIB_CHARGEBACK,
+                   CONTRIB_NO_CHARGE, CONTRIB_PURCHASE, CONTRIB_REFUND)
 
 from services.utils import settings
 setup_environ(settings)
 
+from django.core.cache import cache
+
 # Go configure the log.
 log_configure()
 
@@ -26,14 +30,26 @@ from lib.cef_loggers import receipt_cef
 # This has to be imported after the settings (utils).
 import receipts  # used for patching in the tests
 from receipts import certs
+from constants.payments import RECEIPT_VERIFY_NAMESPACE
 from django_statsd.clients import statsd
 
 status_codes = {
     200: '200 OK',
+    400: '400 Bad Request',
     405: '405 Method Not Allowed',
     500: '500 Internal Server Error',
 }
 
+install_statement = Statement('verify_install', """
+    SELECT id, user_id, premium_type FROM users_install
+    WHERE addon_id = %(addon_id)s
+    AND uuid = %(uuid)s LIMIT 1;""")
+
+purchase_statement = Statement('verify_purchase', """
+    SELECT id, type FROM addon_purchase
+    WHERE addon_id = %(addon_id)s
+    AND user_id = %(user_id)s LIMIT 1;""")
+
 
 class VerificationError(Exception):
     pass
@@ -61,12 +77,17 @@ class Verify:
         self.addon_id = None
         self.user_id = None
         self.premium = None
+        self.purchase_type = None
+        # The users_install and addon_purchase rows looked up in bulk by
+        # BulkVerify, keyed on (addon_id, uuid) and (addon_id, user_id).
+        self.installs = None
+        self.purchases = None
         # This is so the unit tests can override the connection.
         self.conn, self.cursor = None, None
 
     def setup_db(self):
         if not self.cursor:
-            self.conn = mypool.connect()
+            self.conn = connect('verify')
             self.cursor = self.conn.cursor()
 
     def check_full(self):
@@ -76,15 +97,20 @@ class Verify:
         """
         receipt_domain = urlparse(settings.WEBAPPS_RECEIPT_URL).netloc
         try:
-            self.decoded = self.decode()
+            if not self.decoded:
+                self.decoded = self.decode()
             self.check_type('purchase-receipt')
-            self.check_db()
+            cached = self.get_cached()
+            if not cached:
+                self.check_db()
             self.check_url(receipt_domain)
         except InvalidReceipt, err:
             return self.invalid(str(err))
 
         if self.premium != ADDON_PREMIUM:
             log_info('Valid receipt, not premium')
+            if not cached:
+                self.set_cached()
             return self.ok_or_expired()
 
         try:
@@ -92,8 +118,12 @@ class Verify:
         except InvalidReceipt, err:
             return self.invalid(str(err))
         except RefundedReceipt:
+            if not cached:
+                self.set_cached()
             return self.refund()
 
+        if not cached:
+            self.set_cached()
         return self.ok_or_expired()
 
     def check_without_purchase(self):
@@ -127,6 +157,51 @@ class Verify:
 
         return getattr(self, status)()
 
+    def cache_key(self, addon_id):
+        """
+        The cache key for the outcome of the database checks of this receipt.
+
+        It is keyed on the receipt signature and namespaced by the app, so
+        that zamboni can drop every entry for an app when one of its purchases
+        is refunded or charged back.
+        """
+        ns = cache.get('ns:%s' % (RECEIPT_VERIFY_NAMESPACE % addon_id))
+        signature = hashlib.sha256(self.receipt.rsplit('.', 1)[-1])
+        return 'receipt-verify:%s:%s:%s' % (ns, addon_id,
+                                             signature.hexdigest())
+
+    def get_cached(self):
+        """
+        Sets what `check_db` and `check_purchase` would look up from the
+        cache, if it's there.
+        """
+        if not settings.WEBAPPS_RECEIPT_VERIFY_CACHE_TIMEOUT:
+            return False
+
+        addon_id = get_addon_id(self.decoded)
+        if not addon_id:
+            # Let `check_db` raise the error.
+            return False
+
+        result = cache.get(self.cache_key(addon_id))
+        if result is None:
+            statsd.incr('services.verify.cache.miss')
+            return False
+
+        statsd.incr('services.verify.cache.hit')
+        (self.addon_id, self.user_id, self.premium,
+         self.purchase_type) = result
+        return True
+
+    def set_cached(self):
+        if not settings.WEBAPPS_RECEIPT_VERIFY_CACHE_TIMEOUT:
+            return
+
+        cache.set(self.cache_key(self.addon_id),
+                  (self.addon_id, self.user_id, self.premium,
+                   self.purchase_type),
+                  settings.WEBAPPS_RECEIPT_VERIFY_CACHE_TIMEOUT)
+
     def decode(self):
         """
         Verifies that the receipt can be decoded and that the initial
@@ -187,7 +262,6 @@ class Verify:
         if not self.decoded:
             raise ValueError('decode not run')
 
-        self.setup_db()
         # Get the addon and user information from the installed table.
         try:
             uuid = self.decoded['user']['value']
@@ -197,20 +271,20 @@ class Verify:
             log_info('No user in receipt')
             raise InvalidReceipt('NO_USER')
 
-        try:
-            storedata = self.decoded['product']['storedata']
-            self.addon_id = int(dict(parse_qsl(storedata)).get('id', ''))
-        except:
+        self.addon_id = get_addon_id(self.decoded)
+        if not self.addon_id:
             # There was some value for storedata but it was invalid.
             log_info('Invalid store data')
             raise InvalidReceipt('WRONG_STOREDATA')
 
-        sql = """SELECT id, user_id, premium_type FROM users_install
-                 WHERE addon_id = %(addon_id)s
-                 AND uuid = %(uuid)s LIMIT 1;"""
-        self.cursor.execute(sql, {'addon_id': self.addon_id,
-                                  'uuid': uuid})
-        result = self.cursor.fetchone()
+        if self.installs is not None:
+            result = self.installs.get((self.addon_id, uuid))
+        else:
+            self.setup_db()
+            install_statement.execute(self.cursor,
+                                      {'addon_id': self.addon_id,
+                                       'uuid': uuid})
+            result = self.cursor.fetchone()
         if not result:
             # We've got no record of this receipt being created.
             log_info('No entry in users_install for uuid: %s' % uuid)
@@ -222,21 +296,25 @@ class Verify:
         """
         Verifies that the app has been purchased.
         """
-        sql = """SELECT id, type FROM addon_purchase
-                 WHERE addon_id = %(addon_id)s
-                 AND user_id = %(user_id)s LIMIT 1;"""
-        self.cursor.execute(sql, {'addon_id': self.addon_id,
-                                  'user_id': self.user_id})
-        result = self.cursor.fetchone()
-        if not result:
-            log_info('Invalid receipt, no purchase')
-            raise InvalidReceipt('NO_PURCHASE')
+        if self.purchase_type is None:
+            if self.purchases is not None:
+                result = self.purchases.get((self.addon_id, self.user_id))
+            else:
+                self.setup_db()
+                purchase_statement.execute(self.cursor,
+                                           {'addon_id': self.addon_id,
+                                            'user_id': self.user_id})
+                result = self.cursor.fetchone()
+            if not result:
+                log_info('Invalid receipt, no purchase')
+                raise InvalidReceipt('NO_PURCHASE')
+            self.purchase_type = result[-1]
 
-        if result[-1] in (CONTRIB_REFUND, CONTRIB_CHARGEBACK):
+        if self.purchase_type in (CONTRIB_REFUND, CONTRIB_CHARGEBACK):
             log_info('Valid receipt, but refunded')
             raise RefundedReceipt
 
-        elif result[-1] in (CONTRIB_PURCHASE, CONTRIB_NO_CHARGE):
+        elif self.purchase_type in (CONTRIB_PURCHASE, CONTRIB_NO_CHARGE):
             log_info('Valid receipt')
             return
 
@@ -289,6 +367,126 @@ class Verify:
         return json.dumps({'status': 'expired'})
 
 
+class BulkVerify(object):
+    """
+    Runs `Verify.check_full` over a list of receipts.
+
+    The receipts are decoded in a thread pool, then every users_install row
+    is looked up in one query and every addon_purchase row in another, before
+    each receipt goes through the usual checks.
+    """
+
+    def __init__(self, receipts, environ):
+        # The receipts aren't verified at the URL of this request, so check
+        # them against the path they would normally be verified at.
+        environ = dict(environ,
+                       PATH_INFO=urlparse(settings.WEBAPPS_RECEIPT_URL).path)
+        self.verifies = [Verify(receipt, environ) for receipt in receipts]
+        self.conn, self.cursor = None, None
+
+    def setup_db(self):
+        if not self.cursor:
+            self.conn = connect('verify')
+            self.cursor = self.conn.cursor()
+
+    def decode(self):
+        """
+        Decodes every receipt, returning the error for the ones that can't be.
+        """
+        def decode(verify):
+            try:
+                verify.decoded = verify.decode()
+            except InvalidReceipt, err:
+                return err
+
+        return get_decode_pool().map(decode, self.verifies)
+
+    def get_installs(self, keys):
+        """Returns the users_install rows for the (addon_id, uuid) `keys`."""
+        if not keys:
+            return {}
+
+        self.setup_db()
+        sql = """SELECT id, user_id, premium_type, addon_id, uuid
+                 FROM users_install
+                 WHERE (addon_id, uuid) IN (%s);"""
+        self.cursor.execute(sql % ', '.join(['(%s, %s)'] * len(keys)),
+                            [value for key in keys for value in key])
+        installs = {}
+        for row in self.cursor.fetchall():
+            installs.setdefault(tuple(row[3:]), row[:3])
+        return installs
+
+    def get_purchases(self, keys):
+        """
+        Returns the addon_purchase rows for the (addon_id, user_id) `keys`.
+        """
+        if not keys:
+            return {}
+
+        self.setup_db()
+        sql = """SELECT id, type, addon_id, user_id FROM addon_purchase
+                 WHERE (addon_id, user_id) IN (%s);"""
+        self.cursor.execute(sql % ', '.join(['(%s, %s)'] * len(keys)),
+                            [value for key in keys for value in key])
+        purchases = {}
+        for row in self.cursor.fetchall():
+            purchases.setdefault(tuple(row[2:]), row[:2])
+        return purchases
+
+    def check(self):
+        """Returns the JSON results, in the same order as the receipts."""
+        errors = self.decode()
+
+        keys = set()
+        for verify in self.verifies:
+            addon_id = get_addon_id(verify.decoded or {})
+            try:
+                keys.add((addon_id, verify.decoded['user']['value']))
+            except (KeyError, TypeError):
+                continue
+        installs = self.get_installs(sorted(k for k in keys if k[0]))
+
+        purchases = self.get_purchases(sorted(
+            set((addon_id, row[1]) for (addon_id, uuid), row
+                in installs.items() if row[2] == ADDON_PREMIUM)))
+
+        results = []
+        for verify, error in zip(self.verifies, errors):
+            if error:
+                results.append(verify.invalid(str(error)))
+                continue
+            verify.conn, verify.cursor = self.conn, self.cursor
+            verify.installs, verify.purchases = installs, purchases
+            results.append(verify.check_full())
+        return '[%s]' % ', '.join(results)
+
+    def close(self):
+        if self.cursor:
+            self.cursor.close()
+        if self.conn:
+            self.conn.close()
+
+
+_decode_pool = None
+
+
+def get_decode_pool():
+    global _decode_pool
+    if _decode_pool is None:
+        _decode_pool = ThreadPool(settings.WEBAPPS_RECEIPT_VERIFY_BULK_WORKERS)
+    return _decode_pool
+
+
+def get_addon_id(decoded):
+    """Returns the app id from the receipt's store data, or None."""
+    try:
+        storedata = decoded['product']['storedata']
+        return int(dict(parse_qsl(storedata)).get('id', ''))
+    except:
+        return None
+
+
 def get_headers(length):
     return [('Access-Control-Allow-Origin', '*'),
             ('Access-Control-Allow-Methods', 'POST'),
@@ -330,7 +528,7 @@ def status_check(environ):
         return 500, 'SIGNING_SERVER_ACTIVE is not set'
 
     try:
-        conn = mypool.connect()
+        conn = connect('verify')
         cursor = conn.cursor()
         cursor.execute('SELECT id FROM users_install ORDER BY id DESC LIMIT 1')
     except Exception, err:
@@ -352,6 +550,28 @@ def receipt_check(environ):
     return output
 
 
+def bulk_receipt_check(environ):
+    with statsd.timer('services.verify.bulk'):
+        data = environ['wsgi.input'].read()
+        try:
+            receipts = json.loads(data)
+            assert isinstance(receipts, list)
+            assert len(receipts) <= settings.WEBAPPS_RECEIPT_VERIFY_BULK_LIMIT
+            assert all(isinstance(r, basestring) for r in receipts)
+        except (ValueError, AssertionError):
+            return 400, ''
+
+        try:
+            verify = BulkVerify(receipts, environ)
+            try:
+                return 200, verify.check()
+            finally:
+                verify.close()
+        except:
+            log_exception('<bulk>')
+            return 500, ''
+
+
 def application(environ, start_response):
     body = ''
     path = environ.get('PATH_INFO', '')
@@ -365,3 +585,17 @@ def application(environ, start_response):
             status, body = receipt_check(environ)
     start_response(status_codes[status], get_headers(len(body)))
     return [body]
+
+
+def bulk_application(environ, start_response):
+    """
+    Verifies a JSON list of receipts POSTed in one request, returning a JSON
+    list with the same result for each that `application` would.
+    """
+    body = ''
+    if environ.get('REQUEST_METHOD') != 'POST':
+        status = 405
+    else:
+        status, body = bulk_receipt_check(environ)
+    start_response(status_codes[status], get_headers(len(body)))
+    return [body]
@@ -42,6 +42,7 @@ COLLECTIONS_ICON_PATH = _polite_tmpdir()
 PACKAGER_PATH = _polite_tmpdir()
 REVIEWER_ATTACHMENTS_PATH = _polite_tmpdir()
 DUMPED_APPS_PATH = _polite_tmpdir()
+RECS_NEIGHBORS_PATH = _polite_tmpdir() + '/recs-neighbors'
 
 # We won't actually send an email.
 SEND_REAL_EMAIL = True
@@ -79,6 +80,9 @@ CACHES = {
 # is just too annoying for tests, so disable it.
 CACHE_COUNT_TIMEOUT = None
 
+# Same for the search results, which are indexed and searched in one test.
+SEARCH_RESULTS_CACHE_TIMEOUT = 0
+
 # No more failures!
 APP_PREVIEW = False
 